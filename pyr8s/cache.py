@@ -0,0 +1,133 @@
+#-----------------------------------------------------------------------------
+# Pyr8s - Divergence Time Estimation
+# Copyright (C) 2021  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#-----------------------------------------------------------------------------
+
+
+"""
+Content addressed on-disk cache of analysis results.
+
+Results are stored under the digest of everything that defines them,
+see RateAnalysis.digest(). Writes are atomic, so a cache directory
+may be shared by concurrent batch workers.
+
+Example:
+cache = ResultCache('~/.cache/pyr8s', max_bytes=2**30)
+results = analysis.run(cache=cache)
+"""
+
+import os
+import pickle
+import tempfile
+
+
+class ResultCache:
+    """
+    Keep pickled results in a directory, one file per key.
+    When the total size exceeds max_bytes, least recently
+    used entries are evicted. Set max_bytes to None for no limit.
+    """
+
+    suffix = '.pickle'
+
+    def __init__(self, path, max_bytes=None):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+    def get(self, key):
+        """Return stored results for key, or None if missing"""
+        file = self._file(key)
+        try:
+            with open(file, 'rb') as input:
+                results = pickle.load(input)
+            # Mark as recently used
+            os.utime(file)
+        except OSError:
+            # Missing or evicted meanwhile
+            self.misses += 1
+            return None
+        except (EOFError, pickle.UnpicklingError,
+                AttributeError, ImportError, TypeError, ValueError):
+            # Truncated, or pickled under an older class layout
+            self.misses += 1
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+            return None
+        self.hits += 1
+        return results
+
+    def put(self, key, results):
+        """Store results for key atomically, then evict if needed"""
+        descriptor, temporary = tempfile.mkstemp(
+            dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as output:
+                pickle.dump(results, output, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._file(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict()
+
+    def entries(self):
+        """Return (mtime, size, file) for each entry, oldest first"""
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(self.suffix):
+                continue
+            file = os.path.join(self.path, name)
+            try:
+                stat = os.stat(file)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file))
+        return sorted(entries)
+
+    def size(self):
+        """Total size of all entries in bytes"""
+        return sum(size for mtime, size, file in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until within max_bytes"""
+        if self.max_bytes is None:
+            return
+        entries = self.entries()
+        total = sum(size for mtime, size, file in entries)
+        for mtime, size, file in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file)
+            except OSError:
+                # Another process got there first
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove all entries"""
+        for mtime, size, file in self.entries():
+            try:
+                os.remove(file)
+            except OSError:
+                pass
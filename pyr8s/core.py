@@ -46,6 +46,17 @@ RateAnalysis.quick(tree).print()
 
 import dendropy
 import random
+import os
+import contextlib
+import functools
+import collections
+import hashlib
+import json
+import sys
+import itertools
+import copy
+import concurrent.futures
+import csv
 import numpy as np
 from scipy import optimize
 from math import log
@@ -53,6 +64,7 @@ from math import log
 from . import extensions
 from . import param
 from . import params
+from . import treefile
 
 
 ##############################################################################
@@ -71,17 +83,121 @@ def print_tree(tree):
     """Quick method to print the tree"""
     tree.print_plot(show_internal_node_labels=True)
 
+def map_replicates(function, tasks, workers=None):
+    """
+    Apply function to all tasks, keeping their order.
+    Tasks are spread over a process pool, unless workers is 1.
+    """
+    tasks = list(tasks)
+    if workers == 1 or len(tasks) < 2:
+        return list(map(function, tasks))
+    count = workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (4 * count))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, tasks, chunksize=chunksize))
+
+def imap_replicates(function, tasks, workers=None, window=None):
+    """
+    Lazily apply function to tasks, yielding results in order
+    as soon as they are ready. At most `window` tasks are pending
+    at any time, so tasks may be a generator of any length.
+    Tasks are spread over a process pool, unless workers is 1.
+    """
+    if workers == 1:
+        yield from map(function, tasks)
+        return
+    count = workers or os.cpu_count() or 1
+    window = window or 2 * count
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(executor.submit(function, task))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 
 
 ##############################################################################
 ### Data Representation and Manipulation
 
+class ArrayCache:
+    """
+    Least recently used cache of prepared array structures,
+    keyed by a digest of topology and constraints.
+    Set maxsize to zero to disable.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        """Return cached structures or None, counting hits and misses"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """Keep entry, evicting the least recently used if full"""
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Forget all entries and statistics"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def memory(self):
+        """Approximate size of all entries in bytes"""
+        def size(value):
+            if isinstance(value, np.ndarray):
+                return value.nbytes
+            if isinstance(value, list):
+                return sys.getsizeof(value) + sum(size(x) for x in value)
+            return sys.getsizeof(value)
+        return sum(size(value) for entry in self._entries.values()
+            for value in entry.values())
+
+    def info(self):
+        """Return cache statistics as a dictionary"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'memory': self.memory(),
+            }
+
+
 class Array:
     """
     Contains all arrays and utilities required by the optimization methods.
     Is used by the RateAnalysis class and views the same parameters.
+    Structures depending only on topology and constraints are shared
+    through the class cache, see ArrayCache.
     """
 
+    cache = ArrayCache()
+
     def __init__(self, param):
         self._param = param
         self._tree = None
@@ -98,37 +214,15 @@ class Array:
             return not node.is_terminal_zero()
 
         # Keep a copy of given tree to return later
-        self._tree = tree.clone(depth=1)
+        self._tree = extensions.copy_tree(tree)
         _tree = self._tree
 
-        scalar = self._param.general.scalar
-        format = self._param.branch_length.format
-        nsites = self._param.branch_length.nsites
         doround = self._param.branch_length.round
-
-        if format == 'persite':
-            self._multiplier = nsites
-        elif format == 'guess':
-            # Sets nsites such that the 4 most significant digits
-            # of the maximum branch are kept
-            maximum = 0
-            for node in _tree.postorder_node_iter():
-                if node.edge_length is not None and node.edge_length > maximum:
-                    maximum = node.edge_length
-            if maximum == 0:
-                raise ValueError('All branches have zero length!')
-            while maximum < 1000:
-                maximum *= 10
-            print('Guessing number of sites: {}'.format(int(maximum)))
-            self._multiplier = int(maximum)
-        elif format == 'total':
-            self._multiplier = 1
-        else:
-            raise ValueError('Unrecognised branch length format: {}'.
-                format(format))
+        self._set_multiplier(node.edge_length
+            for node in _tree.postorder_node_iter())
 
         # Ignore all constraints if scalar, fix root age to 1.0
-        if scalar:
+        if self._param.general.scalar:
             for node in _tree.preorder_node_iter():
                 node.max = None
                 node.min = None
@@ -138,55 +232,337 @@ class Array:
                     node.fix = None
             _tree.seed_node.fix = 100.0
 
+        # Remember preorder position of each node in the given tree
+        positions = {node: k for k, node in enumerate(_tree.preorder_node_iter())}
+
         # Calculate substitutions and trim afterwards
         _tree.calc_subs(self._multiplier, doround)
+        nodes = list(positions)
+        self._plan(
+            [-1] + [positions[node.parent_node] for node in nodes[1:]],
+            [node.subs for node in nodes],
+            [node.is_leaf() for node in nodes])
         _tree.collapse()
+        self._kept = [positions[node] for node in _tree.preorder_node_iter()]
         # _tree.print_plot()
         _tree.label_freeze()
         _tree.index(ftz)
-        _tree.order(ftz)
         # _tree.print_plot()
         if len(_tree.nodes(ftz)) < 2:
             raise ValueError('Cannot continue since tree is just a root, ' +
                 'please check branch length parameters.')
 
         self.node = []
-        self.order = []
-        self.fix = []
+        self.position = []
+        self.label = []
+        self.user_fix = []
+        self.user_min = []
+        self.user_max = []
         for node in _tree.preorder_node_iter(ftz):
             self.node.append(node)
-            self.order.append(node.order)
-            self.fix.append(node.fix)
+            self.position.append(positions[node])
+            self.label.append(node.label)
+            self.user_fix.append(node.fix)
+            self.user_min.append(node.min)
+            self.user_max.append(node.max)
         self.n = len(self.node)
 
-        # Calculate high and low boundary for each node (top down).
-        high = apply_fun_to_list(min,
-            [_tree.seed_node.max, _tree.seed_node.fix])
-        self.high = [high]
+        # Results table lists all nodes, terminal zeros have no index
+        # Parent row and plain labels are kept for writing Newick
+        rows = {}
+        self.row_label = []
+        self.row_index = []
+        self.row_parent = []
+        self.row_name = []
+        self.row_taxon = []
+        for node in _tree.preorder_node_iter():
+            rows[node] = len(rows)
+            self.row_label.append(node.label)
+            self.row_index.append(-1 if node.is_terminal_zero() else node.index)
+            self.row_parent.append(rows.get(node.parent_node, -1))
+            self.row_name.append(node.plain_label)
+            self.row_taxon.append(_taxon_label(node))
+        self.row_index = np.array(self.row_index, dtype=int)
+        self.row_parent = np.array(self.row_parent, dtype=int)
+
+        # This will be used by the optimization function
+        self.parent_index = [0]
         for node in _tree.preorder_node_iter_noroot(ftz):
-            high = apply_fun_to_list(min,
-                [node.max, node.fix,
-                self.high[node.parent_node.index]])
-            self.high.append(high)
-        self.low = [None] * self.n
-        for node in _tree.postorder_node_iter_noroot(ftz):
-            low = apply_fun_to_list(max,
-                [0, node.min, node.fix, self.low[node.index]])
-            self.low[node.index] = low
-            parent = node.parent_node.index
-            self.low[parent] = apply_fun_to_list(max, [self.low[parent], low])
-        self.low[0] = apply_fun_to_list(max,
-            [_tree.seed_node.min, _tree.seed_node.fix, self.low[0]])
+            self.parent_index.append(node.parent_node.index)
+        self.parent_index = np.array(self.parent_index, dtype=int)
+
+        def order():
+            _tree.order(ftz)
+            return [node.order for node in self.node]
+
+        subs = [None]
+        for node in _tree.preorder_node_iter_noroot(ftz):
+            subs.append(node.subs)
+        self._prepare(order, subs)
+
+    def _set_multiplier(self, lengths):
+        """Set branch length multiplier from parameters and given lengths"""
+        format = self._param.branch_length.format
+        nsites = self._param.branch_length.nsites
+
+        if format == 'persite':
+            self._multiplier = nsites
+        elif format == 'guess':
+            # Sets nsites such that the 4 most significant digits
+            # of the maximum branch are kept
+            maximum = 0
+            for length in lengths:
+                if length is not None and length > maximum:
+                    maximum = length
+            if maximum == 0:
+                raise ValueError('All branches have zero length!')
+            while maximum < 1000:
+                maximum *= 10
+            print('Guessing number of sites: {}'.format(int(maximum)))
+            self._multiplier = int(maximum)
+        elif format == 'total':
+            self._multiplier = 1
+        else:
+            raise ValueError('Unrecognised branch length format: {}'.
+                format(format))
+
+    def _prepare(self, order, subs):
+        """
+        Reuse structures of any tree with same topology and constraints,
+        otherwise calculate them, calling order() for the node orders.
+        Then set up the numpy arrays for the given substitutions.
+        """
+        key = self.digest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._restore(cached)
+        else:
+            self.order = order()
+            self._structure()
+            self.cache.put(key, self._structures())
+
+        # Numpy Arrays
+
+        # Keep rates, root stays zero forever
+        self.rate = np.zeros(self.n, dtype=float)
+
+        # Keep gradient
+        self.gradient = np.zeros(self.n, dtype=float)
+
+        # Set branch lengths
+        self.subs = np.array(subs, dtype=float)
+
+    def make_arrays(self, parent, length, label, fix, min, max):
+        """
+        Prepare for analysis directly from lists, without any tree.
+        Nodes are given in preorder: the position of their parent
+        (-1 for the root), branch length, label and user constraints,
+        with None where missing. Follows make() step by step, including
+        grounding of leaves and collapsing of zero-length branches.
+        """
+        n = len(parent)
+        if n < 2:
+            raise ValueError('Tree must have at least one child.')
+        leaf = [True] * n
+        for position in range(1, n):
+            leaf[parent[position]] = False
+
+        self._tree = None
+        self.node = None
+        doround = self._param.branch_length.round
+        self._set_multiplier(length)
+
+        values = [[fix[k], min[k], max[k]] for k in range(n)]
+        if self._param.general.scalar:
+            for k in range(n):
+                values[k] = [0 if leaf[k] else None, None, None]
+            values[0][0] = 100.0
+        else:
+            # Same as TreePlus.ground()
+            for k in range(1, n):
+                if leaf[k] and not any(values[k]):
+                    values[k][0] = 0
+
+        # Same as TreePlus.calc_subs()
+        subs = [None] * n
+        for k in range(1, n):
+            if length[k] is None:
+                raise ValueError('Null length for node {0}'.format(label[k]))
+            subs[k] = length[k] if length[k] > 0 else 0
+            if self._multiplier is not None:
+                subs[k] *= self._multiplier
+            if doround == True:
+                subs[k] = round(subs[k])
+
+        # Same as TreePlus.collapse()
+        self._plan(parent, subs, leaf)
+        zeros, collapsed = self._check(values)
+        if zeros:
+            raise RuntimeError('Terminal zero-length branches must have their node age fixed to 0: {}'.
+                format(label[zeros[0]]))
+        if collapsed:
+            print('WARNING: Collapsed nodes with constraints:')
+            for k in collapsed:
+                print('* {0}: fix={1}, min={2}, max={3}'.
+                    format(label[k], *values[k]))
+            print('')
+        self._propagate(values)
+
+        # Collapsed nodes are merged into their closest kept ancestor
+        removed = set(position for position, *_ in self._removed)
+        zero = set(position for position, _ in self._zeros)
+        self.merged = [0] * n
+        self.position = [0]
+        for k in range(1, n):
+            if k in zero:
+                self.merged[k] = -1
+            elif k in removed:
+                self.merged[k] = self.merged[parent[k]]
+            else:
+                self.merged[k] = len(self.position)
+                self.position.append(k)
+        self.n = len(self.position)
+        if self.n < 2:
+            raise ValueError('Cannot continue since tree is just a root, ' +
+                'please check branch length parameters.')
+
+        self.label = [label[k] for k in self.position]
+        self.user_fix = [values[k][0] for k in self.position]
+        self.user_min = [values[k][1] for k in self.position]
+        self.user_max = [values[k][2] for k in self.position]
+        self.parent_index = [0] + [self.merged[parent[k]]
+            for k in self.position[1:]]
+        self.parent_index = np.array(self.parent_index, dtype=int)
+
+        def order():
+            # Same as TreePlus.order(), leaves keep their terminal zeros
+            order = [0 if leaf[k] else 1 for k in self.position]
+            for i in reversed(range(1, self.n)):
+                j = self.parent_index[i]
+                if order[i] + 1 > order[j]:
+                    order[j] = order[i] + 1
+            return order
+
+        self._prepare(order, [None] + [subs[k] for k in self.position[1:]])
+
+    # Structures that only depend on topology and constraints
+    _cached = ['order', 'children_index', 'parent_not_root', 'subtree_end',
+        'high', 'low', 'fix', 'v', 'variable_index', 'bounds',
+        'variable_not_root', 'variable_to_root',
+        'constrained_index', 'constrained_low', 'constrained_high']
+
+    def digest(self):
+        """
+        Return a stable digest of topology and user constraints,
+        computed from the parent index and constraint lists.
+        """
+        constraints = np.array([self.user_fix, self.user_min, self.user_max],
+            dtype=float)
+        digest = hashlib.sha1()
+        digest.update(self.parent_index.astype(np.int64).tobytes())
+        digest.update(constraints.tobytes())
+        return digest.hexdigest()
+
+    def _structures(self):
+        """Return a copy of the structures kept by the cache"""
+        structures = {}
+        for key in self._cached:
+            value = getattr(self, key)
+            if isinstance(value, list) and key != 'children_index':
+                value = list(value)
+            structures[key] = value
+        return structures
+
+    def _restore(self, structures):
+        """Restore cached structures, copying anything mutable"""
+        for key in self._cached:
+            value = structures[key]
+            if isinstance(value, list) and key != 'children_index':
+                value = list(value)
+            setattr(self, key, value)
+        self.variable = np.zeros(self.v, dtype=float)
+        self.time = np.array(self.fix, dtype=float)
+        self.time[self.variable_index] = self.variable
+
+    def _structure(self):
+        """Calculate index structures and boundaries from parent index"""
+
+        # Children indexes for each node plus compliment for root
+        children = [ [] for i in range(self.n)]
+        for node in range(1,self.n):
+            children[self.parent_index[node]].append(node)
+        self.children_index = [None] * self.n
+        for node in range(0,self.n):
+            self.children_index[node] = np.array(children[node], dtype=int)
+        parent_not_root = [i for i in range(self.n) if i not in self.children_index[0]]
+        self.parent_not_root = np.array(parent_not_root, dtype=int)
+
+        # Each subtree spans indexes from its root up to subtree_end
+        size = np.ones(self.n, dtype=int)
+        for node in reversed(range(1,self.n)):
+            size[self.parent_index[node]] += size[node]
+        self.subtree_end = np.arange(self.n) + size
+
+        self.bound()
+
+    def bound(self, changed=None):
+        """
+        Calculate boundaries and variables from the user constraints.
+        Requires topology indexes, so must be called after make().
+        Call again after changing user_fix, user_min or user_max.
+        If the indexes of the changed nodes are given, only boundaries
+        affected by them are recalculated: high boundaries for their
+        subtrees and low boundaries for their ancestors.
+        """
+        parent_index = self.parent_index
+        children_index = self.children_index
+
+        if changed is None:
+            self.high = [None] * self.n
+            self.low = [None] * self.n
+            self.fix = list(self.user_fix)
+            high_nodes = range(self.n)
+            low_nodes = reversed(range(self.n))
+            affected = range(self.n)
+        else:
+            # Subtrees are contiguous in preorder
+            high_nodes = set()
+            low_nodes = set()
+            for i in changed:
+                high_nodes.update(range(i, self.subtree_end[i]))
+                while i not in low_nodes:
+                    low_nodes.add(i)
+                    if i == 0:
+                        break
+                    i = parent_index[i]
+            affected = high_nodes | low_nodes
+            high_nodes = sorted(high_nodes)
+            low_nodes = sorted(low_nodes, reverse=True)
+
+        # Calculate high boundary for each node (top down).
+        for i in high_nodes:
+            parent_high = self.high[parent_index[i]] if i > 0 else None
+            self.high[i] = apply_fun_to_list(min,
+                [self.user_max[i], self.user_fix[i], parent_high])
+        # Children always come after their parent in preorder,
+        # so reversed preorder visits children first (bottom up).
+        for i in low_nodes:
+            lows = [self.user_min[i], self.user_fix[i]]
+            lows.extend(self.low[j] for j in children_index[i])
+            if i > 0:
+                lows.append(0)
+            self.low[i] = apply_fun_to_list(max, lows)
 
         # Boundary check
-        for i in range(self.n):
+        for i in affected:
+            self.fix[i] = self.user_fix[i]
             # These must be in ascending order:
             # low boundary < fixed age < high boundary
             order = [self.low[i], self.fix[i], self.high[i]]
             order = [i for i in filter(lambda x: x is not None, order)]
             if sorted(order) != order:
                 raise ValueError('Impossible boundaries for node {0}: {1}]'.
-                    format(self.node[i],order))
+                    format(self.label[i],order))
             # If (existing) boundaries collide, make sure node age is a fixed value
             if all([self.low[i], self.high[i]]):
                 if self.high[i] == self.low[i]:
@@ -224,44 +600,16 @@ class Array:
         #! A range of solutions might exist if root is not fixed!
         #! Might be a good idea to point that out.
 
-        # Numpy Arrays
-
-        # Keep rates, root stays zero forever
-        self.rate = np.zeros(self.n, dtype=float)
-
-        # Keep gradient
-        self.gradient = np.zeros(self.n, dtype=float)
-
-        # Set branch lengths
-        subs = [None]
-        for node in _tree.preorder_node_iter_noroot(ftz):
-            subs.append(node.subs)
-        self.subs = np.array(subs, dtype=float)
-
-        # This will be used by the optimization function
-        self.parent_index = [0]
-        for node in _tree.preorder_node_iter_noroot(ftz):
-            self.parent_index.append(node.parent_node.index)
-        self.parent_index = np.array(self.parent_index, dtype=int)
-
-        # Children indexes for each node plus compliment for root
-        children = [ [] for i in range(self.n)]
-        for node in range(1,self.n):
-            children[self.parent_index[node]].append(node)
-        self.children_index = [None] * self.n
-        for node in range(0,self.n):
-            self.children_index[node] = np.array(children[node], dtype=int)
-        parent_not_root = [i for i in range(self.n) if i not in self.children_index[0]]
-        self.parent_not_root = np.array(parent_not_root, dtype=int)
-        variable_not_root = [i for i in variable_index if i not in self.children_index[0]]
-        variable_to_root = [i for i in variable_index if i in self.children_index[0]]
+        root_children = set(self.children_index[0])
+        variable_not_root = [i for i in variable_index if i not in root_children]
+        variable_to_root = [i for i in variable_index if i in root_children]
         self.variable_not_root = np.array(variable_not_root, dtype=int)
         self.variable_to_root = np.array(variable_to_root, dtype=int)
 
         # Isolate indexes of low/high constrained nodes
         constrained = []
-        for i, node in enumerate(_tree.preorder_node_iter(ftz)):
-            if node.max is not None or node.min is not None:
+        for i in range(self.n):
+            if self.user_max[i] is not None or self.user_min[i] is not None:
                 constrained.append(i)
         self.constrained_index = np.array(constrained, dtype=int) # low/high
         #! OR JUST TAKE ALL THE VARS
@@ -292,6 +640,194 @@ class Array:
         #     self.node[i].rate = self.rate[i]/divider
         return self._tree
 
+    def rows(self):
+        """
+        Return (label, index) for each node of the prepared tree
+        in results table order. Index is None for terminal zeros.
+        """
+        return [(label, None if index < 0 else int(index))
+            for label, index in zip(self.row_label, self.row_index)]
+
+    def detach(self):
+        """
+        Return a copy of the prepared arrays without any tree references.
+        The copy is cheap to pickle and may be solved on another process.
+        """
+        array = Array.__new__(Array)
+        array.__dict__.update(self.__dict__)
+        array.__dict__.pop('opt', None)
+        array._tree = None
+        array.node = None
+        array.user_fix = list(self.user_fix)
+        array.user_min = list(self.user_min)
+        array.user_max = list(self.user_max)
+        array.fix = list(self.fix)
+        array.low = list(self.low)
+        array.high = list(self.high)
+        array.variable = self.variable.copy()
+        array.time = self.time.copy()
+        array.rate = self.rate.copy()
+        array.gradient = self.gradient.copy()
+        array.subs = self.subs.copy()
+        return array
+
+    def update(self, subs=None, fix=None, min=None, max=None):
+        """
+        Replace branch substitutions and/or user constraints
+        of a prepared array, while keeping the topology intact.
+        Substitutions are given in preorder, excluding the root.
+        Constraints are given in preorder for all nodes, with None
+        for unconstrained nodes. Only boundaries are recalculated.
+        """
+        if subs is not None:
+            self.subs[1:] = subs
+        changed = set()
+        for key, values in [('user_fix', fix),
+                ('user_min', min), ('user_max', max)]:
+            if values is None:
+                continue
+            user = getattr(self, key)
+            changed.update(i for i in range(self.n) if values[i] != user[i])
+            setattr(self, key, list(values))
+        if changed:
+            self.bound(changed)
+
+    def _plan(self, parent, subs, leaf):
+        """
+        Record how collapse() propagates constraints, so that it may be
+        replayed later by _propagate(). Nodes are given in preorder by
+        the position of their parent (-1 for the root), their
+        substitutions as set by calc_subs() and whether they are leaves.
+        Children are visited before their parents, which is all
+        that matters for propagation.
+        """
+        zeros = []
+        removed = []
+        # Children each node leaves to its parent, once collapsed
+        inherited = {}
+        # Parents with any child that is not a terminal zero
+        fertile = set()
+        for position in reversed(range(1, len(parent))):
+            up = parent[position]
+            if leaf[position] and subs[position] == 0:
+                zeros.append((position, up))
+                inherited.setdefault(up, []).append(position)
+                continue
+            fertile.add(up)
+            if subs[position] == 0:
+                children = inherited.pop(position, [])
+                removed.append((position, up, children,
+                    position not in fertile))
+                inherited.setdefault(up, []).extend(children)
+            else:
+                inherited.pop(position, None)
+                inherited.setdefault(up, []).append(position)
+        self._zeros = zeros
+        self._removed = removed
+
+    def _check(self, values):
+        """
+        Given [fix, min, max] for each node in preorder, return positions
+        of terminal zeros that are not fixed to zero, followed by those
+        of collapsed nodes with constraints, see _plan().
+        """
+        zeros = [position for position, parent in self._zeros
+            if values[position][0] != 0]
+        collapsed = [position for position, parent, children, zeros
+            in self._removed if any(values[position]) and not zeros]
+        return zeros, collapsed
+
+    def _propagate(self, values):
+        """
+        Replay the constraint propagation of collapse() in place,
+        on [fix, min, max] for each node in preorder, see _plan().
+        """
+        for position, parent in self._zeros:
+            if values[parent][1] is None:
+                values[parent][1] = 0
+        for position, parent, children, zeros in self._removed:
+            fix, low, high = values[position]
+            if fix is not None:
+                low = high = fix
+            if high is not None:
+                for child in children:
+                    if values[child][2] is not None:
+                        values[child][2] = min(values[child][2], high)
+                    if values[child][2] is None and values[child][0] is None:
+                        values[child][2] = high
+            if low is not None:
+                if values[parent][1] is not None:
+                    values[parent][1] = max(values[parent][1], low)
+                if values[parent][1] is None and values[parent][0] is None:
+                    values[parent][1] = low
+
+    def recalibrate(self, tree):
+        """
+        Copy user constraints from the given tree, which must be the one
+        given to make() with only its constraints changed since, then
+        recalculate the affected boundaries. Constraints of collapsed
+        nodes are propagated just like collapse() does. Returns False
+        if make() is required instead, so that it may report problems.
+        The prepared tree is cloned, so earlier results stay untouched.
+        """
+        if self._tree is None:
+            return False
+        values = [[node.fix, node.min, node.max]
+            for node in tree.preorder_node_iter()]
+        if not self._param.general.scalar:
+            if any(self._check(values)):
+                return False
+            self._propagate(values)
+        self._tree = extensions.copy_tree(self._tree)
+        target = list(self._tree.preorder_node_iter())
+        if not self._param.general.scalar:
+            for node, position in zip(target, self._kept):
+                node.fix, node.min, node.max = values[position]
+        self.node = [node for node in target if not node.is_terminal_zero()]
+        self.update(
+            fix=[node.fix for node in self.node],
+            min=[node.min for node in self.node],
+            max=[node.max for node in self.node])
+        return True
+
+    def warm(self, time):
+        """
+        Start variables from the given node times if they are feasible
+        for current boundaries, otherwise fall back to a random guess.
+        If the root is fixed at a different age than the given times,
+        these are first scaled proportionally to match it.
+        Returns True if the given times were used.
+        """
+        time = np.asarray(time, dtype=float)
+        if self.fix[0] is not None and time[0] > 0:
+            time = time * (self.fix[0] / time[0])
+        self.variable[:] = time[self.variable_index]
+        self.time[self.variable_index] = self.variable
+        time = self.time
+        constrained = time[self.constrained_index]
+        if (np.all(time[self.parent_index[1:]] > time[1:]) and
+                np.all(constrained > self.constrained_low) and
+                np.all(constrained < self.constrained_high)):
+            return True
+        self.guess()
+        return False
+
+    def inside(self, time, fraction=0.05):
+        """
+        Return the given feasible node times, moved the given fraction
+        of the way towards a random guess. As guesses never touch the
+        boundaries, neither do the returned times, which are thus kept
+        off the barrier while staying close to the given ones.
+        Variables are left as they were.
+        """
+        time = np.array(time, dtype=float)
+        variable = self.variable.copy()
+        self.guess()
+        guess = self.time.copy()
+        self.variable[:] = variable
+        self.time[self.variable_index] = variable
+        return time + fraction * (guess - time)
+
     def guess(self):
         """
         Assign variables between low and high bounds.
@@ -427,6 +963,165 @@ class Array:
         return True
 
 
+##############################################################################
+### Stacked optimization
+
+class Stack:
+    """
+    Solve the NPRS problem for many substitution vectors at once,
+    sharing the topology and boundaries of a prepared Array.
+
+    Variable node times are parametrized top down, each as a fraction
+    of the window between its low boundary and the time of its parent
+    (or its high boundary if lower). Any parameter values thus give
+    feasible times, so no barrier is needed and all rows are optimized
+    together by L-BFGS, with analytic gradients evaluated for every row
+    in single vectorized passes. Each row is an independent problem.
+    """
+
+    def __init__(self, array, param):
+        self._param = param
+        self.n = array.n
+        self.parent_index = array.parent_index
+        self.root_children = array.children_index[0]
+        self.parent_not_root = array.parent_not_root[array.parent_not_root > 0]
+        self.variable_index = array.variable_index
+        self.fix = np.array([0 if x is None else x for x in array.fix], dtype=float)
+        self.low = np.array(array.low, dtype=float)
+        self.high = np.array([np.inf if x is None else x for x in array.high], dtype=float)
+        self.root_variable = array.fix[0] is None
+        self.root_unbounded = self.root_variable and array.high[0] is None
+
+        # Variables of the same depth are independent of each other
+        depth = np.zeros(self.n, dtype=int)
+        for i in range(1, self.n):
+            depth[i] = depth[self.parent_index[i]] + 1
+        variables = self.variable_index[self.variable_index > 0]
+        self.levels = [variables[depth[variables] == d]
+            for d in range(1, depth.max() + 1)]
+        self.levels = [level for level in self.levels if level.size]
+
+    def times(self, z):
+        """Return node times and window fractions for given parameters"""
+        rows = z.shape[0]
+        parent_index = self.parent_index
+        full = np.zeros((rows, self.n))
+        full[:, self.variable_index] = np.clip(z, -35, 35)
+        x = 1 / (1 + np.exp(-full))
+        time = np.tile(self.fix, (rows, 1))
+        if self.root_unbounded:
+            time[:, 0] = self.low[0] + np.exp(full[:, 0])
+        elif self.root_variable:
+            time[:, 0] = self.low[0] + (self.high[0] - self.low[0]) * x[:, 0]
+        for level in self.levels:
+            window = np.minimum(time[:, parent_index[level]], self.high[level])
+            time[:, level] = self.low[level] + (window - self.low[level]) * x[:, level]
+        return time, x
+
+    def parameters(self, time):
+        """Return parameters for given node times, inverse of times()"""
+        parent_index = self.parent_index
+        full = np.zeros(time.shape)
+        if self.root_unbounded:
+            full[:, 0] = np.log(time[:, 0] - self.low[0])
+        elif self.root_variable:
+            x = (time[:, 0] - self.low[0]) / (self.high[0] - self.low[0])
+            full[:, 0] = np.log(x / (1 - x))
+        for level in self.levels:
+            window = np.minimum(time[:, parent_index[level]], self.high[level])
+            x = (time[:, level] - self.low[level]) / (window - self.low[level])
+            full[:, level] = np.log(x / (1 - x))
+        return full[:, self.variable_index]
+
+    def objective(self, time, subs):
+        """
+        Return NPRS objective for each row, as well as rates
+        and the objective gradient with respect to node times.
+        """
+        logarithmic = self._param.method.logarithmic
+        exponent = self._param.method.exponent
+        parent_index = self.parent_index
+        root_children = self.root_children
+        parent_not_root = self.parent_not_root
+        r = root_children.size
+        everything = slice(None)
+
+        time_difference = time[:, parent_index] - time
+        rate = np.zeros(time.shape)
+        rate[:, 1:] = subs[:, 1:] / time_difference[:, 1:]
+        if logarithmic:
+            rate[:, 1:] = np.log(rate[:, 1:])
+        rate_of_root_children = rate[:, root_children]
+        sum_root = rate_of_root_children.sum(axis=1)
+        sum_root_squared = (rate_of_root_children ** 2).sum(axis=1)
+        rate_difference = rate[:, parent_index[parent_not_root]] - rate[:, parent_not_root]
+        absolute_difference = np.absolute(rate_difference)
+        w = (sum_root_squared - (sum_root * sum_root) / r) / r
+        w += (absolute_difference ** exponent).sum(axis=1)
+
+        # Gradient with respect to rates
+        gradient_rate = np.zeros(time.shape)
+        gradient_rate[:, root_children] = 2 * (rate_of_root_children - sum_root[:, None] / r) / r
+        derivative = exponent * absolute_difference ** (exponent - 1) * np.sign(rate_difference)
+        gradient_rate[:, parent_not_root] -= derivative
+        np.add.at(gradient_rate, (everything, parent_index[parent_not_root]), derivative)
+
+        # Chain to time differences, then to node times
+        if logarithmic:
+            derivative = - gradient_rate[:, 1:] / time_difference[:, 1:]
+        else:
+            derivative = - gradient_rate[:, 1:] * subs[:, 1:] / time_difference[:, 1:] ** 2
+        gradient = np.zeros(time.shape)
+        gradient[:, 1:] -= derivative
+        np.add.at(gradient, (everything, parent_index[1:]), derivative)
+        return w, rate, gradient
+
+    def gradient(self, time, x, gradient):
+        """Chain node time gradient back to parameters, bottom up"""
+        parent_index = self.parent_index
+        everything = slice(None)
+        gradient = gradient.copy()
+        full = np.zeros(time.shape)
+        for level in reversed(self.levels):
+            parent_time = time[:, parent_index[level]]
+            window = np.minimum(parent_time, self.high[level])
+            fraction = x[:, level]
+            full[:, level] = gradient[:, level] * (window - self.low[level]) * fraction * (1 - fraction)
+            below = parent_time < self.high[level]
+            np.add.at(gradient, (everything, parent_index[level]),
+                gradient[:, level] * fraction * below)
+        if self.root_unbounded:
+            full[:, 0] = gradient[:, 0] * (time[:, 0] - self.low[0])
+        elif self.root_variable:
+            full[:, 0] = gradient[:, 0] * (self.high[0] - self.low[0]) * x[:, 0] * (1 - x[:, 0])
+        return full[:, self.variable_index]
+
+    def solve(self, subs, start):
+        """
+        Minimize the objective of all rows starting from given node times.
+        Returns node times, rates, objective values and the optimizer message.
+        """
+        rows = subs.shape[0]
+        shape = (rows, self.variable_index.size)
+
+        def function(z):
+            time, x = self.times(z.reshape(shape))
+            w, rate, gradient = self.objective(time, subs)
+            return w.sum(), self.gradient(time, x, gradient).ravel()
+
+        # Tolerance applies to the sum, scale it down to each row
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = optimize.minimize(function,
+                self.parameters(start).ravel(), jac=True, method='L-BFGS-B',
+                options={
+                    'ftol': self._param.algorithm.function_tolerance / rows,
+                    'gtol': self._param.algorithm.variable_tolerance,
+                    'maxiter': 15000})
+            time, x = self.times(result.x.reshape(shape))
+            w, rate, gradient = self.objective(time, subs)
+        return time, rate, w, result.message
+
+
 ##############################################################################
 ### Results
 
@@ -440,6 +1135,11 @@ class RateAnalysisResults(dict):
 
     def __setstate__(self, state):
         self.__dict__ = state
+        # Tables pickled by earlier versions have list columns
+        table = self.get('table')
+        if table is not None:
+            for key in ['Age', 'Rate']:
+                table[key] = np.asarray(table[key], dtype=float)
 
     def __getattr__(self, name):
         try:
@@ -461,34 +1161,204 @@ class RateAnalysisResults(dict):
     def __dir__(self):
         return list(self.keys())
 
-    def __init__(self, tree):
+    def __init__(self, tree=None, array=None):
+        """
+        Results are given either as a tree with ages and rates set on
+        its nodes, or as the prepared Array after optimization. In the
+        latter case, ages and rates are kept as arrays, while the tree,
+        table, chronogram and ratogram are only built when first accessed.
+        """
         self.flags = None
-        self.tree = tree
-
-        node = []
-        age = []
-        rate = []
-        for n in tree.preorder_node_iter():
-            node.append(n.label)
-            age.append(n.age)
-            rate.append(n.rate)
-        self.table = {
-            'n': len(node),
-            'Node': node,
-            'Age': age,
-            'Rate': rate,
-            }
-        # chronogram: branch length corresponds to time duration
-        self.chronogram = tree.clone(depth=1)
-        for node in self.chronogram.preorder_node_iter_noroot():
+        if array is None:
+            self.tree = tree
+            return
+        self._prepared = array._tree
+        self._row_label = array.row_label
+        self._row_parent = array.row_parent
+        self._row_name = array.row_name
+        self._row_taxon = array.row_taxon
+        # Array index of each table row, -1 for terminal zeros
+        self._index = array.row_index
+        self._time = array.time.copy()
+        self._rate = array.rate / array._multiplier
+
+    def _rows(self, values):
+        """Values per array index in table row order, zero for terminal zeros"""
+        column = np.zeros(len(self._index))
+        rows = self._index >= 0
+        column[rows] = values[self._index[rows]]
+        return column
+
+    @property
+    def tree(self):
+        if 'tree' not in self:
+            tree = self._prepared
+            for node, index in zip(tree.preorder_node_iter(), self._index):
+                if index < 0:
+                    node.age = 0
+                    node.rate = 0
+                else:
+                    node.age = self._time[index]
+                    node.rate = self._rate[index]
+            self['tree'] = tree
+        return self['tree']
+
+    @property
+    def table(self):
+        if 'table' not in self:
+            if '_index' in self:
+                self['table'] = {
+                    'n': len(self._index),
+                    'Node': list(self._row_label),
+                    'Age': self._rows(self._time),
+                    'Rate': self._rows(self._rate),
+                    }
+            else:
+                nodes = list(self.tree.preorder_node_iter())
+                self['table'] = {
+                    'n': len(nodes),
+                    'Node': [node.label for node in nodes],
+                    'Age': np.array([node.age for node in nodes], dtype=float),
+                    'Rate': np.array([node.rate for node in nodes], dtype=float),
+                    }
+        return self['table']
+
+    @property
+    def chronogram(self):
+        if 'chronogram' not in self:
+            self['chronogram'] = self._chronogram(self.tree)
+        return self['chronogram']
+
+    @property
+    def ratogram(self):
+        if 'ratogram' not in self:
+            self['ratogram'] = self._ratogram(self.tree)
+        return self['ratogram']
+
+    @staticmethod
+    def _chronogram(tree):
+        """Branch length corresponds to time duration"""
+        chronogram = extensions.copy_tree(tree)
+        for node in chronogram.preorder_node_iter_noroot():
             node.edge_length = node.parent_node.age - node.age
-        self.chronogram.seed_node.edge_length = None
-        extensions.TreePlus.strip(self.chronogram)
-        # ratogram: branch length correspond to absolute rates of substitutions
-        self.ratogram = tree.clone(depth=1)
-        for node in self.ratogram.preorder_node_iter():
+        chronogram.seed_node.edge_length = None
+        extensions.TreePlus.strip(chronogram)
+        return chronogram
+
+    @staticmethod
+    def _ratogram(tree):
+        """Branch length corresponds to absolute rates of substitutions"""
+        ratogram = extensions.copy_tree(tree)
+        for node in ratogram.preorder_node_iter():
             node.edge_length = node.rate
-        extensions.TreePlus.strip(self.ratogram)
+        extensions.TreePlus.strip(ratogram)
+        return ratogram
+
+    def _newick_rows(self, internal=True):
+        """
+        Return parent row, plain label, age and rate for each table row.
+        Unless `internal` is set, internal nodes keep only taxon labels.
+        """
+        if '_index' in self:
+            parent, names, taxa = (
+                self._row_parent, self._row_name, self._row_taxon)
+            age, rate = self._rows(self._time), self._rows(self._rate)
+        else:
+            nodes = list(self.tree.preorder_node_iter())
+            rows = {node: row for row, node in enumerate(nodes)}
+            parent = np.array([rows.get(node.parent_node, -1)
+                for node in nodes], dtype=int)
+            names = [node.plain_label for node in nodes]
+            taxa = [_taxon_label(node) for node in nodes]
+            age = np.asarray(self.table['Age'], dtype=float)
+            rate = np.asarray(self.table['Rate'], dtype=float)
+        if not internal:
+            names = _leaf_names(parent, names, taxa)
+        return parent, names, age, rate
+
+    def _clade_rows(self):
+        """
+        Return parent row, leaf name and age for each table row, without
+        building the tree if not done already. Leaves are named after
+        their taxon label if available, otherwise their node label.
+        """
+        if '_index' in self:
+            parent, taxa = self._row_parent, self._row_taxon
+        else:
+            nodes = list(self.tree.preorder_node_iter())
+            rows = {node: row for row, node in enumerate(nodes)}
+            parent = np.array([rows.get(node.parent_node, -1)
+                for node in nodes], dtype=int)
+            taxa = [_taxon_label(node) for node in nodes]
+        names = [label if taxon is None else taxon
+            for taxon, label in zip(taxa, self.table['Node'])]
+        return parent, names, np.asarray(self.table['Age'], dtype=float)
+
+    def write_chronogram(self, output, precision=None, rooted=True,
+            internal=True):
+        """
+        Write the chronogram as Newick to the given text file handle,
+        straight from the result arrays. Branch lengths are written with
+        the given number of significant digits, or in full if None.
+        Internal node labels other than taxa are omitted unless
+        `internal` is set.
+        """
+        parent, names, age, rate = self._newick_rows(internal)
+        length = age[parent] - age
+        length[0] = np.nan
+        treefile.write_newick(output, parent, length, names,
+            precision, rooted)
+
+    def write_ratogram(self, output, precision=None, rooted=True,
+            internal=True):
+        """Write the ratogram as Newick, see write_chronogram()"""
+        parent, names, age, rate = self._newick_rows(internal)
+        treefile.write_newick(output, parent, rate, names,
+            precision, rooted)
+
+    def _column(self, values):
+        """
+        Arrange values given per array index in table row order.
+        The last axis is rearranged if more than one dimension is given.
+        """
+        values = np.asarray(values, dtype=float)
+        column = np.zeros(values.shape[:-1] + (self.table['n'],))
+        if '_index' in self:
+            rows = self._index >= 0
+            column[..., rows] = values[..., self._index[rows]]
+            return column
+        for row, node in enumerate(self.tree.preorder_node_iter()):
+            if not node.is_terminal_zero():
+                column[..., row] = values[..., node.index]
+        return column
+
+    def _distribution(self, solved, level):
+        """
+        Summarize node ages of replicate solutions in table row order,
+        given (solution, error) pairs. The error message of each failed
+        replicate is kept in `errors`, which is None for the rest.
+        """
+        ages = [solution[1] for solution, error in solved if error is None]
+        errors = [error for solution, error in solved]
+        if not ages:
+            raise RuntimeError('All replicates failed: {}'.format(errors[0]))
+        ages = self._column(ages)
+        low, high = np.percentile(ages,
+            [50 * (1 - level), 50 * (1 + level)], axis=0)
+        return {
+            'replicates': len(solved),
+            'failed': len(solved) - len(ages),
+            'errors': errors,
+            'level': level,
+            'ages': ages,
+            'n': self.table['n'],
+            'Node': self.table['Node'],
+            'Age': self.table['Age'],
+            'Mean': ages.mean(axis=0),
+            'Deviation': ages.std(axis=0),
+            'Low': low,
+            'High': high,
+            }
 
     def print(self, columns=None):
         if columns is None:
@@ -517,6 +1387,99 @@ class RateAnalysisResults(dict):
         print('')
 
 
+class ArrayResults(RateAnalysisResults):
+    """
+    Results of an analysis created by RateAnalysis.from_arrays().
+    Ages and rates are arrays with one entry per given node, in the
+    order given. Nodes merged by collapsing zero-length branches share
+    the age of the node they were merged into. Terminal zero-length
+    branches and collapsed nodes have zero rate.
+    The table lists nodes in preorder. Trees are only built from
+    the arrays when first accessed.
+    """
+
+    def __init__(self, parent, length, labels, label, age, rate, order, index):
+        self.flags = None
+        self.parent = parent
+        self.length = length
+        # Labels as given for building trees, resolved labels for the rest
+        self._labels = labels
+        self.label = label
+        self.age = age
+        self.rate = rate
+        self._order = order
+        # Array index of each table row, -1 for terminal zeros
+        self._index = index
+        self.table = {
+            'n': len(order),
+            'Node': [label[i] for i in order],
+            'Age': age[order],
+            'Rate': rate[order],
+            }
+
+    def _newick_rows(self, internal=True):
+        order = self._order
+        rows = np.empty(len(order), dtype=int)
+        rows[order] = np.arange(len(order))
+        parent = self.parent[order]
+        parent = np.where(parent < 0, -1, rows[np.maximum(parent, 0)])
+        names = [self._labels[i] or None for i in order]
+        if not internal:
+            names = _leaf_names(parent, names, [None] * len(order))
+        return parent, names, self.age[order], self.rate[order]
+
+    @property
+    def tree(self):
+        if 'tree' not in self:
+            tree, nodes = extensions.TreePlus.from_arrays(
+                self.parent, self.length, self._labels, self._order)
+            for node, age, rate in zip(nodes, self.age, self.rate):
+                node.age = age
+                node.rate = rate
+            self['tree'] = tree
+        return self['tree']
+
+
+def _taxon_label(node):
+    """Taxon label of given node if any, as written by dendropy"""
+    if node.taxon is None or node.taxon.label is None:
+        return None
+    return str(node.taxon.label)
+
+
+def _leaf_names(parent, names, taxa):
+    """Keep given names for leaves, taxon labels for internal nodes"""
+    inner = np.zeros(len(parent), dtype=bool)
+    inner[parent[1:]] = True
+    return [taxon if branch else name
+        for name, taxon, branch in zip(names, taxa, inner)]
+
+
+def preorder(parent):
+    """
+    Return node indexes in preorder, given the parent index
+    of each node and -1 for the root. Children are visited in
+    index order. Raises ValueError if this is not a single tree.
+    """
+    parent = np.asarray(parent, dtype=int)
+    roots = np.flatnonzero(parent < 0)
+    if len(roots) != 1:
+        raise ValueError('Expected a single root, found {}.'.format(len(roots)))
+    children = [[] for i in range(len(parent))]
+    for node, up in enumerate(parent.tolist()):
+        if up >= 0:
+            children[up].append(node)
+    order = []
+    stack = [roots[0]]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(reversed(children[node]))
+    if len(order) != len(parent):
+        raise ValueError('Parent index does not describe a tree.')
+    return np.array(order, dtype=int)
+
+
 ##############################################################################
 ### Analysis
 
@@ -526,21 +1489,129 @@ class RateAnalysis:
     """
     #? Consider locking attributes with __slots__ or @dataclass
 
-    def __init__(self, tree=None):
+    def __init__(self, tree=None, copy=True):
+        """
+        The given tree is copied, unless `copy` is False, in which case
+        it is converted in place and should not be used by the caller.
+        """
         self.results = None
-        self.param = param.ParamList(params.params)
-        self._array = Array(self.param)
+        self._param = None
+        self._frozen = None
+        self._array = Array(None)
+        self._inputs = None
+        self._source = None
         if tree is None:
             self._tree = None
-        else:
+        elif copy:
             self.tree = tree
+        else:
+            self._adopt(tree)
 
     def __getstate__(self):
         return (self._tree,self.param,self.results,)
 
     def __setstate__(self, state):
-        (self._tree,self.param,self.results,) = state
-        self._array = Array(self.param)
+        (self._tree,self._param,self.results,) = state
+        self._frozen = None
+        self._array = Array(None)
+        self._inputs = None
+        self._source = None
+
+    @property
+    def param(self):
+        """
+        User can edit parameters before run(), which uses a frozen
+        snapshot instead. Defaults are only loaded when first accessed.
+        """
+        if self._param is None:
+            self._param = param.ParamList(params.params)
+        return self._param
+
+    @param.setter
+    def param(self, value):
+        self._param = value
+
+    def _freeze(self):
+        """Take a snapshot of parameters for optimization"""
+        if self._param is None:
+            self._frozen = _default_param()
+        else:
+            self._frozen = self._param.freeze()
+        self._array._param = self._frozen
+        return self._frozen
+
+    @classmethod
+    def from_arrays(cls, parent, edge_length, labels=None,
+            fix=None, min=None, max=None):
+        """
+        Create an analysis straight from arrays, bypassing dendropy.
+        Each node is given by the index of its parent (-1 for the root)
+        and the length of the branch leading to it, as well as its label
+        and user constraints if available. Missing values may be given
+        as None or nan. Parameters may be changed before calling run(),
+        which then returns ArrayResults with nodes in the given order.
+        """
+        parent = np.asarray(parent, dtype=int)
+        n = len(parent)
+        order = preorder(parent)
+
+        def column(values):
+            if values is None:
+                return [None] * n
+            if len(values) != n:
+                raise ValueError('Expected {0} values, got {1}.'.
+                    format(n, len(values)))
+            return [None if value is None or value != value
+                else float(value) for value in values]
+
+        length = column(edge_length)
+        labels = [None] * n if labels is None else list(labels)
+        analysis = cls()
+        source = {
+            'order': order,
+            'parent': parent,
+            'edge_length': np.array(length, dtype=float),
+            'labels': labels,
+            'fix': column(fix),
+            'min': column(min),
+            'max': column(max),
+            }
+        # Unlabeled nodes are named after their preorder position
+        source['label'] = [extensions.NodePlus.decorator.format(k)
+            if labels[i] is None or labels[i] == '' else str(labels[i])
+            for k, i in enumerate(order)]
+        analysis._source = source
+        return analysis
+
+    def _run_arrays(self):
+        """Prepare, solve and return results for from_arrays()"""
+        source = self._source
+        order = source['order']
+        position = np.empty(len(order), dtype=int)
+        position[order] = np.arange(len(order))
+        array = self._array
+        array.make_arrays(
+            [-1] + position[source['parent'][order[1:]]].tolist(),
+            [source['edge_length'][i] for i in order],
+            source['label'],
+            [source['fix'][i] for i in order],
+            [source['min'][i] for i in order],
+            [source['max'][i] for i in order])
+        self._optimize()
+
+        # Arrange by preorder position, then by given order
+        merged = np.array(array.merged, dtype=int)
+        kept = merged >= 0
+        age = np.zeros(len(order))
+        age[kept] = array.time[merged[kept]]
+        rate = np.zeros(len(order))
+        rate[array.position] = array.rate / array._multiplier
+        label = [None] * len(order)
+        for k, i in enumerate(order):
+            label[i] = source['label'][k]
+        return ArrayResults(source['parent'], source['edge_length'],
+            source['labels'], label, age[position], rate[position],
+            order, merged)
 
     @property
     def tree(self):
@@ -549,13 +1620,135 @@ class RateAnalysis:
 
     @tree.setter
     def tree(self, phylogram):
-        self._tree = phylogram.clone(depth=1)
+        self._adopt(extensions.copy_tree(phylogram))
+
+    def _adopt(self, phylogram):
+        """Use given tree as is, converting it in place"""
+        self._tree = phylogram
+        self._inputs = None
+        self._source = None
         extensions.TreePlus.extend(self._tree)
         self._tree.is_rooted = True
         self._tree.ground()
         self._tree.index()
         # self._tree.collapse()
 
+    _calibration_columns = ['node', 'taxa', 'fix', 'min', 'max']
+
+    def calibrate(self, file, delimiter=None):
+        """
+        Import node calibrations in bulk from a TSV/CSV table.
+
+        The header names any of the columns: node, taxa, fix, min, max.
+        Each row calibrates the most recent common ancestor of its taxa,
+        separated by spaces, commas or semicolons, and names it after
+        the node column if given. Without taxa, the node column refers
+        to an existing taxon label. Empty cells mean no constraint,
+        and as with RATES commands, a fixed age clears bounds and
+        bounds clear a fixed age.
+
+        All rows are checked before any node is changed. Conflicts,
+        such as unknown taxa, bad values or a node calibrated twice
+        in different ways, are all reported in a single ValueError.
+        The delimiter is guessed from the file extension or contents
+        unless given. Returns the calibrated nodes.
+        """
+        if delimiter is None:
+            extension = os.path.splitext(file)[1].lower()
+            delimiter = {'.tsv': '\t', '.tab': '\t', '.csv': ','}.get(extension)
+        with open(file, newline='') as input:
+            if delimiter is None:
+                sample = input.readline()
+                delimiter = csv.Sniffer().sniff(sample, '\t,;').delimiter
+                input.seek(0)
+            reader = csv.reader(input, delimiter=delimiter)
+            header = [column.strip().lower() for column in next(reader, [])]
+            for column in header:
+                if column not in self._calibration_columns:
+                    raise ValueError('Unrecognised calibration column: {}'.
+                        format(column))
+            if 'taxa' not in header and 'node' not in header:
+                raise ValueError("Calibration table needs a 'taxa' or 'node' column.")
+            rows = [(reader.line_num, dict(zip(header, row)))
+                for row in reader if any(cell.strip() for cell in row)]
+
+        tree = self._tree
+        errors = []
+        calibrations = collections.OrderedDict()
+
+        def find(label):
+            node = tree.find_taxon_node(label)
+            if node is None:
+                node = tree.find_taxon_node(label.replace('_', ' '))
+            return node
+
+        for line, row in rows:
+            name = row.get('node', '').strip() or None
+            taxa = [taxon for taxon in
+                row.get('taxa', '').replace(',', ' ').replace(';', ' ').split()]
+            values = {}
+            for key in ['fix', 'min', 'max']:
+                value = row.get(key, '').strip()
+                if value == '' or value.upper() == 'NONE':
+                    values[key] = None
+                    continue
+                try:
+                    values[key] = float(value)
+                except ValueError:
+                    errors.append('Line {0}: Bad {1} value: {2}'.
+                        format(line, key, value))
+            if len(values) < 3:
+                continue
+            if values['fix'] is not None and \
+                    (values['min'] is not None or values['max'] is not None):
+                errors.append('Line {0}: Cannot both fix and bound an age.'.
+                    format(line))
+                continue
+            if values['min'] is not None and values['max'] is not None \
+                    and values['min'] > values['max']:
+                errors.append('Line {0}: Minimum age {1} exceeds maximum {2}.'.
+                    format(line, values['min'], values['max']))
+                continue
+            if taxa:
+                nodes = [find(taxon) for taxon in taxa]
+                missing = [taxon for taxon, node in zip(taxa, nodes)
+                    if node is None]
+                if missing:
+                    errors.append('Line {0}: Taxa not found: {1}'.
+                        format(line, ', '.join(missing)))
+                    continue
+                node = tree.common_ancestor(nodes)
+            elif name is not None:
+                node = find(name)
+                if node is None:
+                    errors.append('Line {0}: Node not found: {1}'.
+                        format(line, name))
+                    continue
+                name = None
+            else:
+                errors.append('Line {0}: No taxa or node given.'.format(line))
+                continue
+            if node in calibrations:
+                previous, other = calibrations[node]
+                if other['values'] != values or (name is not None and
+                        other['name'] is not None and name != other['name']):
+                    errors.append('Line {0}: Node already calibrated differently on line {1}.'.
+                        format(line, previous))
+                    continue
+            calibrations[node] = (line, {'name': name, 'values': values})
+
+        if errors:
+            raise ValueError('Calibration table conflicts:\n' +
+                '\n'.join(errors))
+        for node, (line, calibration) in calibrations.items():
+            if calibration['name'] is not None:
+                tree.label_node(node, calibration['name'])
+            values = calibration['values']
+            node.fix = values['fix']
+            node.min = values['min']
+            node.max = values['max']
+        return list(calibrations)
+
 
     ##########################################################################
     ### Method function generators
@@ -563,9 +1756,9 @@ class RateAnalysis:
     def _build_objective_nprs(self):
         """Generate and return NPRS objective function"""
 
-        logarithmic = self.param.method.logarithmic
-        exponent = self.param.method.exponent
-        largeval = self.param.general.largeval
+        logarithmic = self._frozen.method.logarithmic
+        exponent = self._frozen.method.exponent
+        largeval = self._frozen.general.largeval
         array = self._array
 
         #? these can probably be moved downstairs? doesnt seem to make a diff
@@ -617,9 +1810,9 @@ class RateAnalysis:
     # def _build_gradient_nprs(self):
     #     """THIS DOESN'T WORK"""
     #
-    #     logarithmic = self.param.nprs['logarithmic'] #! NOT USED
-    #     exponent = self.param.nprs['exponent'] #! NOT USED
-    #     largeval = self.param.general['largeval']
+    #     logarithmic = self._frozen.nprs['logarithmic'] #! NOT USED
+    #     exponent = self._frozen.nprs['exponent'] #! NOT USED
+    #     largeval = self._frozen.general['largeval']
     #     array = self._array
     #
     #     #? these can probably be moved downstairs? doesnt seem to make a diff
@@ -664,7 +1857,7 @@ class RateAnalysis:
     def _build_barrier_penalty(self):
         """Generate penalty function"""
 
-        largeval = self.param.general.largeval
+        largeval = self._frozen.general.largeval
         array = self._array
         time = array.time
         constrained_index = array.constrained_index
@@ -702,15 +1895,15 @@ class RateAnalysis:
         array = self._array
         result = None
         # Use the appropriate algorithm
-        if hasattr(self, '_build_objective_' + self.param.method.method):
-            objective = getattr(self, '_build_objective_' + self.param.method.method)()
+        if hasattr(self, '_build_objective_' + self._frozen.method.method):
+            objective = getattr(self, '_build_objective_' + self._frozen.method.method)()
         else:
-            raise ValueError('No implementaion for method: {0}'.format(self.param.method.method))
+            raise ValueError('No implementaion for method: {0}'.format(self._frozen.method.method))
 
-        variable_tolerance = self.param.algorithm.variable_tolerance
-        function_tolerance = self.param.algorithm.function_tolerance
+        variable_tolerance = self._frozen.algorithm.variable_tolerance
+        function_tolerance = self._frozen.algorithm.function_tolerance
 
-        if self.param.barrier.manual == True:
+        if self._frozen.barrier.manual == True:
 
             # Adds a barrier_penalty to the objective function
             # to keep solution variables away from their boundaries.
@@ -720,13 +1913,13 @@ class RateAnalysis:
 
             barrier_penalty = self._build_barrier_penalty()
 
-            factor = self.param.barrier.initial_factor
+            factor = self._frozen.barrier.initial_factor
             kept_value = objective(array.variable)
 
             print('Barrier iterations: ', end ='', flush=True)
 
             self._flags_algorithm['iterations'] = None
-            for b in range(self.param.barrier.max_iterations):
+            for b in range(self._frozen.barrier.max_iterations):
 
                 print('{0}...'.format(b+1), end ='', flush=True)
                 # with open('out.txt', 'a') as f:
@@ -746,13 +1939,13 @@ class RateAnalysis:
 
                 tolerance = abs((new_value - kept_value)/new_value)
 
-                if tolerance < self.param.barrier.tolerance:
+                if tolerance < self._frozen.barrier.tolerance:
                     self._flags_algorithm['iterations'] = b
                     self._flags_algorithm['limit_broken'] = False
                     break
                 else:
                     kept_value = new_value
-                    factor *= self.param.barrier.multiplier
+                    factor *= self._frozen.barrier.multiplier
                     self._array.perturb()
                     # with open('out.txt', 'a') as f:
                     #     print('PERTURB CHECK: {}'.format(objective(array.variable)),file=f)
@@ -761,7 +1954,7 @@ class RateAnalysis:
                     raise RuntimeError('Variables outside constraints, aborting!')
 
             if self._flags_algorithm['iterations'] is None:
-                self._flags_algorithm['iterations'] = self.param.barrier.max_iterations
+                self._flags_algorithm['iterations'] = self._frozen.barrier.max_iterations
                 self._flags_algorithm['limit_broken'] = True
 
         else:
@@ -779,6 +1972,31 @@ class RateAnalysis:
     ##########################################################################
     ### Optimization
 
+    def _algorithm(self):
+        """Call the appropriate optimization method"""
+        if hasattr(self, '_algorithm_' + self._frozen.algorithm.algorithm):
+            return getattr(self, '_algorithm_' + self._frozen.algorithm.algorithm)()
+        else:
+            raise ValueError('No implementation for algorithm: {0}'.format(self._frozen.algorithm.algorithm))
+
+    def _solve(self, time=None):
+        """
+        Apply the selected algorithm once, starting from the given
+        node times instead of a random guess, if they are feasible.
+        If no times are given, optimize over all guesses as usual.
+        Time and rate arrays are left consistent with the solution.
+        Returns the pure objective value, without any barrier penalty.
+        """
+        array = self._array
+        if time is None:
+            self._optimize()
+        else:
+            array.warm(time)
+            self._algorithm()
+            self._flags = {'algorithm': self._flags_algorithm}
+        objective = getattr(self, '_build_objective_' + self._frozen.method.method)()
+        return objective(array.variable)
+
     def _optimize(self):
         """
         Applies the selected algorithm to the given array
@@ -791,8 +2009,8 @@ class RateAnalysis:
         kept_min = None
         kept_variable = None
         kept_rate = None
-        number_of_guesses = self.param.general.number_of_guesses
-        seed = self.param.general.seed
+        number_of_guesses = self._frozen.general.number_of_guesses
+        seed = self._frozen.general.seed
 
         if not seed > 0:
             seed = None
@@ -807,11 +2025,7 @@ class RateAnalysis:
 
             print('Guess {0}/{1}: \n{2}\n'.format(g+1, number_of_guesses, array.variable))
 
-            # Call the appropriate optimization method
-            if hasattr(self, '_algorithm_' + self.param.algorithm.algorithm):
-                new_min = getattr(self, '_algorithm_' + self.param.algorithm.algorithm)()
-            else:
-                raise ValueError('No implementation for algorithm: {0}'.format(self.param.algorithm.algorithm))
+            new_min = self._algorithm()
 
             print('\nLocal solution:\t {0:>12.4e}\n'.format(new_min))
 
@@ -837,17 +2051,611 @@ class RateAnalysis:
             limit = 'All implemented checks passed.'
         self.results.flags = {'warning':limit}
 
-    def run(self):
+    # Bump when the layout of stored results changes
+    _digest_version = 3
+
+    def digest(self):
+        """
+        Return a stable digest of everything that defines the results:
+        the tree topology, branch lengths, labels and constraints
+        in preorder, followed by all parameters including the seed.
+        """
+        nodes = []
+        for node in self.tree.preorder_node_iter():
+            nodes.append([node.label, node.edge_length,
+                node.fix, node.min, node.max, len(node._child_nodes)])
+        data = [self._digest_version, self.tree.label,
+            nodes, self._freeze().digest]
+        text = json.dumps(data, sort_keys=True, default=repr)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _snapshot(self):
+        """
+        Return the inputs of the last run as a pair: everything that
+        requires preparing the arrays anew (topology, labels, lengths
+        and parameters), followed by the calibrations of all nodes.
+        """
+        structure = []
+        calibrations = []
+        for node in self.tree.preorder_node_iter():
+            structure.append((node.label, node.edge_length,
+                len(node._child_nodes)))
+            calibrations.append((node.fix, node.min, node.max))
+        return ((structure, self._frozen.digest), calibrations)
+
+    def _recalibrate(self, previous, inputs):
+        """
+        If only calibrations changed since the previous run, update
+        the affected boundaries of the prepared arrays and optimize
+        once, starting from the previous solution if still feasible.
+        Returns False if the arrays must be prepared from scratch.
+        """
+        if previous is None or previous[0] != inputs[0]:
+            return False
+        array = self._array
+        time = array.time.copy()
+        if not array.recalibrate(self.tree):
+            return False
+        print('Calibrations changed, reusing prepared arrays.\n')
+        if array.warm(time):
+            seed = self._flags['seed']
+            value = self._algorithm()
+            self._flags = {'seed': seed, 'algorithm': self._flags_algorithm}
+            print('\nBest solution:\t {0:>12.4e}\n'.format(value))
+        else:
+            self._optimize()
+        return True
+
+    def run(self, cache=None):
         """
         This is the only thing the user needs to run.
+
+        When nothing changed since the previous run, its results are
+        returned as they are. When only node calibrations (fix, min, max)
+        changed, the prepared arrays are updated in place and optimization
+        starts once from the previous solution, so the results may differ
+        slightly from those of a fresh analysis. Prepared arrays are not
+        pickled, so this does not apply to copies sent to other processes,
+        such as the one run by the graphical interface.
+
+        If a cache.ResultCache is given, results are looked up by
+        digest() and returned without optimizing on a hit. Note that
+        runs with a zero seed are not reproducible, yet their stored
+        results are still reused.
+
+        Analyses created by from_arrays() return ArrayResults
+        and are never cached.
         """
+        if self._source is not None:
+            self._freeze()
+            self.results = self._run_arrays()
+            self._flag_results()
+            return self.results
         if self.tree is None:
             raise ValueError('No tree to optimize.')
         if len(self.tree.nodes()) < 2:
             raise ValueError('Tree must have at least one child.')
-        self._array.make(self.tree)
-        self._optimize()
-        tree = self._array.take()
-        self.results = RateAnalysisResults(tree)
+        self._freeze()
+        if cache is not None:
+            key = self.digest()
+            results = cache.get(key)
+            if results is not None:
+                self.results = results
+                return self.results
+        inputs = self._snapshot()
+        previous, self._inputs = self._inputs, None
+        if previous == inputs and self.results is not None:
+            self._inputs = inputs
+            return self.results
+        if not self._recalibrate(previous, inputs):
+            self._array.make(self.tree)
+            self._optimize()
+        self._inputs = inputs
+        self.results = RateAnalysisResults(array=self._array)
         self._flag_results()
+        if cache is not None:
+            cache.put(key, self.results)
         return self.results
+
+    def bootstrap(self, replicates=100, level=0.95, workers=None, warm=True):
+        """
+        Estimate age confidence intervals by parametric bootstrap.
+
+        Runs the analysis for a point estimate, then draws Poisson
+        resampled substitutions for all branches and replicates at once.
+        Each replicate reuses the prepared arrays and is optimized once,
+        starting from the point estimate pulled slightly inside its
+        boundaries, since the barrier slows down optimization from
+        points that lie on it. If `warm` is False, replicates are
+        optimized from random guesses as usual instead. Replicates are
+        solved on a pool of `workers` processes (all cores if None,
+        in-process if 1).
+
+        The logarithmic penalty is undefined for branches without
+        substitutions, so these are given half a substitution instead.
+
+        Percentile intervals for the given level are attached to the
+        returned results as `bootstrap`.
+        """
+        results = self.run()
+        array = self._array
+        generator = np.random.default_rng(self._flags['seed'])
+        subs = generator.poisson(array.subs[1:],
+            size=(replicates, array.n - 1)).astype(float)
+        if self._frozen.method.logarithmic:
+            zeros = subs == 0
+            if zeros.any():
+                print('WARNING: {0} of {1} replicates have branches without '
+                    'substitutions, using 0.5 instead.'.format(
+                    int(zeros.any(axis=1).sum()), replicates))
+                subs[zeros] = 0.5
+        seeds = self._replicate_seeds(replicates)
+        start = None
+        if warm:
+            random.seed(self._flags['seed'])
+            start = array.inside(array.time)
+        tasks = [({'subs': subs[i]}, start, seeds[i])
+            for i in range(replicates)]
+        solved = self._solve_replicates(tasks, workers)
+        results.bootstrap = results._distribution(solved, level)
+        return results
+
+    def monte_carlo(self, distributions, replicates=100, level=0.95, workers=None):
+        """
+        Propagate calibration uncertainty to node ages.
+
+        Distributions map node labels to dictionaries with any of the
+        keys 'fix', 'min' and 'max'. Each value is either a constant,
+        a tuple naming a numpy random generator distribution followed
+        by its arguments, or a callable taking a generator and a size:
+
+            {'LP': {'fix': ('normal', 450, 10)},
+             'ANGIO': {'min': ('uniform', 120, 140), 'max': 200}}
+
+        Runs the analysis for a point estimate, then samples all
+        calibrations at once. Only the boundaries of the prepared
+        arrays are updated for each replicate, which starts from the
+        point estimate whenever feasible. Replicates are solved on a
+        pool of `workers` processes (all cores if None, in-process if 1).
+
+        Age distributions are attached to the returned results
+        as `monte_carlo`, with one column of `ages` per node. Replicates
+        that could not be solved, for example when sampled calibrations
+        conflict, are counted as `failed` and left out. The error message
+        of each replicate is listed in `errors`, or None if solved.
+        """
+        results = self.run()
+        array = self._array
+        generator = np.random.default_rng(self._flags['seed'])
+        positions = {label: i for i, label in enumerate(array.label)}
+        samples = {'fix': {}, 'min': {}, 'max': {}}
+        for label, calibration in distributions.items():
+            if label not in positions:
+                raise ValueError('Calibrated node not found: {}'.format(label))
+            for key, distribution in calibration.items():
+                if key not in samples:
+                    raise ValueError('Unrecognised calibration: {}'.format(key))
+                if callable(distribution):
+                    sample = distribution(generator, replicates)
+                elif isinstance(distribution, tuple):
+                    name, *arguments = distribution
+                    sample = getattr(generator, name)(*arguments, size=replicates)
+                else:
+                    sample = [distribution] * replicates
+                samples[key][positions[label]] = sample
+
+        seeds = self._replicate_seeds(replicates)
+        start = array.time.copy()
+        tasks = []
+        for r in range(replicates):
+            updates = {}
+            for key, user in [('fix', array.user_fix),
+                    ('min', array.user_min), ('max', array.user_max)]:
+                values = list(user)
+                for i, sample in samples[key].items():
+                    values[i] = float(sample[r])
+                updates[key] = values
+            tasks.append((updates, start, seeds[r]))
+        solved = self._solve_replicates(tasks, workers)
+        results.monte_carlo = results._distribution(solved, level)
+        return results
+
+    def cross_validate(self, workers=None):
+        """
+        Fossil cross-validation (leave one calibration out).
+
+        Runs the analysis, then removes the constraints of each
+        calibrated internal node in turn and estimates ages again.
+        Only boundaries affected by the removed calibration are
+        recalculated and each refit starts from the full solution.
+        Refits are solved on a pool of `workers` processes
+        (all cores if None, in-process if 1).
+
+        The predicted age of each removed calibration is attached to
+        the returned results as `cross_validation`. Error is the distance
+        from the fixed age, or from the violated min/max boundary
+        (zero if predicted within them). Relative error is divided by
+        that reference age. Refits that could not be solved, for example
+        when the removed calibration was needed for divergence, have
+        their age and errors set to None and the reason as `Failure`,
+        which is None for the rest.
+        """
+        results = self.run()
+        array = self._array
+        calibrated = [i for i in range(array.n)
+            if array.children_index[i].size > 0 and
+            not all(x is None for x in
+                [array.user_fix[i], array.user_min[i], array.user_max[i]])]
+        seeds = self._replicate_seeds(len(calibrated))
+        start = array.time.copy()
+        tasks = []
+        for i, seed in zip(calibrated, seeds):
+            updates = {}
+            for key, user in [('fix', array.user_fix),
+                    ('min', array.user_min), ('max', array.user_max)]:
+                values = list(user)
+                values[i] = None
+                updates[key] = values
+            tasks.append((updates, start, seed))
+        solved = self._solve_replicates(tasks, workers)
+
+        table = {key: [] for key in ['Node', 'Fix', 'Min', 'Max',
+            'Age', 'Error', 'Relative', 'Failure']}
+        for i, (solution, failure) in zip(calibrated, solved):
+            fix = array.user_fix[i]
+            min = array.user_min[i]
+            max = array.user_max[i]
+            age, error, relative = None, None, None
+            if failure is None:
+                age = float(solution[1][i])
+                reference = fix
+                if fix is None:
+                    if min is not None and age < min:
+                        reference = min
+                    elif max is not None and age > max:
+                        reference = max
+                    else:
+                        reference = age
+                error = age - reference
+                relative = error / reference if reference else 0
+            for key, value in [('Node', array.label[i]), ('Fix', fix),
+                    ('Min', min), ('Max', max), ('Age', age),
+                    ('Error', error), ('Relative', relative),
+                    ('Failure', failure)]:
+                table[key].append(value)
+        table['n'] = len(calibrated)
+        results.cross_validation = table
+        return results
+
+    def profile_root(self, points=10, ages=None, workers=None):
+        """
+        Profile the objective over a range of fixed root ages.
+
+        Runs the analysis, then fixes the root at each of the given ages,
+        or else at evenly spaced points strictly between its low and
+        high boundaries, and estimates the remaining ages. The grid is
+        split in contiguous segments that are solved on a pool of
+        `workers` processes (all cores if None, in-process if 1).
+        Within each segment, every point starts from the solution of
+        its neighbour, scaled to the new root age.
+
+        The objective curve and the age table at each point are attached
+        to the returned results as `profile`. Points that could not be
+        solved have their objective set to None and their ages to nan.
+        """
+        results = self.run()
+        array = self._array
+        if ages is None:
+            low, high = array.low[0], array.high[0]
+            if high is None:
+                raise ValueError('Root age has no high boundary, please provide ages.')
+            if low == high:
+                raise ValueError('Root age is fixed, nothing to profile.')
+            ages = np.linspace(low, high, points + 2)[1:-1]
+        ages = [float(age) for age in ages]
+
+        seeds = self._replicate_seeds(len(ages))
+        tasks = []
+        # The fixed age replaces any root boundaries, which would
+        # otherwise put the root on its own barrier
+        lows = list(array.user_min)
+        highs = list(array.user_max)
+        lows[0] = highs[0] = None
+        for age, seed in zip(ages, seeds):
+            fix = list(array.user_fix)
+            fix[0] = age
+            tasks.append(({'fix': fix, 'min': lows, 'max': highs}, seed))
+        count = min(workers or os.cpu_count() or 1, len(tasks))
+        segments = [list(segment) for segment in
+            np.array_split(np.arange(len(tasks)), count)]
+        start = array.time.copy()
+        shared = (self._frozen, array.detach())
+        function = functools.partial(_solve_sequence, shared)
+        solved = map_replicates(function,
+            [([tasks[i] for i in segment], start) for segment in segments],
+            workers)
+        solutions = [solution for segment in solved
+            for solution, error in segment]
+
+        missing = np.full(array.n, np.nan)
+        results.profile = {
+            'n': len(ages),
+            'Root': ages,
+            'Objective': [None if solution is None else solution[0]
+                for solution in solutions],
+            'Node': results.table['Node'],
+            'ages': results._column([missing if solution is None
+                else solution[1] for solution in solutions]),
+            }
+        return results
+
+    def sweep(self, grid, workers=None):
+        """
+        Sensitivity analysis over a grid of parameter values.
+
+        Grid maps parameter names, given as 'category.field', to lists
+        of values, for example:
+
+            {'method.exponent': [1, 2], 'branch_length.nsites': [500, 1000]}
+
+        Every combination of values is analyzed, with the last parameter
+        varying fastest. Arrays are prepared once per combination of the
+        parameters that affect preparation (branch length and scalar
+        settings). The configurations of each such group are solved in
+        grid order: the first is optimized from random guesses, then each
+        of the rest starts from the solution of the one before it. Groups
+        are solved on a pool of `workers` processes (all cores if None,
+        in-process if 1).
+
+        Returns a tidy table with one row per configuration and node,
+        holding the parameter values, the node label and age, as well
+        as the objective value of the configuration. Configurations that
+        could not be solved have their age and objective set to None
+        and the reason as `Failure`, which is None for the rest.
+        """
+        if self.tree is None:
+            raise ValueError('No tree to optimize.')
+        keys = list(grid.keys())
+        for key in keys:
+            category, _, field = key.partition('.')
+            if category not in self.param or field not in self.param[category]:
+                raise ValueError('Unrecognised parameter: {}'.format(key))
+        configurations = [dict(zip(keys, values))
+            for values in itertools.product(*grid.values())]
+        prepared = [key for key in keys if key == 'general.scalar'
+            or key.startswith('branch_length.')]
+
+        # Group configurations sharing the same prepared arrays
+        groups = {}
+        for index, configuration in enumerate(configurations):
+            group = tuple(configuration[key] for key in prepared)
+            groups.setdefault(group, []).append(index)
+        shared = {}
+        rows = {}
+        for group, indexes in groups.items():
+            param = copy.deepcopy(self.param)
+            for key, value in configurations[indexes[0]].items():
+                _set_param(param, key, value)
+            array = Array(param)
+            array.make(self.tree)
+            shared[group] = (param, array.detach())
+            rows[group] = array.rows()
+
+        # Each group is a sequence, starting from random guesses
+        items = []
+        for group, indexes in groups.items():
+            sequence = []
+            for index in indexes:
+                settings = {key: value for key, value
+                    in configurations[index].items() if key not in prepared}
+                sequence.append(({'param': settings}, None))
+            items.append((shared[group], (sequence, None)))
+        solved = [None] * len(configurations)
+        for indexes, sequence in zip(groups.values(),
+                map_replicates(_solve_shared_sequence, items, workers)):
+            for index, pair in zip(indexes, sequence):
+                solved[index] = pair
+
+        table = {key: [] for key in
+            keys + ['Node', 'Age', 'Objective', 'Failure']}
+        for configuration, (solution, failure) in zip(configurations, solved):
+            group = tuple(configuration[key] for key in prepared)
+            for label, index in rows[group]:
+                for key in keys:
+                    table[key].append(configuration[key])
+                table['Node'].append(label)
+                table['Failure'].append(failure)
+                if failure is not None:
+                    table['Age'].append(None)
+                    table['Objective'].append(None)
+                    continue
+                age = 0 if index is None else float(solution[1][index])
+                table['Age'].append(age)
+                table['Objective'].append(float(solution[0]))
+        table['n'] = len(table['Node'])
+        table['configurations'] = len(configurations)
+        return table
+
+
+    def run_stacked(self, lengths, chunk=64, workers=None):
+        """
+        Analyze many sets of branch lengths on the topology of the tree.
+
+        Lengths is a (T, m) matrix, where each row holds the branch
+        lengths of all m nodes of the tree in preorder sequence
+        (the length of the root is ignored). Calibrations, parameters
+        and collapsed branches are taken from the tree itself.
+
+        Arrays are prepared only once, then all rows are optimized
+        together by a Stack, in chunks of the given number of rows.
+        Each row is tried with as many random guesses as set in
+        the parameters, keeping the best. Chunks are solved on a pool
+        of `workers` processes (all cores if None, in-process if 1).
+
+        The stacked solver only implements the NPRS method, with its
+        exponent and logarithmic settings. It replaces the Powell
+        algorithm and its barrier by L-BFGS over feasible times, so the
+        barrier parameters are ignored and Powell tolerances are used
+        as L-BFGS tolerances. Raises ValueError for any other method
+        or algorithm.
+
+        Returns a table with one column per node, holding the
+        (T, columns) matrices of ages and rates, as well as the
+        objective value for each row.
+        """
+        if self.tree is None:
+            raise ValueError('No tree to optimize.')
+        lengths = np.array(lengths, dtype=float, ndmin=2)
+        if lengths.shape[1] != len(self.tree.nodes()):
+            raise ValueError('Expected {0} branch lengths per row, got {1}.'.
+                format(len(self.tree.nodes()), lengths.shape[1]))
+        array = self._array
+        self._inputs = None
+        frozen = self._freeze()
+        if frozen.method.method != 'nprs':
+            raise ValueError('Stacked analysis does not implement method: {}'.
+                format(frozen.method.method))
+        if frozen.algorithm.algorithm != 'powell':
+            raise ValueError('Stacked analysis does not implement algorithm: {}'.
+                format(frozen.algorithm.algorithm))
+        print('Stacked rows are optimized by L-BFGS instead of Powell, '
+            'barrier parameters are ignored.\n')
+        array.make(self.tree)
+        stack = Stack(array, frozen)
+
+        # Calculate substitutions as in TreePlus.calc_subs()
+        subs = np.maximum(lengths[:, array.position], 0)
+        subs *= array._multiplier
+        if frozen.branch_length.round:
+            subs = np.round(subs)
+        subs[:, 0] = np.nan
+
+        # Each guess is stacked as an extra row
+        seed = frozen.general.seed
+        random.seed(seed if seed > 0 else None)
+        guesses = frozen.general.number_of_guesses
+        starts = []
+        for g in range(guesses * len(subs)):
+            array.guess()
+            starts.append(array.time.copy())
+        starts = np.array(starts)
+        subs = np.repeat(subs, guesses, axis=0)
+
+        size = chunk * guesses
+        tasks = [(subs[k:k+size], starts[k:k+size])
+            for k in range(0, len(subs), size)]
+        solved = map_replicates(functools.partial(_solve_stack, stack),
+            tasks, workers)
+        time = np.concatenate([solution[0] for solution in solved])
+        rate = np.concatenate([solution[1] for solution in solved])
+        w = np.concatenate([solution[2] for solution in solved])
+
+        # Keep the best guess for each row
+        best = np.nanargmin(w.reshape(-1, guesses), axis=1)
+        best += np.arange(len(best)) * guesses
+        rows = array.rows()
+        columns = [index for label, index in rows]
+        table = {
+            'n': len(rows),
+            'trees': len(best),
+            'Node': [label for label, index in rows],
+            'Age': np.zeros((len(best), len(rows))),
+            'Rate': np.zeros((len(best), len(rows))),
+            'Objective': w[best],
+            }
+        for column, index in enumerate(columns):
+            if index is not None:
+                table['Age'][:, column] = time[best, index]
+                table['Rate'][:, column] = rate[best, index] / array._multiplier
+        return table
+
+
+    ##########################################################################
+    ### Replicates
+
+    def _replicate_seeds(self, count):
+        """Derive one random seed per replicate from the analysis seed"""
+        seed = self._flags['seed']
+        if seed is None:
+            return [None] * count
+        return [seed + i + 1 for i in range(count)]
+
+    def _solve_replicates(self, tasks, workers=None):
+        """
+        Solve a list of (updates, start, seed) tasks against
+        the prepared array, see _solve_replicate() for details.
+        """
+        shared = (self._frozen, self._array.detach())
+        function = functools.partial(_solve_replicate, shared)
+        return map_replicates(function, tasks, workers)
+
+
+def _solve_replicate(shared, task):
+    """
+    Solve a single replicate against shared prepared arrays.
+    The task holds array updates, the starting node times and a seed.
+    Updates may include 'param', a dictionary of parameter values
+    keyed by 'category.field'. If no start is given, the replicate
+    is optimized from random guesses as usual.
+    Returns a solution tuple of (objective, time, rate, limit_broken)
+    followed by None, or else None followed by the error message
+    if the replicate could not be solved.
+    Defined at module level so it can be sent to worker processes.
+    """
+    param, array = shared
+    updates, start, seed = task
+    updates = dict(updates)
+    settings = updates.pop('param', None)
+    analysis = RateAnalysis()
+    analysis._array = array.detach()
+    if settings:
+        param = copy.deepcopy(param)
+        for key, value in settings.items():
+            _set_param(param, key, value)
+    analysis.param = param
+    analysis._freeze()
+    random.seed(seed)
+    try:
+        analysis._array.update(**updates)
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            value = analysis._solve(start)
+    except (ValueError, RuntimeError) as exception:
+        return None, str(exception)
+    array = analysis._array
+    limit = analysis._flags['algorithm'].get('limit_broken', False)
+    return (value, array.time, array.rate, limit), None
+
+@functools.lru_cache(maxsize=None)
+def _default_param():
+    """Frozen default parameters, shared by all analyses"""
+    return param.ParamList(params.params).freeze()
+
+def _solve_shared_sequence(item):
+    """Solve a (shared, task) pair, see _solve_sequence()"""
+    return _solve_sequence(*item)
+
+def _set_param(param, key, value):
+    """Set parameter value by its 'category.field' name"""
+    category, _, field = key.partition('.')
+    if category not in param or field not in param[category]:
+        raise ValueError('Unrecognised parameter: {}'.format(key))
+    setattr(param[category], field, value)
+
+def _solve_stack(shared, task):
+    """Solve a chunk of stacked (subs, start) rows, see Stack.solve()"""
+    return shared.solve(*task)
+
+def _solve_sequence(shared, task):
+    """
+    Solve a sequence of (updates, seed) replicates, each starting
+    from the solution of the previous one, see _solve_replicate().
+    """
+    sequence, start = task
+    solved = []
+    for updates, seed in sequence:
+        solution, error = _solve_replicate(shared, (updates, start, seed))
+        if error is None:
+            start = solution[1]
+        solved.append((solution, error))
+    return solved
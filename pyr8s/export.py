@@ -0,0 +1,152 @@
+#-----------------------------------------------------------------------------
+# Pyr8s - Divergence Time Estimation
+# Copyright (C) 2021  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#-----------------------------------------------------------------------------
+
+
+"""
+Write the results of many analyses to shared output files.
+
+Chronograms and ratograms are appended to a single NEXUS or Newick file
+each, and table rows to a single tab separated file, as results arrive.
+Text is buffered in memory and written in bulk. Results may be added out
+of order by giving their index, they are written in input order.
+
+Example:
+with ResultsWriter(chronogram='chronograms.nex', table='ages.tsv') as writer:
+    for results in parse.batch('posterior.nex'):
+        writer.add(results)
+"""
+
+import io
+
+import numpy as np
+
+
+def write_table(output, results, tree=None):
+    """
+    Write the results table as tab separated rows of node, age and rate
+    to the given text file handle. If `tree` is given, it is written
+    as an extra first column.
+    """
+    table = results.table
+    prefix = '' if tree is None else str(tree) + '\t'
+    output.write(''.join(
+        '{0}{1}\t{2}\t{3}\n'.format(prefix, node, age, rate)
+        for node, age, rate in zip(table['Node'],
+            np.asarray(table['Age'], dtype=float).tolist(),
+            np.asarray(table['Rate'], dtype=float).tolist())))
+
+
+class ResultsWriter:
+    """
+    Append results to the given output files, any of which may be None.
+    Trees are written as NEXUS unless `schema` is 'newick', with branch
+    lengths rounded to `precision` significant digits if given.
+    Buffered text is written once it exceeds `buffer` characters.
+    Results given as None (failed analyses) are skipped, but still
+    count towards the input order.
+    """
+
+    def __init__(self, chronogram=None, ratogram=None, table=None,
+            schema='nexus', precision=None, buffer=2**20, start=0):
+        if schema not in ('nexus', 'newick'):
+            raise ValueError('Unrecognised schema: {}'.format(schema))
+        self.schema = schema
+        self.precision = precision
+        self.buffer = buffer
+        self.written = 0
+        self._next = start
+        self._following = start
+        self._pending = {}
+        self._outputs = {}
+        for kind, path in [('chronogram', chronogram),
+                ('ratogram', ratogram), ('table', table)]:
+            if path is not None:
+                self._outputs[kind] = [open(path, 'w'), io.StringIO()]
+        for kind, (file, text) in self._outputs.items():
+            if kind == 'table':
+                text.write('Tree\tNode\tAge\tRate\n')
+            elif schema == 'nexus':
+                text.write('#NEXUS\n\nBEGIN TREES;\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, et, ev, tr):
+        self.close()
+
+    def add(self, results, index=None):
+        """
+        Add results for the tree of given input index, or the one
+        following the highest added so far if None. Results are kept
+        back until all trees before them have been added.
+        """
+        if index is None:
+            index = self._following
+        if index < self._next or index in self._pending:
+            raise ValueError('Tree {} was already added.'.format(index))
+        self._following = max(self._following, index + 1)
+        self._pending[index] = results
+        while self._next in self._pending:
+            self._write(self._next, self._pending.pop(self._next))
+            self._next += 1
+        self._flush(self.buffer)
+
+    def _write(self, index, results):
+        """Append results to the buffers"""
+        if results is None:
+            return
+        for kind, (file, text) in self._outputs.items():
+            if kind == 'table':
+                write_table(text, results, index)
+                continue
+            if self.schema == 'nexus':
+                text.write('\tTREE tree_{} = '.format(index))
+            if kind == 'chronogram':
+                results.write_chronogram(text, self.precision)
+            else:
+                results.write_ratogram(text, self.precision)
+        self.written += 1
+
+    def _flush(self, limit=0):
+        """Write buffers larger than limit to their files"""
+        for output in self._outputs.values():
+            file, text = output
+            if text.tell() > limit:
+                file.write(text.getvalue())
+                output[1] = io.StringIO()
+
+    def flush(self):
+        """Write all buffered text, results still kept back stay pending"""
+        self._flush()
+        for file, text in self._outputs.values():
+            file.flush()
+
+    def close(self):
+        """Write any results still pending in order and close all files"""
+        if self._pending:
+            print('WARNING: Missing results for trees before: {}'.format(
+                ', '.join(str(index) for index in sorted(self._pending))))
+        for index in sorted(self._pending):
+            self._write(index, self._pending.pop(index))
+        for kind, (file, text) in self._outputs.items():
+            if kind != 'table' and self.schema == 'nexus':
+                text.write('END;\n')
+        self._flush()
+        for file, text in self._outputs.values():
+            file.close()
+        self._outputs = {}
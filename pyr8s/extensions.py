@@ -21,11 +21,96 @@
 Extend dendropy trees with utility functions and attributes.
 """
 
+import copy
+import gc
+
 import dendropy
+import numpy as np
 
 ##############################################################################
 ### Utility function definitions
 
+def tree_from_arrays(parent, length, label, order):
+    """
+    Build a dendropy tree given the parent index of each node (-1 for
+    root), branch lengths and labels, creating nodes in the given
+    preorder. Leaf labels become taxa, as when reading newick.
+    Returns the tree and a list of its nodes in the given order.
+    """
+    tree = dendropy.Tree(is_rooted=True)
+    leaf = [True] * len(parent)
+    for up in parent:
+        if up >= 0:
+            leaf[up] = False
+    nodes = [None] * len(parent)
+    for i in order:
+        if parent[i] < 0:
+            node = tree.seed_node
+        else:
+            node = nodes[parent[i]].new_child()
+        # Missing lengths may be given as None or nan
+        value = length[i]
+        if value is not None and value == value:
+            node.edge_length = value
+        if leaf[i] and label[i] is not None:
+            node.taxon = tree.taxon_namespace.new_taxon(label[i])
+        else:
+            node.label = label[i]
+        nodes[i] = node
+    return tree, nodes
+
+def copy_tree(tree):
+    """
+    Return a structural copy of a dendropy tree, sharing its taxon
+    namespace and taxa like clone(depth=1), but much faster. Node and
+    edge attributes are copied shallowly, including those of NodePlus,
+    so node and tree classes are kept. Annotations are deep copied
+    where present.
+    """
+    # Collection is triggered repeatedly by so many new objects
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _copy_tree(tree)
+    finally:
+        if enabled:
+            gc.enable()
+
+def _copy_tree(tree):
+    other = tree.__class__.__new__(tree.__class__)
+    other.__dict__.update(tree.__dict__)
+    other.comments = list(tree.comments)
+    other._split_bitmask_edge_map = None
+    other._bipartition_edge_map = None
+    other.bipartition_encoding = None
+    # Label and clade indexes refer to nodes of the given tree
+    for key in ('_labels', '_clades'):
+        if key in other.__dict__:
+            other.__dict__[key] = None
+    if '_annotations' in tree.__dict__:
+        other._annotations = copy.deepcopy(tree._annotations)
+    copies = {None: None}
+    for node in tree.preorder_node_iter():
+        new = node.__class__.__new__(node.__class__)
+        new.__dict__.update(node.__dict__)
+        new.comments = list(node.comments)
+        if '_annotations' in node.__dict__:
+            new._annotations = copy.deepcopy(node._annotations)
+        edge = node._edge.__class__.__new__(node._edge.__class__)
+        edge.__dict__.update(node._edge.__dict__)
+        edge.comments = list(edge.comments)
+        edge._head_node = new
+        edge._bipartition = None
+        new._edge = edge
+        new._child_nodes = []
+        parent = copies[node._parent_node]
+        new._parent_node = parent
+        if parent is not None:
+            parent._child_nodes.append(new)
+        copies[node] = new
+    other._seed_node = copies[tree.seed_node]
+    return other
+
 class NodePlus(dendropy.Node):
 
     decorator = '[{}]'
@@ -49,6 +134,16 @@ class NodePlus(dendropy.Node):
         self.__label = value
         self.__label_frozen = None
 
+    @property
+    def plain_label(self):
+        """Label as written by dendropy: taxon label and the label given"""
+        parts = []
+        if self.taxon is not None and self.taxon.label is not None:
+            parts.append(str(self.taxon.label))
+        if self.__label:
+            parts.append(str(self.__label))
+        return ' '.join(parts) or None
+
     @classmethod
     def extend(cls, node):
         """Convert from dendropy.Node"""
@@ -117,6 +212,9 @@ class NodePlus(dendropy.Node):
 class TreePlus(dendropy.Tree):
 
     nameless = 'Nameless'
+    # Trees pickled before indexing was added have no instance indexes
+    _labels = None
+    _clades = None
 
     @property
     def label(self):
@@ -134,6 +232,7 @@ class TreePlus(dendropy.Tree):
         """Convert from dendropy.Tree"""
         tree.__label = tree.label
         tree.__class__ = cls
+        tree.forget_index()
         for node in tree.nodes():
             NodePlus.extend(node)
 
@@ -145,6 +244,19 @@ class TreePlus(dendropy.Tree):
         tree.__class__ = dendropy.Tree
         tree.label = tree.__label
         del tree.__label
+        tree.__dict__.pop('_labels', None)
+        tree.__dict__.pop('_clades', None)
+
+    @classmethod
+    def from_arrays(cls, parent, length, label, order):
+        """
+        Build an extended tree from arrays, see tree_from_arrays().
+        Returns the tree and a list of its nodes in the given order.
+        """
+        tree, nodes = tree_from_arrays(parent, length, label, order)
+        cls.extend(tree)
+        tree.index()
+        return tree, nodes
 
     def collapse(self, throw=False):
         """
@@ -167,12 +279,14 @@ class TreePlus(dendropy.Tree):
         """
         Remove edges with zero length. Must be called after calc_subs().
         Return a list with any constrained nodes that were pruned.
+        Runs in linear time, even for huge polytomies.
         """
-        remove = []
+        remove = set()
         collapsed_constraints = []
 
         # Children before parent, ensures removal is done in proper order
-        for node in self.postorder_node_iter_noroot():
+        postorder = list(self.postorder_node_iter())
+        for node in postorder[:-1]:
             if node.is_terminal_zero():
                 parent = node.parent_node
                 if node.fix != 0:
@@ -181,32 +295,52 @@ class TreePlus(dendropy.Tree):
                 elif parent.min is None:
                     parent.min = 0
             elif node.subs == 0:
-                remove.append(node)
+                remove.add(node)
                 if any([node.fix, node.min, node.max]):
                     if not node.all_children_terminal_zero():
                         collapsed_constraints.append(node)
 
-        # Remove the nodes, parents inherit children
-        for node in remove:
+        if not remove:
+            return collapsed_constraints
+
+        # Remove the nodes, parents inherit children. Each node is visited
+        # after its children, which have already inherited their own.
+        for node in postorder:
+            children = []
+            inherited = False
+            for child in node._child_nodes:
+                if child in remove:
+                    children.extend(child._child_nodes)
+                    inherited = True
+                else:
+                    children.append(child)
+            if inherited:
+                for child in children:
+                    child._parent_node = node
+                node._child_nodes = children
+            if node not in remove:
+                continue
             # Constraints passed to parents and children
             if node.fix is not None:
                 node.max = node.fix
                 node.min = node.fix
-            parent = node.parent_node
-            for child in node.child_node_reversed_iter():
-                parent.add_child_after(node, child)
-                if node.max is not None:
+            if node.max is not None:
+                for child in children:
                     if child.max is not None:
                         child.max = min(child.max, node.max)
                     if child.max is None and child.fix is None:
                         child.max = node.max
+            parent = node.parent_node
             if node.min is not None:
                 if parent.min is not None:
                     parent.min = max(parent.min, node.min)
                 if parent.min is None and parent.fix is None:
                     parent.min = node.min
-            parent.remove_child(node)
 
+        for node in remove:
+            node._parent_node = None
+            node.edge.tail_node = None
+        self.forget_index()
         return collapsed_constraints
 
     def calc_subs(self, multiplier, doround):
@@ -239,6 +373,94 @@ class TreePlus(dendropy.Tree):
         for count, node in enumerate(self.preorder_node_iter(filter_fn)):
             node.index = count
         self._indexed = True
+        self.forget_index()
+
+    def forget_index(self):
+        """
+        Forget the label and clade indexes, must be called after
+        changing tree topology or taxon labels by other means than
+        index(), collapse() and label_node().
+        """
+        self._labels = None
+        self._clades = None
+
+    def _label_index(self):
+        """Map upper-cased taxon labels to the first such node in preorder"""
+        if self._labels is None:
+            labels = {}
+            for node in self.preorder_node_iter():
+                if node.taxon is not None and node.taxon.label is not None:
+                    labels.setdefault(node.taxon.label.upper(), node)
+            self._labels = labels
+        return self._labels
+
+    def _clade_index(self):
+        """
+        Nodes in preorder, with their positions, parent positions and
+        a sparse table of the shallowest node over every preorder range
+        of length a power of two. The most recent common ancestor of two
+        nodes is the parent of the shallowest node after the first one,
+        up to and including the second one.
+        """
+        if self._clades is None:
+            nodes = list(self.preorder_node_iter())
+            position = {node: k for k, node in enumerate(nodes)}
+            parent = np.full(len(nodes), -1, dtype=int)
+            depth = np.zeros(len(nodes), dtype=int)
+            for k, node in enumerate(nodes[1:], 1):
+                parent[k] = position[node._parent_node]
+                depth[k] = depth[parent[k]] + 1
+            table = [np.arange(len(nodes))]
+            width = 1
+            while 2 * width <= len(nodes):
+                last = table[-1]
+                left = last[:len(nodes) - 2 * width + 1]
+                right = last[width:len(nodes) - width + 1]
+                table.append(np.where(depth[right] < depth[left], right, left))
+                width *= 2
+            self._clades = (nodes, position, parent, depth, table)
+        return self._clades
+
+    def find_taxon_node(self, label):
+        """
+        Return the first node in preorder whose taxon label matches
+        ignoring case, or None. Uses a hash index built once.
+        """
+        node = self._label_index().get(label.upper())
+        if node is not None and node.taxon is not None \
+                and node.taxon.label is not None \
+                and node.taxon.label.upper() == label.upper():
+            return node
+        return None
+
+    def common_ancestor(self, nodes):
+        """Most recent common ancestor of given nodes in constant time per node"""
+        tree_nodes, position, parent, depth, table = self._clade_index()
+        positions = [position[node] for node in nodes]
+        first, last = min(positions), max(positions)
+        if first == last:
+            return tree_nodes[first]
+        # Shallowest node in preorder range (first, last]
+        level = (last - first).bit_length() - 1
+        left = table[level][first + 1]
+        right = table[level][last - (1 << level) + 1]
+        shallowest = right if depth[right] < depth[left] else left
+        return tree_nodes[parent[shallowest]]
+
+    def clade_mrca(self, labels):
+        """
+        Most recent common ancestor of the nodes with given taxon labels,
+        ignoring case. Raises KeyError if any label is not found.
+        """
+        nodes = []
+        for label in labels:
+            node = self.find_taxon_node(label)
+            if node is None:
+                raise KeyError("Not all labels matched to taxa")
+            nodes.append(node)
+        if not nodes:
+            raise ValueError("No taxa matching criteria found")
+        return self.common_ancestor(nodes)
 
     def order(self, filter_fn=None):
         """
@@ -271,11 +493,29 @@ class TreePlus(dendropy.Tree):
         If a single node is given, it is renamed
         Create the taxon if needed.
         """
-        ancestor = self.mrca(taxon_labels=labels)
-        if ancestor.taxon == None:
-            ancestor.taxon = self.taxon_namespace.new_taxon(str(mrca))
-        ancestor.taxon.label = str(mrca)
-        ancestor.label = str(mrca)
+        ancestor = self.clade_mrca(labels)
+        self.label_node(ancestor, mrca)
+
+    def label_node(self, node, label):
+        """Rename given node, creating the taxon if needed"""
+        if node.taxon == None:
+            node.taxon = self.taxon_namespace.new_taxon(str(label))
+        elif self._labels is not None and node.taxon.label is not None:
+            if self._labels.get(node.taxon.label.upper()) is node:
+                # Another node may carry the old label
+                self._labels = None
+        node.taxon.label = str(label)
+        node.label = str(label)
+        if self._labels is not None:
+            key = node.taxon.label.upper()
+            other = self._labels.get(key)
+            if other is None:
+                self._labels[key] = node
+            elif other is not node:
+                # Keep whichever comes first in preorder
+                position = self._clade_index()[1]
+                if position[node] < position[other]:
+                    self._labels[key] = node
 
     def persite(self, nsites, round_flag=False):
         """
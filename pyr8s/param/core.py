@@ -38,11 +38,17 @@ Set the value of a specific field:
 
 Access field documentation:
 >>> param.general['scalar'].doc
+
+Take an immutable snapshot, with a stable digest of all values:
+>>> frozen = param.freeze()
+>>> frozen.general.scalar, frozen.digest
 """
 
 # Default dict is ordered in Python3.7+, but we use Python3.6
 from collections import OrderedDict
+import hashlib
 import json
+import weakref
 
 class ParamField():
     """Information about this parameter"""
@@ -158,6 +164,12 @@ class ParamList(OrderedDict):
                     state[4])
         return newstate
 
+    def freeze(self):
+        """Return an immutable snapshot of all values, see FrozenParamList"""
+        return FrozenParamList.create([(category,
+            list(self[category].as_dictionary().items()))
+            for category in self.keys()])
+
     def as_dictionary(self):
         """Return key/value pairs for all categories"""
         dictionary = {}
@@ -169,3 +181,136 @@ class ParamList(OrderedDict):
                 else:
                     dictionary[param] = category_dictionary[param]
         return dictionary
+
+
+class _Frozen:
+    """
+    Immutable mapping with a slot for each key, so that attribute access
+    is as cheap as possible. A subclass is created once for every tuple
+    of keys and shared by all instances with that layout.
+    """
+    __slots__ = ()
+    _keys = ()
+
+    @classmethod
+    def _layout(cls, keys):
+        layout = cls._layouts.get(keys)
+        if layout is None:
+            layout = type(cls.__name__, (cls,),
+                {'__slots__': keys, '_keys': keys, '__module__': cls.__module__})
+            cls._layouts[keys] = layout
+        return layout
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Frozen parameters cannot be changed: {}'.
+            format(name))
+
+    def __delattr__(self, name):
+        raise AttributeError('Frozen parameters cannot be changed: {}'.
+            format(name))
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        if self._keys:
+            m = max(map(len, self._keys)) + 1
+            return '\n'.join([k.rjust(m) + ': ' + repr(getattr(self, k))
+                              for k in sorted(self._keys)])
+        else:
+            return self.__class__.__name__ + "()"
+
+    def __dir__(self):
+        return list(self._keys)
+
+    def keys(self):
+        return self._keys
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self._keys]
+
+
+class FrozenCategory(_Frozen):
+    """Immutable values of a category, accessed as attributes."""
+    __slots__ = ()
+    _layouts = {}
+
+    @classmethod
+    def create(cls, items):
+        """Create from a list of (field, value) pairs"""
+        self = object.__new__(cls._layout(tuple(key for key, _ in items)))
+        for key, value in items:
+            object.__setattr__(self, key, value)
+        return self
+
+    def as_dictionary(self):
+        """Return key/value pairs of category parameters"""
+        return dict(self.items())
+
+
+class FrozenParamList(_Frozen):
+    """
+    Immutable snapshot of a ParamList, created by ParamList.freeze().
+    Values are read just like ParamList values: param.general.seed
+
+    A stable digest of all values is computed once on creation and used
+    for hashing and equality. Snapshots of equal values are shared for
+    as long as any of them is alive, so creating many analyses with the
+    same parameters costs a single snapshot.
+    """
+    __slots__ = ('digest', '_hash', '__weakref__')
+    _layouts = {}
+    _interned = weakref.WeakValueDictionary()
+
+    @classmethod
+    def create(cls, items):
+        """Create from a list of (category, [(field, value), ...]) pairs"""
+        text = json.dumps(items, default=repr)
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        self = cls._interned.get(digest)
+        if self is not None:
+            return self
+        self = object.__new__(cls._layout(tuple(key for key, _ in items)))
+        for key, fields in items:
+            object.__setattr__(self, key, FrozenCategory.create(fields))
+        object.__setattr__(self, 'digest', digest)
+        object.__setattr__(self, '_hash', int(digest[:16], 16))
+        cls._interned[digest] = self
+        return self
+
+    def __reduce__(self):
+        return (FrozenParamList.create, ([(key, getattr(self, key).items())
+            for key in self._keys],))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenParamList):
+            return NotImplemented
+        return self.digest == other.digest
+
+    def freeze(self):
+        """Already frozen"""
+        return self
+
+    def as_dictionary(self):
+        """Return key/value pairs for all categories"""
+        dictionary = {}
+        for category in self._keys:
+            for param, value in getattr(self, category).items():
+                if param in dictionary:
+                    raise RuntimeError("Duplicate key: "+param)
+                dictionary[param] = value
+        return dictionary
@@ -23,7 +23,13 @@ Is less of a mess right now.
 """
 
 import dendropy
+import io
+import os
+import contextlib
+import functools
+import sys
 from . import core
+from . import treefile
 
 _SEPARATOR = '-' * 50
 
@@ -34,8 +40,12 @@ def parse_value(tokenizer):
     token = tokenizer.require_next_token_ucase()
     return token
 
-def parse_rates(tokenizer, analysis, run=False):
-    results = None
+def compile_rates(tokenizer):
+    """
+    Read the commands of a RATES block up to its end and return them
+    as a RatesProgram, without applying them to any tree.
+    """
+    commands = []
     tokenizer.skip_to_semicolon()
     token = tokenizer.next_token_ucase()
     while not (token == 'END' or token == 'ENDBLOCK') \
@@ -43,44 +53,31 @@ def parse_rates(tokenizer, analysis, run=False):
         and not token==None:
         if token == 'BLFORMAT':
             token = tokenizer.require_next_token_ucase()
+            options = []
             format = None
             nsites = None
             while not (token == ';'):
                 if token == 'NSITES':
-                    token = parse_value(tokenizer)
-                    print('* NSITES: {0}'.format(token))
-                    nsites = int(token)
+                    value = parse_value(tokenizer)
+                    nsites = int(value)
                 elif token == 'LENGTHS':
-                    token = parse_value(tokenizer)
-                    print('* LENGTHS: {0}'.format(token))
-                    if token == 'TOTAL':
-                        format = 'total'
-                    elif token == 'PERSITE':
-                        format = 'persite'
-                    elif token == 'GUESS':
-                        format = 'guess'
-                    else:
-                        raise ValueError("BLFORMAT.LENGTHS: Unrecognised vale: '{}'".format(token))
+                    value = parse_value(tokenizer)
+                    if value not in ('TOTAL', 'PERSITE', 'GUESS'):
+                        raise ValueError("BLFORMAT.LENGTHS: Unrecognised vale: '{}'".format(value))
+                    format = value.lower()
                 elif token == 'ROUND':
-                    token = parse_value(tokenizer)
-                    print('* ROUND: {0}'.format(token))
-                    if token == 'NO':
-                        analysis.param.branch_length.round = False
-                    elif token == 'YES':
-                        analysis.param.branch_length.round = True
-                    else:
-                        raise ValueError("BLFORMAT.ROUND: Unrecognised vale: '{}'".format(token))
+                    value = parse_value(tokenizer)
+                    if value not in ('NO', 'YES'):
+                        raise ValueError("BLFORMAT.ROUND: Unrecognised vale: '{}'".format(value))
                 elif token == 'ULTRAMETRIC':
-                    token = parse_value(tokenizer)
-                    print('* ULTRAMETRIC: {0}'.format(token))
-                    if token == 'NO':
-                        pass
-                    elif token == 'YES':
+                    value = parse_value(tokenizer)
+                    if value == 'YES':
                         raise ValueError("BLFORMAT.ULTRAMETRIC: YES is not an option")
-                    else:
-                        raise ValueError("BLFORMAT.ULTRAMETRIC: Unrecognised vale: '{}'".format(token))
+                    elif value != 'NO':
+                        raise ValueError("BLFORMAT.ULTRAMETRIC: Unrecognised vale: '{}'".format(value))
                 else:
                     raise ValueError("BLFORMAT: Unrecognised option: '{}'".format(token))
+                options.append((token, value))
                 token = tokenizer.require_next_token_ucase()
             if format is None:
                 raise ValueError("BLFORMAT: Expected parameter LENGTHS not given.")
@@ -90,15 +87,10 @@ def parse_rates(tokenizer, analysis, run=False):
             else:
                 if nsites is not None:
                     raise ValueError("BLFORMAT: Unexpected parameter NSITES.")
-            analysis.param.branch_length.format = format
-            analysis.param.branch_length.nsites = nsites
-
-        elif token == 'COLLAPSE':
-            print('* COLLAPSE: automatic')
-            tokenizer.skip_to_semicolon()
-        elif token == 'PRUNE':
-            print('* PRUNE: automatic')
+            commands.append(('BLFORMAT', tuple(options)))
+        elif token == 'COLLAPSE' or token == 'PRUNE':
             tokenizer.skip_to_semicolon()
+            commands.append((token, ()))
         elif token == 'MRCA':
             ancestor = tokenizer.require_next_token()
             children = []
@@ -108,268 +100,452 @@ def parse_rates(tokenizer, analysis, run=False):
                 and not token==None:
                 children.append(token)
                 token = tokenizer.require_next_token()
-            try:
-                analysis.tree.label_mrca(ancestor, children)
-            except KeyError:
-                raise ValueError("MRCA: Invalid children: {}".format(children))
-            print("* MRCA: '{0}' of {1}.".format(ancestor,children))
-        elif token == 'FIXAGE':
-            token = tokenizer.require_next_token_ucase()
-            node, age = None, None
-            print('* FIXAGE:', end=' ')
-            while not (token == ';'):
-                if token == 'TAXON':
-                    token = parse_value(tokenizer)
-                    node = analysis.tree.find_node_with_taxon(
-                        lambda x: x.label.upper() == token)
-                    print('TAXON={0}'.format(token), end=' ')
-                elif token == 'AGE':
-                    token = parse_value(tokenizer)
-                    age = int(token)
-                    print('AGE={0}'.format(token), end=' ')
-                else:
-                    raise ValueError("FIXAGE: Unrecognised option: '{}'".format(token))
-                token = tokenizer.require_next_token_ucase()
-            if age is not None:
-                node.fix = age
-            else:
-                node.fix = node.age
-            node.max = None
-            node.min = None
-            print('')
-        elif token == 'UNFIXAGE':
+            commands.append(('MRCA', (ancestor, tuple(children))))
+        elif token in ('FIXAGE', 'UNFIXAGE', 'CONSTRAIN'):
+            command = token
+            allowed = {
+                'FIXAGE': ['TAXON', 'AGE'],
+                'UNFIXAGE': ['TAXON'],
+                'CONSTRAIN': ['TAXON', 'MAX AGE', 'MAXAGE',
+                    'MIN AGE', 'MINAGE', 'REMOVE'],
+                }[command]
+            options = []
             token = tokenizer.require_next_token_ucase()
-            node = None
-            print('* UNFIXAGE:', end=' ')
             while not (token == ';'):
-                if token == 'TAXON':
-                    token = parse_value(tokenizer)
-                    node = analysis.tree.find_node_with_taxon(
-                        lambda x: x.label.upper() == token)
-                    print('TAXON={0}'.format(token), end=' ')
-                else:
-                    raise ValueError("UNFIXAGE: Unrecognised option: '{}'".format(token))
+                if token not in allowed:
+                    raise ValueError("{0}: Unrecognised option: '{1}'".format(command, token))
+                value = parse_value(tokenizer)
+                if token == 'AGE' or (token in ('MAX AGE', 'MAXAGE',
+                        'MIN AGE', 'MINAGE') and value != 'NONE'):
+                    int(value)
+                if token == 'REMOVE' and value != 'ALL':
+                    raise ValueError("CONSTRAIN.REMOVE: Expected 'all': '{}'".format(value))
+                options.append((token, value))
                 token = tokenizer.require_next_token_ucase()
-            node.fix = None
-            print('')
-        elif token == 'CONSTRAIN':
-            token = tokenizer.require_next_token_ucase()
-            node, min, max = None, None, None
-            all = False
-            print('* CONSTRAIN:', end=' ')
-            while not (token == ';'):
-                if token == 'TAXON':
-                    token = parse_value(tokenizer)
-                    node = analysis.tree.find_node_with_taxon(
-                        lambda x: x.label.upper() == token)
-                    print('TAXON={0}'.format(token), end=' ')
-                elif token == 'MAX AGE' or token == 'MAXAGE':
-                    token = parse_value(tokenizer)
-                    if token != 'NONE':
-                        max = int(token)
-                    print('MAX_AGE={0}'.format(token), end=' ')
-                elif token == 'MIN AGE' or token == 'MINAGE':
-                    token = parse_value(tokenizer)
-                    if token != 'NONE':
-                        min = int(token)
-                    print('MIN_AGE={0}'.format(token), end=' ')
-                elif token == 'REMOVE':
-                    token = parse_value(tokenizer)
-                    print('REMOVE={0}'.format(token), end=' ')
-                    if token != 'ALL':
-                        raise ValueError("CONSTRAIN.REMOVE: Expected 'all': '{}'".format(token))
-                else:
-                    raise ValueError("CONSTRAIN: Unrecognised option: '{}'".format(token))
-                token = tokenizer.require_next_token_ucase()
-            if all:
-                for node in analysis.tree.preorder_node_iter():
-                    node.max = None
-                    node.min = None
-            else:
-                node.fix = None
-                node.max = max
-                node.min = min
-            print('')
+            commands.append((command, tuple(options)))
         elif token == 'DIVTIME':
             token = tokenizer.require_next_token_ucase()
-            print(_SEPARATOR)
-            print('* DIVTIME:', end=' ')
+            options = []
             while not (token == ';'):
                 if token == 'METHOD':
-                    token = parse_value(tokenizer)
-                    if token == 'NPRS' or token == 'NP':
-                        analysis.param.method.method = 'nprs'
-                    else:
-                        raise ValueError("DIVTIME: Unrecognised method: '{}'".format(token))
-                    print('METHOD={0}'.format(token), end=' ')
+                    value = parse_value(tokenizer)
+                    if not (value == 'NPRS' or value == 'NP'):
+                        raise ValueError("DIVTIME: Unrecognised method: '{}'".format(value))
                 elif token == 'ALGORITHM':
-                    token = parse_value(tokenizer)
-                    if token == 'POWELL' or token == 'PL':
-                        analysis.param.algorithm.algorithm = 'powell'
-                    else:
-                        raise ValueError("DIVTIME: Unrecognised algorithm: '{}'".format(token))
-                    print('ALGORITHM={0}'.format(token), end=' ')
+                    value = parse_value(tokenizer)
+                    if not (value == 'POWELL' or value == 'PL'):
+                        raise ValueError("DIVTIME: Unrecognised algorithm: '{}'".format(value))
                 else:
                     raise ValueError("DIVTIME: Unrecognised option: '{}'".format(token))
+                options.append((token, value))
                 token = tokenizer.require_next_token_ucase()
-            print('\n* BEGIN ANALYSIS: \n')
-            if run:
-                results = analysis.run()
+            commands.append(('DIVTIME', tuple(options)))
         elif token == 'SET':
             token = tokenizer.require_next_token_ucase()
+            options = []
             while not (token == ';'):
-                if token == 'NUM TIME GUESSES':
-                    token = parse_value(tokenizer)
-                    print('* NUM_TIME_GUESSES: {0}'.format(token))
-                    analysis.param.general.number_of_guesses = int(token)
-                elif token == 'NPEXP':
-                    token = parse_value(tokenizer)
-                    print('* NPEXP: {0}'.format(token))
-                    analysis.param.method.exponent = int(token)
-                elif token == 'PENALTY':
-                    token = parse_value(tokenizer)
-                    print('* PENALTY: {0}'.format(token))
-                    if token == 'ADD':
-                        analysis.param.method.logarithmic = False
-                    elif token == 'LOG':
-                        analysis.param.method.logarithmic = True
-                    else:
-                        raise ValueError("PENALTY: Unrecognised option: '{}'".format(token))
-                elif token == 'PERTURB_FACTOR':
-                    token = parse_value(tokenizer)
-                    print('* PERTURB_FACTOR: {0}'.format(token))
-                    analysis.param.general.perturb_factor = float(token)
-                elif token == 'MAXITER':
+                if token == 'MAXITER':
                     #! for minimize.powell
                     pass
-                elif token == 'MAXBARRIERITER':
-                    token = parse_value(tokenizer)
-                    print('* MAXBARRIERITER: {0}'.format(token))
-                    analysis.param.barrier.max_iterations = int(token)
-                elif token == 'BARRIERMULTIPLIER':
-                    token = parse_value(tokenizer)
-                    print('* BARRIERMULTIPLIER: {0}'.format(token))
-                    analysis.param.barrier.multiplier = float(token)
-                elif token == 'INITBARRIERFACTOR':
-                    token = parse_value(tokenizer)
-                    print('* INITBARRIERFACTOR: {0}'.format(token))
-                    analysis.param.barrier.initial_factor = float(token)
+                elif token in _SET_OPTIONS:
+                    value = parse_value(tokenizer)
+                    if token == 'PENALTY':
+                        if value not in ('ADD', 'LOG'):
+                            raise ValueError("PENALTY: Unrecognised option: '{}'".format(value))
+                    else:
+                        _SET_OPTIONS[token][2](value)
+                    options.append((token, value))
                 else:
                     raise ValueError("SET: Unrecognised option: '{}'".format(token))
                 token = tokenizer.require_next_token_ucase()
-        elif token == 'SHOWAGE':
-            tokenizer.skip_to_semicolon()
-            if run:
-                print('* SHOWAGE:')
-                if results is not None:
-                    results.print()
-                else:
-                    raise ValueError("SHOWAGE: Called before DIVTIME, nothing to show.")
-        elif token == 'SCALAR':
+            commands.append(('SET', tuple(options)))
+        elif token == 'SHOWAGE' or token == 'SCALAR':
             tokenizer.skip_to_semicolon()
-            print('* SCALAR:')
-            analysis.param.general.scalar = True
+            commands.append((token, ()))
         elif token == 'DESCRIBE':
             token = tokenizer.require_next_token_ucase()
+            options = []
             while not (token == ';'):
                 if token == 'PLOT':
-                    token = parse_value(tokenizer)
-                    if run:
-                        if token == 'CLADOGRAM':
-                            print('* {}'.format(token))
-                            pass
-                        if token == 'PHYLOGRAM':
-                            print('* {}'.format(token))
-                            pass
-                        if token == 'CHRONOGRAM':
-                            print('* {} (unweighted branches):'.format(token))
-                            core.print_tree(results.chronogram)
-                        if token == 'RATOGRAM':
-                            print('* {}'.format(token))
-                            pass
-                        if token == 'TREE DESCRIPTION':
-                            print('* {}:'.format(token))
-                            print(results.chronogram.as_string(
-                                schema="newick",suppress_internal_node_labels=True))
-                        if token == 'PHYLO DESCRIPTION':
-                            print('* {}'.format(token))
-                            pass
-                        if token == 'RATO DESCRIPTION':
-                            print('* {}'.format(token))
-                            pass
+                    options.append((token, parse_value(tokenizer)))
                 elif token == 'PLOTWIDTH':
-                    print('* {}'.format(token))
-                    pass
+                    options.append((token, None))
                 else:
                     raise ValueError("DESCRIBE: Unrecognised option: '{}'".format(token))
                 token = tokenizer.require_next_token_ucase()
-            # plot happens here
-            pass
+            commands.append(('DESCRIBE', tuple(options)))
         elif token == ';':
             print('OOPS, missed a colon')
         else:
             raise ValueError("RATES: Unrecognised command: '{}'".format(token))
         token = tokenizer.next_token_ucase()
+    return RatesProgram(commands)
+
+def compile_rates_text(text):
+    """Compile RATES commands given as text, see read_rates_blocks()"""
+    # compile_rates() expects to find the semicolon of the block header
+    tokenizer = dendropy.dataio.nexusprocessing.NexusTokenizer(
+        io.StringIO(';' + text + '\nend;'))
+    return compile_rates(tokenizer)
+
+# SET option: (parameter category, parameter name, value type)
+_SET_OPTIONS = {
+    'NUM TIME GUESSES': ('general', 'number_of_guesses', int),
+    'NPEXP': ('method', 'exponent', int),
+    'PENALTY': ('method', 'logarithmic', None),
+    'PERTURB_FACTOR': ('general', 'perturb_factor', float),
+    'MAXBARRIERITER': ('barrier', 'max_iterations', int),
+    'BARRIERMULTIPLIER': ('barrier', 'multiplier', float),
+    'INITBARRIERFACTOR': ('barrier', 'initial_factor', float),
+    }
+
+
+class RatesProgram:
+    """
+    A compiled RATES block, as a list of (command, arguments) tuples.
+    The program may be applied to any number of analyses. Nodes named
+    by MRCA and TAXON options are found once for each distinct topology
+    and remembered by preorder position, see apply().
+
+    Example:
+    program = compile_rates_text(read_rates_blocks('calibrations.nex')[0])
+    for tree in trees:
+        analysis = core.RateAnalysis(tree)
+        program.apply(analysis)
+    """
+
+    def __init__(self, commands, maxsize=128):
+        self.commands = tuple(commands)
+        self._positions = core.ArrayCache(maxsize)
+
+    def __getstate__(self):
+        # Resolved positions are cheap to find again
+        return {'commands': self.commands,
+            'maxsize': self._positions.maxsize}
 
+    def __setstate__(self, state):
+        self.__init__(state['commands'], state['maxsize'])
 
-def from_file_nexus(file, run=False):
-    """First get the tree and create RateAnalysis, then find and parse RATES commands"""
-    treelist = dendropy.TreeList.get(path=file, schema="nexus",
-        suppress_internal_node_taxa=True, suppress_leaf_node_taxa=False)
-    #! if more than one trees are present: do something
-    if len(treelist) > 0:
-        tree = treelist[0]
+    def __eq__(self, other):
+        return isinstance(other, RatesProgram) and \
+            self.commands == other.commands
+
+    def __hash__(self):
+        return hash(self.commands)
+
+    @staticmethod
+    def _topology(tree):
+        """Everything that node resolution depends on, in preorder"""
+        return tuple((len(node._child_nodes),
+            None if node.taxon is None else node.taxon.label)
+            for node in tree.preorder_node_iter())
+
+    def _resolve(self, tree):
+        """
+        Return a function that finds the node for a command, either by
+        searching the tree or by preorder position if seen before,
+        followed by the positions found by searching, if any.
+        """
+        key = self._topology(tree)
+        positions = self._positions.get(key)
+        if positions is not None:
+            nodes = list(tree.preorder_node_iter())
+            steps = iter(positions)
+            return (lambda search: nodes[next(steps)]), None
+        positions = []
+        index = {node: i for i, node in enumerate(tree.preorder_node_iter())}
+        def find(search):
+            node = search()
+            positions.append(index[node])
+            return node
+        return find, (key, positions)
+
+    @staticmethod
+    def _taxon(tree, command, label):
+        node = tree.find_taxon_node(label)
+        if node is None:
+            raise ValueError("{0}: Taxon not found: '{1}'".format(command, label))
+        return node
+
+    def apply(self, analysis, run=False):
+        """
+        Apply all commands to the analysis, running it on DIVTIME
+        if `run` is set. Returns the last results, if any.
+        """
+        results = None
+        tree = analysis.tree
+        find, found = self._resolve(tree)
+        for command, arguments in self.commands:
+            if command == 'BLFORMAT':
+                format = None
+                nsites = None
+                for option, value in arguments:
+                    print('* {0}: {1}'.format(option, value))
+                    if option == 'NSITES':
+                        nsites = int(value)
+                    elif option == 'LENGTHS':
+                        format = value.lower()
+                    elif option == 'ROUND':
+                        analysis.param.branch_length.round = (value == 'YES')
+                analysis.param.branch_length.format = format
+                analysis.param.branch_length.nsites = nsites
+            elif command == 'COLLAPSE' or command == 'PRUNE':
+                print('* {0}: automatic'.format(command))
+            elif command == 'MRCA':
+                ancestor, children = arguments
+                def search():
+                    try:
+                        return tree.clade_mrca(children)
+                    except KeyError:
+                        raise ValueError("MRCA: Invalid children: {}".format(list(children)))
+                tree.label_node(find(search), ancestor)
+                print("* MRCA: '{0}' of {1}.".format(ancestor, list(children)))
+            elif command in ('FIXAGE', 'UNFIXAGE', 'CONSTRAIN'):
+                node = None
+                age, min, max = None, None, None
+                remove = False
+                print('* {0}:'.format(command), end=' ')
+                for option, value in arguments:
+                    if option == 'TAXON':
+                        node = find(lambda: self._taxon(tree, command, value))
+                    elif option == 'AGE':
+                        age = int(value)
+                    elif option in ('MAX AGE', 'MAXAGE'):
+                        option = 'MAX_AGE'
+                        if value != 'NONE':
+                            max = int(value)
+                    elif option in ('MIN AGE', 'MINAGE'):
+                        option = 'MIN_AGE'
+                        if value != 'NONE':
+                            min = int(value)
+                    elif option == 'REMOVE':
+                        remove = True
+                    print('{0}={1}'.format(option, value), end=' ')
+                print('')
+                if command == 'CONSTRAIN' and remove:
+                    for each in tree.preorder_node_iter():
+                        each.max = None
+                        each.min = None
+                    continue
+                if node is None:
+                    raise ValueError("{0}: Expected parameter TAXON not given.".format(command))
+                if command == 'FIXAGE':
+                    node.fix = age if age is not None else node.age
+                    node.max = None
+                    node.min = None
+                elif command == 'UNFIXAGE':
+                    node.fix = None
+                else:
+                    node.fix = None
+                    node.max = max
+                    node.min = min
+            elif command == 'DIVTIME':
+                print(_SEPARATOR)
+                print('* DIVTIME:', end=' ')
+                for option, value in arguments:
+                    if option == 'METHOD':
+                        analysis.param.method.method = 'nprs'
+                    elif option == 'ALGORITHM':
+                        analysis.param.algorithm.algorithm = 'powell'
+                    print('{0}={1}'.format(option, value), end=' ')
+                print('\n* BEGIN ANALYSIS: \n')
+                if run:
+                    results = analysis.run()
+            elif command == 'SET':
+                for option, value in arguments:
+                    print('* {0}: {1}'.format(option.replace(' ', '_'), value))
+                    category, name, type = _SET_OPTIONS[option]
+                    if option == 'PENALTY':
+                        value = (value == 'LOG')
+                    else:
+                        value = type(value)
+                    setattr(getattr(analysis.param, category), name, value)
+            elif command == 'SHOWAGE':
+                if run:
+                    print('* SHOWAGE:')
+                    if results is not None:
+                        results.print()
+                    else:
+                        raise ValueError("SHOWAGE: Called before DIVTIME, nothing to show.")
+            elif command == 'SCALAR':
+                print('* SCALAR:')
+                analysis.param.general.scalar = True
+            elif command == 'DESCRIBE':
+                for option, value in arguments:
+                    if option == 'PLOTWIDTH':
+                        print('* {}'.format(option))
+                    elif run:
+                        _describe(value, results)
+        if found is not None:
+            # Only remember complete resolutions
+            self._positions.put(*found)
+        return results
+
+
+def _describe(plot, results):
+    """Print the requested plot of results for DESCRIBE"""
+    if plot == 'CHRONOGRAM':
+        print('* {} (unweighted branches):'.format(plot))
+        core.print_tree(results.chronogram)
+    elif plot == 'TREE DESCRIPTION':
+        print('* {}:'.format(plot))
+        results.write_chronogram(sys.stdout, internal=False)
+        print('')
+    elif plot in ('CLADOGRAM', 'PHYLOGRAM', 'RATOGRAM',
+            'PHYLO DESCRIPTION', 'RATO DESCRIPTION'):
+        print('* {}'.format(plot))
+
+def parse_rates(tokenizer, analysis, run=False):
+    """Compile a RATES block and apply it to the analysis, see RatesProgram"""
+    return compile_rates(tokenizer).apply(analysis, run=run)
+
+def _read_file(file, number, cache):
+    """
+    Read the given tree and all RATES blocks of a file in a single pass,
+    or from its binary tree set if `cache` is set, see treefile.load().
+    Returns whether the file is NEXUS, the tree and the blocks.
+    """
+    if cache:
+        # Memory-mapped after the first read
+        contents = treefile.load(file)
+        trees = contents
+    else:
+        contents = treefile.read_file(file, number)
+        trees = contents.trees
+        number = 0
+    try:
+        tree = trees[number]
+    except IndexError:
+        raise ValueError('Tree {0} not found in: {1}'.format(number, file))
+    return contents.nexus, treefile.to_dendropy(tree), contents.blocks
+
+def _from_nexus(file, tree, blocks, run=False):
+    """Create RateAnalysis for the tree, then apply the RATES blocks"""
     print("> TREE: from '{}'".format(file))
     # tree.print_plot()
-    analysis = core.RateAnalysis(tree)
-    file = open(file,'r')
-    tokenizer = dendropy.dataio.nexusprocessing.NexusTokenizer(file)
-    token = tokenizer.next_token_ucase()
-    if not token == '#NEXUS':
-        raise ValueError('Not nexus file!')
-    while not tokenizer.is_eof():
-        token = tokenizer.next_token_ucase()
-        while token != None and token != 'BEGIN' and not tokenizer.is_eof():
-            token = tokenizer.next_token_ucase()
-        token = tokenizer.next_token_ucase()
-        if token == 'RATES' or token=='R8S':
-            print('> RATES BLOCK:')
-            print(_SEPARATOR)
-            parse_rates(tokenizer, analysis, run=run)
-        else:
-            while not (token == 'END' or token == 'ENDBLOCK') \
-                    and not tokenizer.is_eof() \
-                    and not token==None:
-                tokenizer.skip_to_semicolon()
-                token = tokenizer.next_token_ucase()
+    analysis = core.RateAnalysis(tree, copy=False)
+    for block in blocks:
+        print('> RATES BLOCK:')
+        print(_SEPARATOR)
+        compile_rates_text(block.text).apply(analysis, run=run)
     return analysis
 
-def from_tree(newick):
-    analysis = core.RateAnalysis(newick)
+def from_file_nexus(file, run=False, number=0, cache=False):
+    """First get the tree and create RateAnalysis, then apply RATES commands"""
+    nexus, tree, blocks = _read_file(file, number, cache)
+    if not nexus:
+        raise ValueError('Not nexus file!')
+    return _from_nexus(file, tree, blocks, run=run)
+
+def read_rates_blocks(file):
+    """
+    Return the commands of all RATES/R8S blocks in a NEXUS file.
+    The file is streamed, so memory use does not grow with its size.
+    """
+    return [block.text for block in treefile.read_blocks(file)]
+
+def parse_rates_text(text, analysis, run=False):
+    """Parse RATES commands given as text, see read_rates_blocks()"""
+    return compile_rates_text(text).apply(analysis, run=run)
+
+@functools.lru_cache(maxsize=16)
+def _intern(program):
+    """
+    Return the first recently seen program equal to the given one,
+    so that it keeps its resolved positions across the trees of a batch
+    sent to this process, see _analyze_tree()
+    """
+    return program
+
+def _analyze_tree(task):
+    """
+    Analyze a single tree for batch(), applying compiled RATES programs
+    if given, otherwise Newick defaults. Returns results, or the error message.
+    """
+    tree, programs = task
+    try:
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            if programs is None:
+                analysis = from_tree(tree, copy=False)
+            else:
+                analysis = core.RateAnalysis(tree, copy=False)
+                for program in programs:
+                    program = _intern(program)
+                    program.apply(analysis)
+            return analysis.run(), None
+    except Exception as exception:
+        return None, str(exception)
+
+def batch(file, workers=None, window=None, start=0, stop=None):
+    """
+    Analyze every tree of a Nexus/Newick file on a process pool.
+
+    Trees are read one at a time, and NEXUS files have their RATES
+    commands applied to each tree. Results are yielded in input order,
+    each as soon as it is ready. At most `window` trees are kept in
+    flight (twice the number of workers by default), so memory use is
+    bounded regardless of the number of trees. Uses all cores if
+    `workers` is None, or runs in-process if it is 1.
+
+    Trees that could not be analyzed yield None and print a warning.
+
+    Only trees from `start` up to `stop` are analyzed, as with slicing.
+    When sharding a file between jobs, each seeks straight to its first
+    tree using the offset index, see treefile.index().
+
+    Example
+    -------
+    for results in parse.batch('posterior.nex'):
+        results.write_chronogram(sys.stdout)
+    """
+    with open(file) as input:
+        line = input.readline()
+        is_nexus = (line.strip() == "#NEXUS")
+    programs = None
+    if is_nexus:
+        # Compiled once and replayed for every tree
+        programs = [compile_rates_text(text)
+            for text in read_rates_blocks(file)]
+    trees = (treefile.to_dendropy(tree) for tree in
+        treefile.read(file, mmap=True, start=start, stop=stop))
+    tasks = ((tree, programs) for tree in trees)
+    for index, (results, error) in enumerate(
+            core.imap_replicates(_analyze_tree, tasks, workers, window),
+            start):
+        if error is not None:
+            print('WARNING: Tree {0} failed: {1}'.format(index, error))
+        yield results
+
+def from_tree(newick, copy=True):
+    analysis = core.RateAnalysis(newick, copy=copy)
     analysis.param.general.scalar = True
     analysis.param.branch_length.format = 'guess'
     return analysis
 
-def from_file_newick(file):
+def from_file_newick(file, number=0, cache=False):
     try:
-        newick = dendropy.Tree.get(path=file, schema='newick',
-            suppress_internal_node_taxa=True, suppress_leaf_node_taxa=False)
-        analysis = from_tree(newick)
+        nexus, newick, blocks = _read_file(file, number, cache)
+        analysis = from_tree(newick, copy=False)
     except Exception as exception:
         raise RuntimeError('Error reading Newick file: {0}\n{1}'.
             format(file, str(exception)))
     return analysis
 
-def from_file(file, run=False):
-    """Open and parse a Nexus/Newick file, run analysis if `run` is set"""
-    with open(file) as input:
-        line = input.readline()
-        is_nexus = (line.strip() == "#NEXUS")
-    if is_nexus:
+def from_file(file, run=False, number=0, cache=False):
+    """
+    Open and parse a Nexus/Newick file, run analysis if `run` is set.
+    The first tree is used, unless another is requested by `number`.
+    If `cache` is set, all trees are kept as a binary tree set next to
+    the file on first read and memory-mapped afterwards, see treefile.load().
+    """
+    # Trees and RATES blocks are dispatched in a single pass
+    nexus, tree, blocks = _read_file(file, number, cache)
+    if nexus:
         # Allow analysis to be run according to nexus rates commands
-        analysis = from_file_nexus(file, run=run)
+        analysis = _from_nexus(file, tree, blocks, run=run)
     else:
-        analysis = from_file_newick(file)
+        analysis = from_tree(tree, copy=False)
     # Force analysis if requested
     if run is True and analysis.results is None:
         analysis.run()
@@ -420,7 +596,7 @@ def quick(tree=None, file=None, format='guess', nsites=None, scalar=True):
     if tree is not None:
         dendrotree = dendropy.Tree.get(data=tree, schema="newick",
             suppress_internal_node_taxa=True, suppress_leaf_node_taxa=False)
-        analysis = core.RateAnalysis(dendrotree)
+        analysis = core.RateAnalysis(dendrotree, copy=False)
         analysis.param.general.scalar = scalar
         analysis.param.branch_length.format = format
         analysis.param.branch_length.nsites = nsites
@@ -429,5 +605,6 @@ def quick(tree=None, file=None, format='guess', nsites=None, scalar=True):
     else:
         raise TypeError("Must specify one of: 'tree' or 'file'")
     res = analysis.run()
-    chrono = res.chronogram.as_string(schema='newick', suppress_rooting=True)
-    return chrono
+    chrono = io.StringIO()
+    res.write_chronogram(chrono, rooted=False)
+    return chrono.getvalue()
@@ -22,12 +22,14 @@ import PyQt5.QtWidgets as QtWidgets
 import PyQt5.QtGui as QtGui
 
 import sys
+import io
 import logging
 import re
 import pickle
 
 from .. import core
 from .. import parse
+from .. import export
 from ..param import qt as param_qt
 
 from . import utility
@@ -718,7 +720,10 @@ class Main(QtWidgets.QDialog):
         def done(result):
             with utility.StdioLogger():
                 result.print()
-                print(result.chronogram.as_string(schema='newick'))
+                # Logged as a single message
+                newick = io.StringIO()
+                result.write_chronogram(newick)
+                print(newick.getvalue(), end='')
             self.analysis.results = result
             self.machine.postEvent(utility.NamedEvent('DONE', True))
 
@@ -819,8 +824,7 @@ class Main(QtWidgets.QDialog):
             return
         try:
             with open(fileName, 'w') as file:
-                file.write(self.analysis.results.chronogram.
-                    as_string(schema='newick'))
+                self.analysis.results.write_chronogram(file)
         except Exception as exception:
             self.fail(exception)
         else:
@@ -837,8 +841,7 @@ class Main(QtWidgets.QDialog):
             return
         try:
             with open(fileName, 'w') as file:
-                file.write(self.analysis.results.ratogram.
-                    as_string(schema='newick'))
+                self.analysis.results.write_ratogram(file)
         except Exception as exception:
             self.fail(exception)
         else:
@@ -855,11 +858,7 @@ class Main(QtWidgets.QDialog):
             return
         try:
             with open(fileName, 'w') as file:
-                table = self.analysis.results.table
-                for i in range(table['n']):
-                    file.write(str(table['Node'][i]) + '\t')
-                    file.write(str(table['Age'][i]) + '\t')
-                    file.write(str(table['Rate'][i]) + '\n')
+                export.write_table(file, self.analysis.results)
         except Exception as exception:
             self.fail(exception)
         else:
@@ -7,9 +7,15 @@ import sys
 from . import parse
 
 def main():
-    if len(sys.argv) == 2:
+    args = sys.argv[1:]
+    # Keeping a binary tree set next to the file is opt-in
+    cache = '--cache' in args
+    if cache:
+        args.remove('--cache')
+    if len(args) == 1:
         print(' ')
-        a = parse.from_file(sys.argv[1], run=True)
+        a = parse.from_file(args[0], run=True, cache=cache)
     else:
-        print('Usage: pyr8s NEXUS_FILE')
+        print('Usage: pyr8s [--cache] NEXUS_FILE')
         print('Ex:    pyr8s tests/legacy_1')
+        print('       --cache keeps parsed trees as NEXUS_FILE.trees.npz')
@@ -0,0 +1,233 @@
+#-----------------------------------------------------------------------------
+# Pyr8s - Divergence Time Estimation
+# Copyright (C) 2021  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#-----------------------------------------------------------------------------
+
+
+"""
+Summarize node ages over many analyses of the same taxa.
+
+Results are folded in one at a time, so they need not be kept in memory.
+Clades are identified by the set of their leaf labels, stored as a bitmask.
+For each clade, the mean and variance are updated in a single pass
+(Welford) and a fixed size reservoir sample is kept for intervals.
+
+Example:
+summary = AgeSummary()
+for results in parse.batch('posterior.nex'):
+    summary.add(results)
+summary.print()
+summary.chronogram().write(path='summary.nex', schema='nexus')
+"""
+
+import random
+from math import ceil, sqrt
+
+import numpy as np
+
+from . import extensions
+
+
+def _leaf_label(node):
+    """Leaves are identified by taxon label if available"""
+    if node.taxon is not None:
+        return node.taxon.label
+    return node.label
+
+
+class CladeAges:
+    """
+    Running age statistics for a single clade.
+    Memory use is bounded by the reservoir capacity.
+    """
+
+    def __init__(self, label, capacity, generator):
+        self.label = label
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._capacity = capacity
+        self._generator = generator
+        self.sample = []
+
+    def add(self, age):
+        """Fold a new age into the statistics"""
+        self.count += 1
+        delta = age - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (age - self.mean)
+        if len(self.sample) < self._capacity:
+            self.sample.append(age)
+        else:
+            position = self._generator.randrange(self.count)
+            if position < self._capacity:
+                self.sample[position] = age
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self._m2 / (self.count - 1)
+
+    def hpd(self, level=0.95):
+        """Shortest interval containing the given mass of the sample"""
+        sample = np.sort(self.sample)
+        size = len(sample)
+        width = min(size, max(1, int(ceil(level * size))))
+        lows = sample[:size - width + 1]
+        highs = sample[width - 1:]
+        best = np.argmin(highs - lows)
+        return (float(lows[best]), float(highs[best]))
+
+
+class AgeSummary:
+    """
+    Accumulate per-clade age statistics from analysis results.
+    The topology of the first result is kept for the summary chronogram.
+    """
+
+    def __init__(self, capacity=1000, level=0.95, seed=None):
+        self.capacity = capacity
+        self.level = level
+        self.trees = 0
+        self._generator = random.Random(seed)
+        self._bits = {}
+        self._clades = {}
+        self._target = None
+
+    def _masks(self, tree):
+        """Yield (node, clade bitmask) pairs in postorder"""
+        masks = {}
+        for node in tree.postorder_node_iter():
+            if node.is_leaf():
+                label = _leaf_label(node)
+                if label not in self._bits:
+                    self._bits[label] = len(self._bits)
+                mask = 1 << self._bits[label]
+            else:
+                mask = 0
+                for child in node.child_node_iter():
+                    mask |= masks.pop(child)
+            masks[node] = mask
+            yield node, mask
+
+    def _row_masks(self, parent, names):
+        """
+        Return the clade bitmask of each row and the rows in postorder,
+        given rows in preorder by the row of their parent (-1 for the root)
+        and the names of leaves.
+        """
+        count = len(parent)
+        leaf = np.ones(count, dtype=bool)
+        leaf[parent[1:]] = False
+        masks = [0] * count
+        # Last row of each subtree and depth of each row
+        end = list(range(count))
+        depth = [0] * count
+        for row in range(1, count):
+            depth[row] = depth[parent[row]] + 1
+        # Children always come after their parent in preorder
+        for row in reversed(range(count)):
+            if leaf[row]:
+                name = names[row]
+                if name not in self._bits:
+                    self._bits[name] = len(self._bits)
+                masks[row] |= 1 << self._bits[name]
+            if row > 0:
+                up = parent[row]
+                masks[up] |= masks[row]
+                end[up] = max(end[up], end[row])
+        # Subtrees sharing their last row are visited deepest first
+        postorder = sorted(range(count), key=lambda row: (end[row], -depth[row]))
+        return masks, postorder
+
+    def add(self, results):
+        """
+        Fold the node ages of given RateAnalysisResults. Ages are read
+        from the results table, so no trees are built for them.
+        """
+        parent, names, ages = results._clade_rows()
+        labels = results.table['Node']
+        masks, postorder = self._row_masks(parent, names)
+        for row in postorder:
+            mask = masks[row]
+            clade = self._clades.get(mask)
+            if clade is None:
+                clade = CladeAges(labels[row], self.capacity, self._generator)
+                self._clades[mask] = clade
+            clade.add(float(ages[row]))
+        if self._target is None:
+            self._target = results
+        self.trees += 1
+
+    def table(self):
+        """
+        Return summary statistics for every clade seen, as a table
+        with one row per clade. Frequency is the fraction of trees
+        containing the clade.
+        """
+        table = {key: [] for key in ['Node', 'Frequency',
+            'Mean', 'Deviation', 'Low', 'High']}
+        for clade in self._clades.values():
+            low, high = clade.hpd(self.level)
+            table['Node'].append(clade.label)
+            table['Frequency'].append(clade.count / self.trees)
+            table['Mean'].append(clade.mean)
+            table['Deviation'].append(sqrt(clade.variance))
+            table['Low'].append(low)
+            table['High'].append(high)
+        table['n'] = len(table['Node'])
+        return table
+
+    def chronogram(self, tree=None):
+        """
+        Return a copy of the given dendropy tree, or of the chronogram
+        of the first results folded, with branch lengths set from mean
+        clade ages.
+        Each node is annotated with its age mean and HPD interval.
+        Clades never seen keep their original branch lengths.
+        """
+        if tree is None:
+            if self._target is None:
+                raise ValueError('No results to summarize.')
+            tree = self._target.chronogram
+        tree = extensions.copy_tree(tree)
+        ages = {}
+        for node, mask in self._masks(tree):
+            clade = self._clades.get(mask)
+            if clade is None:
+                continue
+            ages[node] = clade.mean
+            low, high = clade.hpd(self.level)
+            node.annotations.add_new('age_mean', clade.mean)
+            node.annotations.add_new('age_hpd', '{{{0},{1}}}'.format(low, high))
+        for node in tree.preorder_node_iter():
+            parent = node.parent_node
+            if parent in ages and node in ages:
+                node.edge_length = ages[parent] - ages[node]
+        return tree
+
+    def print(self):
+        """Print summary table"""
+        table = self.table()
+        print('\n\t{:12}{:>12}{:>12}{:>12}{:>12}{:>12}'.format(
+            'Node', 'Frequency', 'Mean', 'Deviation', 'Low', 'High'))
+        print('-' * 86)
+        for i in range(table['n']):
+            print('\t{:12.10}{:>12.4f}{:>12.4f}{:>12.4f}{:>12.4f}{:>12.4f}'.
+                format(*[table[key][i] for key in ['Node', 'Frequency',
+                'Mean', 'Deviation', 'Low', 'High']]))
+        print('')
@@ -0,0 +1,857 @@
+#-----------------------------------------------------------------------------
+# Pyr8s - Divergence Time Estimation
+# Copyright (C) 2021  Patmanidis Stefanos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#-----------------------------------------------------------------------------
+
+
+"""
+Read trees from Newick/NEXUS files straight into compact arrays.
+
+Trees are yielded one at a time, each as the parent index of every node
+(-1 for the root) and the lengths of their branches, along with a table
+of node labels. Nodes are numbered in preorder. Parsing is iterative,
+so arbitrarily deep trees are fine, and no dendropy objects are built.
+
+Gzip compressed files are recognised and decompressed on the fly.
+Plain files may be memory-mapped, so that huge files are paged in
+by the operating system instead of being read.
+
+Whole files may also be kept as a binary tree set next to the source,
+which is memory-mapped on later loads, see load().
+
+Example:
+for tree in treefile.read('posterior.nex.gz'):
+    analysis = RateAnalysis.from_arrays(tree.parent, tree.length, tree.label)
+"""
+
+import collections
+import gzip
+import hashlib
+import io
+import itertools
+import mmap as _mmap
+import os
+import re
+import struct
+import tempfile
+import zipfile
+
+import numpy as np
+
+from . import extensions
+
+
+ArrayTree = collections.namedtuple('ArrayTree',
+    ['name', 'parent', 'length', 'label'])
+ArrayTree.__doc__ = """
+A tree as arrays, nodes in preorder. Name is None for Newick trees.
+Parent is -1 for the root, missing lengths are nan, missing labels None.
+"""
+
+Block = collections.namedtuple('Block', ['name', 'text'])
+Block.__doc__ = """
+A NEXUS block other than TREES, given by its upper-cased name and the
+text of its commands, with comments removed and tokens separated by spaces.
+"""
+
+Contents = collections.namedtuple('Contents', ['nexus', 'trees', 'blocks'])
+Contents.__doc__ = """
+What a single pass over a file found, see read_file(): whether it is
+NEXUS, the trees requested as ArrayTree and the blocks requested as Block.
+"""
+
+_CHUNK = 1 << 20
+
+_TOKEN = re.compile(rb"""
+    \s*(?:
+      (?P<comment>\[[^\]]*\])
+    | (?P<punctuation>[(),;=])
+    | :\s*(?P<length>[^\s(),:;=\[\]']+)
+    | (?P<quoted>'(?:[^']|'')*')
+    | (?P<word>[^\s(),:;=\[\]']+)
+    )""", re.VERBOSE)
+
+_SPACE = re.compile(rb'\s*')
+
+
+def _open(file):
+    """Open file for binary reading, decompressing gzip if needed"""
+    input = open(file, 'rb')
+    magic = input.read(2)
+    input.seek(0)
+    if magic == b'\x1f\x8b':
+        return gzip.GzipFile(fileobj=input)
+    return input
+
+
+def _tokens(input, mmap=False, offset=0, state=None):
+    """
+    Yield (kind, value) pairs from a binary file object, starting at
+    the given byte offset, where kind is one of: comment, punctuation,
+    length, quoted, word. Values are bytes. The file is either
+    memory-mapped or read in chunks. If a list is given for state,
+    its first item is set to the byte offset of each token yielded.
+    """
+    if mmap and not isinstance(input, gzip.GzipFile):
+        try:
+            buffer = _mmap.mmap(input.fileno(), 0, access=_mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            buffer = b''
+        eof = True
+        base = 0
+        position = offset
+    else:
+        input.seek(offset)
+        buffer = b''
+        eof = False
+        base = offset
+        position = 0
+    match = _TOKEN.match
+    while True:
+        token = match(buffer, position)
+        if token is None or (token.end() == len(buffer) and not eof):
+            # Token may continue in the next chunk
+            if not eof:
+                chunk = input.read(_CHUNK)
+                eof = not chunk
+                base += position
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            if _SPACE.match(buffer, position).end() == len(buffer):
+                return
+            raise ValueError('Unexpected character at byte {}: {!r}'.
+                format(base + position, bytes(buffer[position:position+20])))
+        position = token.end()
+        kind = token.lastgroup
+        if state is not None:
+            state[0] = base + token.start(kind)
+        yield kind, token.group(kind)
+
+
+def _label(kind, value):
+    """Decode label, quoted labels may contain doubled quotes"""
+    if kind == 'quoted':
+        return value[1:-1].replace(b"''", b"'").decode()
+    return value.replace(b'_', b' ').decode()
+
+
+def _newick(tokens, translate=None):
+    """
+    Read a single tree from tokens, up to and including the semicolon.
+    Returns parent, length and label lists, or None if out of tokens.
+    Leaf labels are translated if a table is given.
+    """
+    parent = [-1]
+    length = [None]
+    label = [None]
+    current = 0
+    started = False
+    for kind, value in tokens:
+        if kind == 'comment':
+            continue
+        started = True
+        if kind == 'punctuation':
+            if value == b'(':
+                parent.append(current)
+                length.append(None)
+                label.append(None)
+                current = len(parent) - 1
+            elif value == b',':
+                if current == 0:
+                    raise ValueError('Unexpected comma at root level.')
+                parent.append(parent[current])
+                length.append(None)
+                label.append(None)
+                current = len(parent) - 1
+            elif value == b')':
+                if current == 0:
+                    raise ValueError('Unbalanced parentheses.')
+                current = parent[current]
+            elif value == b';':
+                break
+            else:
+                raise ValueError('Unexpected token: {!r}'.format(value))
+        elif kind == 'length':
+            length[current] = float(value)
+        else:
+            label[current] = _label(kind, value)
+    else:
+        if not started:
+            return None
+        raise ValueError('Unexpected end of file, missing semicolon.')
+    if current != 0:
+        raise ValueError('Unbalanced parentheses.')
+    if translate:
+        leaf = [True] * len(parent)
+        for up in parent[1:]:
+            leaf[up] = False
+        for i, name in enumerate(label):
+            if leaf[i] and name in translate:
+                label[i] = translate[name]
+    return parent, length, label
+
+
+def _array_tree(name, parsed):
+    parent, length, label = parsed
+    return ArrayTree(name,
+        np.array(parent, dtype=int),
+        np.array([np.nan if x is None else x for x in length], dtype=float),
+        label)
+
+
+def _upper(kind, value):
+    if kind in ('word', 'punctuation'):
+        return value.upper()
+    return None
+
+
+def _skip_command(tokens):
+    """Skip tokens up to and including the next semicolon"""
+    for kind, value in tokens:
+        if kind == 'punctuation' and value == b';':
+            return
+
+
+def _nexus(tokens, block=None, translate=None, blocks=(), wanted=None):
+    """
+    Yield ArrayTree for every tree statement of all TREES blocks.
+    May start within a block, with the given translate table.
+    Blocks named in `blocks` are yielded as Block where found.
+    If `wanted` is given, trees whose number it rejects are skipped
+    without being parsed.
+    """
+    translate = translate or {}
+    number = 0
+    for kind, value in tokens:
+        if kind == 'comment':
+            continue
+        word = _upper(kind, value)
+        if block is None:
+            if word == b'BEGIN':
+                kind, value = next(tokens)
+                block = value.upper()
+                _skip_command(tokens)
+                if block in blocks:
+                    yield Block(block.decode(), _block(tokens))
+                    block = None
+        elif word in (b'END', b'ENDBLOCK'):
+            _skip_command(tokens)
+            block = None
+            translate = {}
+        elif word == b';':
+            continue
+        elif block == b'TREES' and word == b'TRANSLATE':
+            translate = _translate(tokens)
+        elif block == b'TREES' and word in (b'TREE', b'UTREE'):
+            if wanted is None or wanted(number):
+                yield _statement(tokens, translate)
+            else:
+                _skip_command(tokens)
+            number += 1
+        else:
+            _skip_command(tokens)
+
+
+def _block(tokens):
+    """Collect the commands of a block as text, up to and including its end"""
+    parts = []
+    command = True
+    for kind, value in tokens:
+        if kind == 'comment':
+            continue
+        if command and _upper(kind, value) in (b'END', b'ENDBLOCK'):
+            _skip_command(tokens)
+            break
+        command = (kind == 'punctuation' and value == b';')
+        parts.append(b':' + value if kind == 'length' else value)
+    return b' '.join(parts).decode()
+
+
+def _translate(tokens):
+    """Read translate pairs up to the semicolon"""
+    table = {}
+    key = None
+    for kind, value in tokens:
+        if kind == 'comment':
+            continue
+        if kind == 'punctuation':
+            if value == b';':
+                break
+            continue
+        if key is None:
+            key = _label(kind, value)
+        else:
+            table[key] = _label(kind, value)
+            key = None
+    return table
+
+
+def _statement(tokens, translate):
+    """Read the rest of a tree statement: [*] name = newick;"""
+    name = None
+    for kind, value in tokens:
+        if kind == 'comment':
+            continue
+        if kind == 'punctuation' and value == b'=':
+            break
+        if kind in ('word', 'quoted') and value != b'*':
+            name = _label(kind, value)
+    parsed = _newick(tokens, translate)
+    if parsed is None:
+        raise ValueError('Missing tree after name: {}'.format(name))
+    return _array_tree(name, parsed)
+
+
+def _start(tokens):
+    """
+    Consume tokens up to the first tree of a Newick file, or up to
+    the header of a NEXUS file. Returns the tokens of the first tree
+    if Newick, True if NEXUS, or None if there are no tokens.
+    """
+    for kind, value in tokens:
+        if kind == 'comment':
+            continue
+        if _upper(kind, value) == b'#NEXUS':
+            return True
+        return _chain(kind, value, tokens)
+    return None
+
+
+def _chain(kind, value, tokens):
+    yield kind, value
+    yield from tokens
+
+
+def _newick_all(tokens):
+    while True:
+        parsed = _newick(tokens)
+        if parsed is None:
+            return
+        yield _array_tree(None, parsed)
+
+
+def read(file, mmap=False, start=0, stop=None):
+    """
+    Yield every tree of a Newick or NEXUS file as an ArrayTree.
+    Trees are read one at a time, so memory use is bounded by the
+    largest tree. Gzip files are decompressed on the fly. If `mmap`
+    is set, plain files are memory-mapped instead of read in chunks.
+
+    Only trees from `start` up to `stop` are yielded, as with slicing.
+    If starting past the first tree, the offset index is used to seek
+    straight there, see index().
+    """
+    if start > 0:
+        offsets = load_index(file)
+        if offsets is None:
+            offsets = index(file)
+        if start >= len(offsets.tree):
+            return
+        trees = _seek(file, offsets, start, mmap)
+    else:
+        trees = _read(file, mmap)
+        next(trees, None)
+    count = None if stop is None else max(0, stop - start)
+    yield from itertools.islice(trees, count)
+
+
+def _read(file, mmap, blocks=(), wanted=None):
+    with _open(file) as input:
+        tokens = _tokens(input, mmap=mmap)
+        first = _start(tokens)
+        if first is True:
+            yield True
+            yield from _nexus(tokens, blocks=blocks, wanted=wanted)
+        elif first is not None:
+            yield False
+            trees = _newick_all(first)
+            if wanted is not None:
+                trees = (tree for number, tree in enumerate(trees)
+                    if wanted(number))
+            yield from trees
+
+
+def read_file(file, number=None, blocks=('RATES', 'R8S'), mmap=False):
+    """
+    Read a Newick or NEXUS file in a single streaming pass, keeping
+    the trees and the named blocks in the order they are met.
+    Only the tree with the given zero-based number is parsed,
+    or all trees if number is None. Returns Contents.
+    """
+    wanted = None if number is None else (lambda k: k == number)
+    items = _read(file, mmap, tuple(name.upper().encode() for name in blocks),
+        wanted)
+    nexus = next(items, False)
+    trees = []
+    found = []
+    for item in items:
+        if isinstance(item, Block):
+            found.append(item)
+        else:
+            trees.append(item)
+    return Contents(nexus, trees, found)
+
+
+def read_blocks(file, blocks=('RATES', 'R8S'), mmap=False):
+    """
+    Return the named blocks of a NEXUS file as a list of Block, in a
+    single streaming pass. Trees are skipped without being parsed.
+    """
+    items = _read(file, mmap, tuple(name.upper().encode() for name in blocks),
+        lambda number: False)
+    next(items, None)
+    return list(items)
+
+
+def _seek(file, offsets, start, mmap):
+    """Read trees starting with the given one, according to offsets"""
+    with _open(file) as input:
+        if not offsets.nexus:
+            yield from _newick_all(_tokens(input, mmap, offsets.tree[start]))
+            return
+        translate = {}
+        if offsets.translate[start] >= 0:
+            tokens = _tokens(input, mmap, offsets.translate[start])
+            next(tokens)
+            translate = _translate(tokens)
+        tokens = _tokens(input, mmap, offsets.tree[start])
+        yield from _nexus(tokens, b'TREES', translate)
+
+
+def to_dendropy(tree):
+    """Convert an ArrayTree to a dendropy tree, named after the tree"""
+    dendrotree, nodes = extensions.tree_from_arrays(
+        tree.parent, tree.length, tree.label, range(len(tree.parent)))
+    dendrotree.label = tree.name
+    return dendrotree
+
+
+def read_tree(file, number, mmap=True):
+    """
+    Return a single tree from a file, given its zero-based number.
+    Seeks straight to the tree using the offset index, see index().
+    """
+    for tree in read(file, mmap=mmap, start=number, stop=number + 1):
+        return tree
+    raise IndexError('Tree {0} not found in: {1}'.format(number, file))
+
+
+##############################################################################
+### Newick output
+
+# Labels matching this are quoted when written, as dendropy does
+_PROTECT = re.compile(r'''[()[\]{},;:'"\0\t\n]''')
+
+_BUFFER = 1 << 12
+
+
+def _quote(label):
+    """Protect a label for writing, spaces become underscores if possible"""
+    if '_' not in label and not _PROTECT.search(label):
+        return label.replace(' ', '_').replace('\t', '_')
+    return "'" + label.replace("'", "''") + "'"
+
+
+def _number(precision):
+    """Return a function formatting lengths with given significant digits"""
+    if precision is None:
+        return lambda value: repr(float(value))
+    specifier = '{{:.{}g}}'.format(precision)
+    return specifier.format
+
+
+def write_newick(output, parent, length, label, precision=None,
+        rooted=False):
+    """
+    Write a tree given in preorder to a text file handle as Newick.
+    Each node is given by the position of its parent (-1 for the root),
+    its branch length and label, with None (or nan for lengths) where
+    missing. Lengths are written with the given number of significant
+    digits, or in full if None. Text is written in chunks as it is
+    produced, so the whole string is never built.
+    """
+    number = _number(precision)
+    n = len(parent)
+    inner = [False] * n
+    for k in range(1, n):
+        inner[parent[k]] = True
+
+    def suffix(k):
+        text = ''
+        if label[k] is not None:
+            text = _quote(label[k])
+        value = length[k]
+        if value is not None and value == value:
+            text += ':' + number(value)
+        return text
+
+    parts = ['[&R] '] if rooted else []
+    # Open ancestors of the current node, with whether a child was written
+    stack = []
+    written = []
+    for k in range(n):
+        while stack and stack[-1] != parent[k]:
+            parts.append(')' + suffix(stack.pop()))
+            written.pop()
+        if written:
+            if written[-1]:
+                parts.append(',')
+            written[-1] = True
+        if inner[k]:
+            parts.append('(')
+            stack.append(k)
+            written.append(False)
+        else:
+            parts.append(suffix(k))
+        if len(parts) > _BUFFER:
+            output.write(''.join(parts))
+            parts = []
+    while stack:
+        parts.append(')' + suffix(stack.pop()))
+    parts.append(';\n')
+    output.write(''.join(parts))
+
+
+def newick(parent, length, label, precision=None, rooted=False):
+    """Return a tree given in preorder as a Newick string, see write_newick()"""
+    output = io.StringIO()
+    write_newick(output, parent, length, label, precision, rooted)
+    return output.getvalue()
+
+
+##############################################################################
+### Offset index
+
+Offsets = collections.namedtuple('Offsets', ['nexus', 'tree', 'translate'])
+Offsets.__doc__ = """
+Byte offsets of each tree statement in a file, as well as the offsets of
+the translate commands in effect for NEXUS files (-1 where missing).
+Offsets refer to decompressed data for gzip files.
+"""
+
+_INDEX_SUFFIX = '.index.npz'
+
+
+def _index_path(file):
+    return file + _INDEX_SUFFIX
+
+
+def _scan(file):
+    """Find the offsets of all trees in a single pass"""
+    state = [0]
+    trees = []
+    translates = []
+    with _open(file) as input:
+        tokens = _tokens(input, state=state)
+        first = _start(tokens)
+        if first is None:
+            nexus = False
+        elif first is not True:
+            nexus = False
+            for kind, value in first:
+                if kind == 'comment':
+                    continue
+                trees.append(state[0])
+                if not (kind == 'punctuation' and value == b';'):
+                    _skip_command(first)
+        else:
+            nexus = True
+            block = None
+            translate = -1
+            for kind, value in tokens:
+                if kind == 'comment':
+                    continue
+                word = _upper(kind, value)
+                if block is None:
+                    if word == b'BEGIN':
+                        kind, value = next(tokens)
+                        block = value.upper()
+                        _skip_command(tokens)
+                elif word in (b'END', b'ENDBLOCK'):
+                    _skip_command(tokens)
+                    block = None
+                    translate = -1
+                elif word == b';':
+                    continue
+                elif block == b'TREES' and word == b'TRANSLATE':
+                    translate = state[0]
+                    _skip_command(tokens)
+                elif block == b'TREES' and word in (b'TREE', b'UTREE'):
+                    trees.append(state[0])
+                    translates.append(translate)
+                    _skip_command(tokens)
+                else:
+                    _skip_command(tokens)
+    return Offsets(nexus,
+        np.array(trees, dtype=np.int64),
+        np.array(translates if nexus else [-1] * len(trees), dtype=np.int64))
+
+
+def index(file):
+    """
+    Scan the file once and save the offset of every tree in a sidecar
+    file next to it, so that read() and read_tree() may seek directly
+    to any tree later. The sidecar is replaced atomically and becomes
+    stale once the file is modified. Returns the Offsets.
+    """
+    offsets = _scan(file)
+    stat = os.stat(file)
+    path = _index_path(file)
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            np.savez(output, nexus=offsets.nexus, tree=offsets.tree,
+                translate=offsets.translate,
+                size=stat.st_size, mtime=stat.st_mtime_ns)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return offsets
+
+
+def load_index(file):
+    """Return saved Offsets for the file, or None if missing or stale"""
+    try:
+        with np.load(_index_path(file)) as data:
+            stat = os.stat(file)
+            if (int(data['size']) != stat.st_size or
+                    int(data['mtime']) != stat.st_mtime_ns):
+                return None
+            return Offsets(bool(data['nexus']),
+                data['tree'], data['translate'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def count(file):
+    """Number of trees in the file, using the offset index"""
+    offsets = load_index(file)
+    if offsets is None:
+        offsets = index(file)
+    return len(offsets.tree)
+
+
+##############################################################################
+### Binary tree sets
+
+_SET_SUFFIX = '.trees.npz'
+
+
+def _set_path(file):
+    return file + _SET_SUFFIX
+
+
+def _pack(strings):
+    """Concatenate strings as UTF-8, None is marked as missing"""
+    encoded = [b'' if x is None else x.encode() for x in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    missing = np.array([x is None for x in strings], dtype=bool)
+    return data, offsets, missing
+
+
+def _unpack(data, offsets, missing, start, stop):
+    """Decode strings from start up to stop, see _pack()"""
+    blob = bytes(data[offsets[start]:offsets[stop]])
+    base = offsets[start]
+    return [None if missing[i] else
+        blob[offsets[i] - base:offsets[i + 1] - base].decode()
+        for i in range(start, stop)]
+
+
+def _digest(file):
+    """SHA-256 of file contents"""
+    digest = hashlib.sha256()
+    with open(file, 'rb') as input:
+        for chunk in iter(lambda: input.read(_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _map_npz(path):
+    """
+    Memory-map every array stored in an uncompressed npz archive,
+    as written by numpy.savez(). Returns a dictionary of arrays.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as input:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('Cannot map compressed member: {}'.
+                    format(info.filename))
+            # Skip the local file header to reach the npy data
+            input.seek(info.header_offset)
+            header = input.read(30)
+            name, extra = struct.unpack('<HH', header[26:30])
+            input.seek(info.header_offset + 30 + name + extra)
+            version = np.lib.format.read_magic(input)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(input)
+            else:
+                header = np.lib.format.read_array_header_2_0(input)
+            shape, fortran, dtype = header
+            key = info.filename[:-len('.npy')]
+            if not np.prod(shape):
+                arrays[key] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[key] = np.memmap(path, dtype=dtype, mode='r',
+                offset=input.tell(), shape=shape,
+                order='F' if fortran else 'C')
+    return arrays
+
+
+class TreeSet:
+    """
+    All trees of a file as concatenated arrays, usually memory-mapped
+    from a binary tree set written by save(). Trees are accessed by
+    number, or iterated over, as ArrayTree. Also keeps whether the
+    file is NEXUS and its RATES blocks, see read_file().
+    """
+
+    def __init__(self, arrays):
+        self._arrays = arrays
+        self.nodes = arrays['nodes']
+        self.nexus = bool(arrays['nexus'])
+        names = _unpack(arrays['block_name_data'], arrays['block_name_offsets'],
+            arrays['block_name_missing'], 0, len(arrays['block_name_missing']))
+        texts = _unpack(arrays['block_data'], arrays['block_offsets'],
+            arrays['block_missing'], 0, len(arrays['block_missing']))
+        self.blocks = [Block(name, text) for name, text in zip(names, texts)]
+
+    def __len__(self):
+        return len(self.nodes) - 1
+
+    def __getitem__(self, number):
+        if number < 0:
+            number += len(self)
+        if not 0 <= number < len(self):
+            raise IndexError('Tree number out of range: {}'.format(number))
+        arrays = self._arrays
+        start, stop = int(self.nodes[number]), int(self.nodes[number + 1])
+        name = _unpack(arrays['name_data'], arrays['name_offsets'],
+            arrays['name_missing'], number, number + 1)[0]
+        label = _unpack(arrays['label_data'], arrays['label_offsets'],
+            arrays['label_missing'], start, stop)
+        return ArrayTree(name,
+            np.array(arrays['parent'][start:stop], dtype=int),
+            np.array(arrays['length'][start:stop], dtype=float),
+            label)
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self[number]
+
+
+def _set_arrays(contents):
+    """Concatenate the trees and blocks of Contents into named arrays"""
+    arrays = {}
+    names = []
+    labels = []
+    parents = []
+    lengths = []
+    nodes = [0]
+    for tree in contents.trees:
+        names.append(tree.name)
+        labels.extend(tree.label)
+        parents.append(np.asarray(tree.parent, dtype=np.int32))
+        lengths.append(np.asarray(tree.length, dtype=float))
+        nodes.append(nodes[-1] + len(tree.parent))
+    arrays['nodes'] = np.array(nodes, dtype=np.int64)
+    arrays['parent'] = np.concatenate(parents or [np.empty(0, np.int32)])
+    arrays['length'] = np.concatenate(lengths or [np.empty(0)])
+    for prefix, strings in [
+            ('label_', labels), ('name_', names),
+            ('block_name_', [block.name for block in contents.blocks]),
+            ('block_', [block.text for block in contents.blocks])]:
+        data, offsets, missing = _pack(strings)
+        arrays[prefix + 'data'] = data
+        arrays[prefix + 'offsets'] = offsets
+        arrays[prefix + 'missing'] = missing
+    arrays['nexus'] = np.bool_(contents.nexus)
+    return arrays
+
+
+def save(file, contents=None):
+    """
+    Read all trees and RATES blocks of the file in a single pass, unless
+    Contents are given, and write them as a binary tree set next to it.
+    The set records the size, modification time and SHA-256 hash of the
+    file, and is replaced atomically. Returns the path of the set.
+    """
+    if contents is None:
+        contents = read_file(file)
+    return _write_set(file, _set_arrays(contents), _digest(file))
+
+
+def _write_set(file, arrays, digest):
+    """Write arrays as the binary tree set of the file, stamped as it is now"""
+    stat = os.stat(file)
+    path = _set_path(file)
+    stamps = ('size', 'mtime', 'sha256')
+    arrays = {key: arrays[key] for key in arrays if key not in stamps}
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            np.savez(output, **arrays,
+                size=np.int64(stat.st_size), mtime=np.int64(stat.st_mtime_ns),
+                sha256=np.frombuffer(bytes.fromhex(digest), np.uint8))
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return path
+
+
+def load(file, write=True):
+    """
+    Return all trees of the file as a TreeSet, memory-mapped from the
+    binary tree set next to it. The set is used if the file has the same
+    modification time and size as recorded, or failing that, the same
+    hash. Otherwise it is written anew if `write` is set. If it cannot
+    be written, trees are read into memory instead. When only the
+    modification time changed, the set is stamped again if `write` is
+    set, so the file is not hashed on every load.
+    """
+    path = _set_path(file)
+    try:
+        arrays = _map_npz(path)
+        stat = os.stat(file)
+        if int(arrays['size']) == stat.st_size:
+            if int(arrays['mtime']) == stat.st_mtime_ns:
+                return TreeSet(arrays)
+            digest = _digest(file)
+            if bytes(arrays['sha256']).hex() == digest:
+                if write:
+                    try:
+                        arrays = _map_npz(_write_set(file, arrays, digest))
+                    except OSError:
+                        pass
+                return TreeSet(arrays)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        pass
+    contents = read_file(file)
+    if write:
+        try:
+            return TreeSet(_map_npz(save(file, contents)))
+        except OSError:
+            pass
+    return TreeSet(_set_arrays(contents))
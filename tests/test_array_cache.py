@@ -0,0 +1,65 @@
+import contextlib
+import io
+from pathlib import Path
+
+import numpy as np
+
+from pyr8s import core, parse
+
+here = Path(__file__).parent
+
+
+def ages(min=None):
+    """Ages of legacy_1 with a fixed seed and optional ANGIO minimum"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis = parse.from_file(str(here / 'legacy_1'))
+        analysis.param.general.seed = 1
+        analysis.tree.find_taxon_node('ANGIO').min = min
+        return np.array(analysis.run().table['Age'])
+
+
+def test_hit_gives_identical_ages(monkeypatch):
+    monkeypatch.setattr(core.Array, 'cache', core.ArrayCache(maxsize=0))
+    expected = ages()
+    cache = core.ArrayCache()
+    monkeypatch.setattr(core.Array, 'cache', cache)
+    first = ages()
+    assert (cache.hits, cache.misses) == (0, 1)
+    second = ages()
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert np.array_equal(first, expected)
+    assert np.array_equal(second, expected)
+    # Other constraints are not a hit
+    ages(min=260)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.info()['size'] == 2
+
+
+def test_eviction(monkeypatch):
+    cache = core.ArrayCache(maxsize=2)
+    cache.put('a', {'x': 1})
+    cache.put('b', {'x': 2})
+    assert cache.get('a') == {'x': 1}
+    cache.put('c', {'x': 3})
+    # Least recently used was evicted
+    assert cache.get('b') is None
+    assert cache.get('a') == {'x': 1}
+    assert cache.get('c') == {'x': 3}
+    assert cache.info()['size'] == 2
+    cache.clear()
+    assert cache.info()['size'] == 0 and cache.hits == 0
+
+    cache = core.ArrayCache(maxsize=1)
+    monkeypatch.setattr(core.Array, 'cache', cache)
+    ages()
+    ages(min=260)
+    ages()
+    assert (cache.hits, cache.misses) == (0, 3)
+    assert cache.info()['size'] == 1
+
+
+def test_disabled():
+    cache = core.ArrayCache(maxsize=0)
+    cache.put('a', {'x': 1})
+    assert cache.get('a') is None
+    assert cache.info()['size'] == 0
@@ -0,0 +1,42 @@
+import contextlib
+import io
+from pathlib import Path
+
+from pyr8s import parse
+
+here = Path(__file__).parent
+
+
+def repeated(tmp_path, count):
+    """NEXUS file with the tree of legacy_1 repeated, and its RATES block"""
+    text = (here / 'legacy_1').read_text()
+    head, tree, tail = text.partition('tree PAUP_9')
+    line, _, tail = tail.partition('\n')
+    trees = ''.join('tree PAUP_{0}{1}\n'.format(i, line) for i in range(count))
+    file = tmp_path / 'repeated.nex'
+    file.write_text(head + trees + tail)
+    return str(file)
+
+
+def test_batch_applies_programs_to_every_tree(tmp_path):
+    file = repeated(tmp_path, 3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = parse.from_file(str(here / 'legacy_1'), run=True).results
+        parse._intern.cache_clear()
+        results = list(parse.batch(file, workers=1))
+    assert len(results) == 3
+    for result in results:
+        assert result.table['Node'] == expected.table['Node']
+        assert result.table['Age'][0] == 450
+    # One program replayed for all trees, the cache stays bounded
+    info = parse._intern.cache_info()
+    assert info.misses == 1 and info.hits == 2
+    assert info.maxsize is not None
+
+
+def test_batch_slice(tmp_path):
+    file = repeated(tmp_path, 4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = list(parse.batch(file, workers=1, start=1, stop=3))
+        names = [result.tree.label for result in results]
+    assert names == ['PAUP 1', 'PAUP 2']
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from pyr8s import parse
+from pyr8s.cache import ResultCache
+
+here = Path(__file__).parent
+
+
+class Stale:
+    pass
+
+
+def test_stale_entry_is_dropped(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put('key', {'value': 1})
+    assert cache.get('key') == {'value': 1}
+    # Refers to a class that no longer exists
+    data = pickle.dumps(Stale()).replace(b'Stale', b'Gone_')
+    with open(cache._file('key'), 'wb') as file:
+        file.write(data)
+    assert cache.get('key') is None
+    assert not os.path.exists(cache._file('key'))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_truncated_entry_is_dropped(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put('key', list(range(100)))
+    with open(cache._file('key'), 'r+b') as file:
+        file.truncate(10)
+    assert cache.get('key') is None
+    assert cache.entries() == []
+
+
+def analysis():
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis = parse.from_file(str(here / 'legacy_1'))
+    analysis.param.general.seed = 1
+    return analysis
+
+
+def test_run_uses_cache(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = analysis().run(cache=cache)
+        assert (cache.hits, cache.misses) == (0, 1)
+        # Identical analysis is a hit
+        again = analysis().run(cache=cache)
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert np.array_equal(again.table['Age'], results.table['Age'])
+        # Parameter change is a miss
+        other = analysis()
+        other.param.method.exponent = 3
+        other.run(cache=cache)
+        assert (cache.hits, cache.misses) == (1, 2)
+        # Calibration change is a miss
+        other = analysis()
+        other.tree.find_taxon_node('ANGIO').min = 260
+        other.run(cache=cache)
+        assert (cache.hits, cache.misses) == (1, 3)
+    assert len(cache.entries()) == 3
@@ -0,0 +1,97 @@
+import contextlib
+import io
+from pathlib import Path
+
+import pytest
+
+from pyr8s import parse
+
+here = Path(__file__).parent
+
+
+def analysis():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parse.from_file(str(here / 'legacy_1'))
+
+
+def calibrations(analysis):
+    return {node.label: (node.fix, node.min, node.max)
+        for node in analysis.tree.preorder_node_iter()
+        if not node.is_leaf() and
+            any(x is not None for x in (node.fix, node.min, node.max))}
+
+
+def test_tsv(tmp_path):
+    file = tmp_path / 'calibrations.tsv'
+    file.write_text(
+        'node\ttaxa\tfix\tmin\tmax\n'
+        'SEED\tGinkgo Pisum\t\t290\t350\n'
+        'EUDI\tRanunculus,Carya\t\t\t150\n'
+        'LP\t\t450\t\t\n')
+    target = analysis()
+    nodes = target.calibrate(str(file))
+    assert [node.label for node in nodes] == ['SEED', 'EUDI', 'LP']
+    assert calibrations(target) == {
+        'LP': (450, None, None),
+        'SEED': (None, 290, 350),
+        'EUDI': (None, None, 150),
+        }
+    # Existing ancestors are renamed
+    tree = target.tree
+    assert tree.find_taxon_node('SP') is None
+    assert tree.find_taxon_node('SEED') is tree.clade_mrca(['Ginkgo', 'Pisum'])
+    assert tree.find_taxon_node('EUDI') is tree.clade_mrca(['Ranunculus', 'Carya'])
+
+
+def test_csv_matches_tsv(tmp_path):
+    rows = [['taxa', 'min', 'max'], ['Ginkgo;Pisum', '290', '350'],
+        ['Cycas Zamia', '', '300']]
+    tsv = tmp_path / 'calibrations.tsv'
+    tsv.write_text(''.join('\t'.join(row) + '\n' for row in rows))
+    csv = tmp_path / 'calibrations.csv'
+    csv.write_text(''.join(','.join(row) + '\n' for row in rows))
+    # Delimiter is sniffed without a known extension
+    sniffed = tmp_path / 'calibrations.txt'
+    sniffed.write_text(csv.read_text())
+    expected = None
+    for file in [tsv, csv, sniffed]:
+        target = analysis()
+        target.calibrate(str(file))
+        if expected is None:
+            expected = calibrations(target)
+        assert calibrations(target) == expected
+    assert expected['SP'] == (None, 290, 350)
+    assert expected['CYC'] == (None, None, 300)
+
+
+def test_conflicts_are_reported_together(tmp_path):
+    file = tmp_path / 'calibrations.tsv'
+    file.write_text(
+        'node\ttaxa\tfix\tmin\tmax\n'
+        'A\tGinkgo Missing\t\t290\t\n'
+        'Nowhere\t\t100\t\t\n'
+        'B\tCycas Zamia\t\t300\t200\n'
+        'C\tCycas Zamia\t100\t50\t\n'
+        'D\tGinkgo Pisum\t\tyoung\t\n'
+        'E\tGinkgo Pisum\t\t290\t\n'
+        'F\tPisum Ginkgo\t\t280\t\n')
+    target = analysis()
+    before = calibrations(target)
+    with pytest.raises(ValueError) as info:
+        target.calibrate(str(file))
+    message = str(info.value)
+    assert 'Line 2: Taxa not found: Missing' in message
+    assert 'Line 3: Node not found: Nowhere' in message
+    assert 'Line 4: Minimum age 300.0 exceeds maximum 200.0.' in message
+    assert 'Line 5: Cannot both fix and bound an age.' in message
+    assert 'Line 6: Bad min value: young' in message
+    assert 'Line 8: Node already calibrated differently on line 7.' in message
+    # Nothing was changed
+    assert calibrations(target) == before
+
+
+def test_unknown_column(tmp_path):
+    file = tmp_path / 'calibrations.tsv'
+    file.write_text('taxa\tage\nCycas Zamia\t100\n')
+    with pytest.raises(ValueError, match='Unrecognised calibration column'):
+        analysis().calibrate(str(file))
@@ -0,0 +1,46 @@
+import contextlib
+import io
+from pathlib import Path
+
+from pyr8s import parse
+
+here = Path(__file__).parent
+
+
+def test_cross_validate_folds():
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis = parse.from_file(str(here / 'legacy_1'))
+        analysis.tree.find_taxon_node('ANGIO').min = 130
+        analysis.tree.find_taxon_node('SP').max = 320
+        results = analysis.cross_validate(workers=1)
+    table = results.cross_validation
+    assert table['n'] == 3
+    assert set(table) == {'n', 'Node', 'Fix', 'Min', 'Max',
+        'Age', 'Error', 'Relative', 'Failure'}
+    for key in table:
+        if key != 'n':
+            assert len(table[key]) == 3
+    # Calibrations in preorder
+    assert table['Node'] == ['LP', 'SP', 'ANGIO']
+    assert table['Fix'] == [450, None, None]
+    assert table['Min'] == [None, None, 130]
+    assert table['Max'] == [None, 320, None]
+    # Removing the fixed root age still leaves a maximum
+    for row in range(3):
+        assert table['Failure'][row] is None
+        assert table['Age'][row] > 0
+    # Error is zero if predicted above the removed minimum
+    angio = table['Age'][2]
+    assert table['Error'][2] == min(angio - 130, 0)
+
+
+def test_cross_validate_reports_failure():
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis = parse.from_file(str(here / 'legacy_1'))
+        results = analysis.cross_validate(workers=1)
+    table = results.cross_validation
+    assert table['n'] == 1
+    assert table['Node'] == ['LP']
+    assert table['Age'] == [None]
+    assert table['Error'] == [None]
+    assert 'Not enough constraints' in table['Failure'][0]
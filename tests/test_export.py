@@ -0,0 +1,54 @@
+import io
+import pickle
+from pathlib import Path
+
+import dendropy
+
+from pyr8s.export import ResultsWriter, write_table
+
+here = Path(__file__).parent
+
+
+def load_legacy():
+    with open(here / 'legacy_pickled.r8s', 'rb') as file:
+        return pickle.load(file).results
+
+
+def test_legacy_write_table():
+    results = load_legacy()
+    output = io.StringIO()
+    write_table(output, results)
+    rows = output.getvalue().splitlines()
+    assert len(rows) == results.table['n']
+    assert rows[0].split('\t') == ['LP', '450.0', '0.0']
+
+
+def test_writer_input_order(tmp_path):
+    results = load_legacy()
+    chronogram = tmp_path / 'chronogram.nex'
+    table = tmp_path / 'table.tsv'
+    with ResultsWriter(chronogram=str(chronogram), table=str(table),
+            buffer=100) as writer:
+        writer.add(results, 2)
+        writer.add(results, 0)
+        writer.add(None)
+        writer.add(results, 1)
+    trees = dendropy.TreeList.get(path=str(chronogram), schema='nexus')
+    assert [tree.label for tree in trees] == ['tree 0', 'tree 1', 'tree 2']
+    rows = table.read_text().splitlines()
+    assert rows[0] == 'Tree\tNode\tAge\tRate'
+    assert len(rows) == 1 + 3 * results.table['n']
+    assert [row.split('\t')[0] for row in rows[1:]] == sorted(
+        row.split('\t')[0] for row in rows[1:])
+
+
+def test_writer_implicit_after_explicit(tmp_path):
+    results = load_legacy()
+    output = tmp_path / 'ratogram.nwk'
+    writer = ResultsWriter(ratogram=str(output), schema='newick')
+    writer.add(results, 1)
+    writer.add(results)
+    writer.add(results, 0)
+    writer.close()
+    assert writer.written == 3
+    assert len(output.read_text().splitlines()) == 3
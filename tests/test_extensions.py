@@ -0,0 +1,171 @@
+import contextlib
+import io
+import pickle
+import random
+from pathlib import Path
+
+import dendropy
+import pytest
+
+from pyr8s import extensions
+from pyr8s.extensions import TreePlus
+
+
+here = Path(__file__).parent
+
+
+def indexed_tree(newick):
+    tree = dendropy.Tree.get(data=newick, schema='newick')
+    TreePlus.extend(tree)
+    tree.index()
+    return tree
+
+
+def test_copy_forgets_index():
+    tree = indexed_tree('((a:1,b:2):1,((c:1,d:1):2,e:3):1);')
+    # Build both indexes on the source
+    tree.find_taxon_node('a')
+    tree.clade_mrca(['c', 'e'])
+    other = extensions.copy_tree(tree)
+    nodes = set(other.preorder_node_iter())
+    assert other.find_taxon_node('a') in nodes
+    assert other.clade_mrca(['c', 'e']) in nodes
+    assert other.clade_mrca(['c', 'e']) is not tree.clade_mrca(['c', 'e'])
+
+
+def reference_collapse(tree):
+    """Remove zero-length branches one by one, as done originally"""
+    remove = []
+    for node in tree.postorder_node_iter_noroot():
+        if node.is_terminal_zero():
+            if node.parent_node.min is None:
+                node.parent_node.min = 0
+        elif node.subs == 0:
+            remove.append(node)
+    for node in remove:
+        if node.fix is not None:
+            node.max = node.fix
+            node.min = node.fix
+        parent = node.parent_node
+        for child in node.child_node_reversed_iter():
+            parent.add_child_after(node, child)
+            if node.max is not None:
+                if child.max is not None:
+                    child.max = min(child.max, node.max)
+                if child.max is None and child.fix is None:
+                    child.max = node.max
+        if node.min is not None:
+            if parent.min is not None:
+                parent.min = max(parent.min, node.min)
+            if parent.min is None and parent.fix is None:
+                parent.min = node.min
+        parent.remove_child(node)
+
+
+def random_tree(generator, leaves):
+    """Random extended tree with many zero-length branches and constraints"""
+    nodes = [dendropy.Node(label='t0')]
+    for i in range(1, leaves):
+        parent = generator.choice(nodes)
+        parent.add_child(dendropy.Node(label='t{}'.format(i)))
+        nodes.append(parent._child_nodes[-1])
+    for node in nodes:
+        if node.is_leaf():
+            continue
+        # Keep some nodes with a single child
+        if len(node._child_nodes) == 1 and generator.random() < 0.5:
+            node.add_child(dendropy.Node(label=node.label + 'x'))
+    tree = dendropy.Tree(seed_node=nodes[0])
+    for k, node in enumerate(tree.preorder_node_iter()):
+        node.label = 'n{}'.format(k)
+        node.edge_length = generator.choice([0, 0, 1, 2])
+    TreePlus.extend(tree)
+    tree.ground()
+    for node in tree.preorder_node_iter():
+        if node.is_leaf():
+            continue
+        roll = generator.random()
+        if roll < 0.1:
+            node.fix = generator.randint(50, 100)
+        elif roll < 0.3:
+            node.min = generator.randint(1, 50)
+        elif roll < 0.5:
+            node.max = generator.randint(50, 150)
+    tree.calc_subs(None, False)
+    return tree
+
+
+def describe(tree):
+    return [(node.label, node.parent_node and node.parent_node.label,
+        node.fix, node.min, node.max) for node in tree.preorder_node_iter()]
+
+
+def test_collapse_matches_reference():
+    generator = random.Random(1)
+    for trial in range(50):
+        tree = random_tree(generator, generator.randint(2, 40))
+        other = extensions.copy_tree(tree)
+        with contextlib.redirect_stdout(io.StringIO()):
+            tree.collapse()
+        reference_collapse(other)
+        assert describe(tree) == describe(other)
+        for node in tree.preorder_node_iter():
+            for child in node._child_nodes:
+                assert child.parent_node is node
+
+
+def naive_ancestor(nodes):
+    """Deepest node on the paths from all given nodes to the root"""
+    paths = []
+    for node in nodes:
+        path = []
+        while node is not None:
+            path.append(node)
+            node = node.parent_node
+        paths.append(path[::-1])
+    ancestor = None
+    for level in zip(*paths):
+        if any(node is not level[0] for node in level):
+            break
+        ancestor = level[0]
+    return ancestor
+
+
+def test_common_ancestor_matches_naive():
+    generator = random.Random(2)
+    for trial in range(30):
+        tree = random_tree(generator, generator.randint(2, 60))
+        nodes = list(tree.preorder_node_iter())
+        for query in range(20):
+            chosen = generator.sample(nodes, generator.randint(1, min(5, len(nodes))))
+            assert tree.common_ancestor(chosen) is naive_ancestor(chosen)
+        # Indexes are rebuilt after changing the topology
+        with contextlib.redirect_stdout(io.StringIO()):
+            tree.collapse()
+        nodes = list(tree.preorder_node_iter())
+        chosen = generator.sample(nodes, min(3, len(nodes)))
+        assert tree.common_ancestor(chosen) is naive_ancestor(chosen)
+
+
+def test_clade_mrca_by_label():
+    tree = indexed_tree('((a:1,b:2):1,((c:1,d:1):2,e:3):1);')
+    assert tree.clade_mrca(['C', 'd']) is tree.find_taxon_node('c').parent_node
+    assert tree.clade_mrca(['a', 'e']) is tree.seed_node
+    tree.label_mrca('CD', ['c', 'd'])
+    assert tree.find_taxon_node('cd') is tree.find_taxon_node('c').parent_node
+    with pytest.raises(KeyError):
+        tree.clade_mrca(['a', 'missing'])
+
+
+def test_legacy_pickle_label_lookup():
+    with open(here / 'legacy_pickled.r8s', 'rb') as file:
+        analysis = pickle.load(file)
+    tree = analysis.tree
+    leaf = next(tree.leaf_node_iter())
+    label = leaf.taxon.label
+    assert tree.find_taxon_node(label.lower()) is leaf
+    other = next(node for node in tree.leaf_node_iter() if node is not leaf)
+    tree.label_mrca('PAIR', [label, other.taxon.label])
+    assert tree.find_taxon_node('pair') is tree.common_ancestor([leaf, other])
+    TreePlus.strip(tree)
+    assert type(tree) is dendropy.Tree
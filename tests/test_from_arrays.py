@@ -0,0 +1,55 @@
+import contextlib
+import copy
+import io
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pyr8s import parse
+from pyr8s.core import ArrayResults, RateAnalysis
+
+here = Path(__file__).parent
+
+
+def analyses(shuffle):
+    """Tree analysis of legacy_1 and the same from arrays"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis = parse.from_file(str(here / 'legacy_1'))
+    analysis.param.general.seed = 1
+    nodes = list(analysis.tree.preorder_node_iter())
+    if shuffle:
+        order = np.random.default_rng(0).permutation(len(nodes))
+        nodes = [nodes[i] for i in order]
+    position = {node: k for k, node in enumerate(nodes)}
+    other = RateAnalysis.from_arrays(
+        [position.get(node.parent_node, -1) for node in nodes],
+        [node.edge_length for node in nodes],
+        [node.label for node in nodes],
+        fix=[node.fix for node in nodes],
+        min=[node.min for node in nodes],
+        max=[node.max for node in nodes])
+    other.param = copy.deepcopy(analysis.param)
+    return analysis, other
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_matches_tree_run(shuffle):
+    analysis, other = analyses(shuffle)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = analysis.run()
+        results = other.run()
+    assert isinstance(results, ArrayResults)
+    assert results.flags == expected.flags
+    ages = dict(zip(expected.table['Node'], expected.table['Age']))
+    rates = dict(zip(expected.table['Node'], expected.table['Rate']))
+    # Nodes merged by collapsing are missing from the tree results
+    compared = [k for k, label in enumerate(results.label) if label in ages]
+    assert len(compared) == expected.table['n']
+    # Shuffled nodes change the order of variables during optimization
+    tolerance = 1e-3 if shuffle else 1e-9
+    for k in compared:
+        label = results.label[k]
+        assert np.isclose(results.age[k], ages[label], rtol=tolerance)
+        assert np.isclose(results.rate[k], rates[label], rtol=tolerance)
+    assert sorted(results.table['Node']) == sorted(results.label)
@@ -0,0 +1,67 @@
+import pickle
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from pyr8s import params
+from pyr8s.param.core import ParamList
+
+root = Path(__file__).parent.parent
+
+
+def test_freeze_interns_equal_values():
+    first = ParamList(params.params).freeze()
+    second = ParamList(params.params).freeze()
+    assert first is second
+    assert first.freeze() is first
+    other = ParamList(params.params)
+    other.general.seed = 42
+    changed = other.freeze()
+    assert changed is not first
+    assert changed != first
+    assert changed.general.seed == 42
+
+
+def test_digest_is_stable():
+    param = ParamList(params.params)
+    frozen = param.freeze()
+    digest = frozen.digest
+    assert ParamList(params.params).freeze().digest == digest
+    # Same digest in another process
+    code = ('from pyr8s import params; from pyr8s.param.core import ParamList; '
+        'print(ParamList(params.params).freeze().digest)')
+    output = subprocess.run([sys.executable, '-c', code], cwd=str(root),
+        capture_output=True, text=True, check=True).stdout
+    assert output.strip() == digest
+    param.method.exponent = 3
+    assert param.freeze().digest != digest
+    param.method.exponent = frozen.method.exponent
+    assert param.freeze().digest == digest
+
+
+def test_pickle_round_trip():
+    param = ParamList(params.params)
+    param.general.seed = 7
+    frozen = param.freeze()
+    loaded = pickle.loads(pickle.dumps(frozen))
+    assert loaded == frozen
+    assert loaded.digest == frozen.digest
+    # Interned while the original is alive
+    assert loaded is frozen
+    assert loaded.as_dictionary() == frozen.as_dictionary()
+
+
+def test_source_changes_leave_frozen_copy():
+    param = ParamList(params.params)
+    frozen = param.freeze()
+    values = frozen.as_dictionary()
+    param.general.seed = 99
+    param.method.logarithmic = not values['logarithmic']
+    assert frozen.as_dictionary() == values
+    assert frozen.general.seed == values['seed']
+    with pytest.raises(AttributeError):
+        frozen.general.seed = 1
+    with pytest.raises(AttributeError):
+        frozen.general = None
@@ -0,0 +1,76 @@
+import contextlib
+import io
+from pathlib import Path
+
+import dendropy
+
+from pyr8s import core, parse
+
+here = Path(__file__).parent
+
+
+def program():
+    return parse.compile_rates_text(
+        parse.read_rates_blocks(str(here / 'legacy_1'))[0])
+
+
+def source():
+    return dendropy.Tree.get(path=str(here / 'legacy_1'), schema='nexus')
+
+
+def swapped(first, second):
+    """Tree of legacy_1 with two taxon labels exchanged"""
+    tree = source()
+    a = tree.find_node_with_taxon_label(first).taxon
+    b = tree.find_node_with_taxon_label(second).taxon
+    a.label, b.label = b.label, a.label
+    return tree
+
+
+def rotated():
+    """Tree of legacy_1 with the children of every node reversed"""
+    tree = source()
+    for node in tree.preorder_node_iter():
+        node._child_nodes.reverse()
+    return tree
+
+
+def constraints(analysis):
+    """Label and constraints of every labeled node, by its leaf set"""
+    tree = analysis.tree
+    return sorted((node.label, node.fix, node.min, node.max,
+        tuple(sorted(leaf.taxon.label for leaf in node.leaf_iter())))
+        for node in tree.preorder_node_iter()
+        if not node.is_leaf() and node.taxon is not None)
+
+
+def applied(program, tree):
+    analysis = core.RateAnalysis(tree)
+    with contextlib.redirect_stdout(io.StringIO()):
+        program.apply(analysis)
+    return analysis
+
+
+def test_replay_on_many_trees():
+    shared = program()
+    trees = [source(), source(), rotated(), source(), rotated()]
+    for tree in trees:
+        replayed = applied(shared, tree)
+        fresh = applied(program(), tree)
+        assert constraints(replayed) == constraints(fresh)
+        assert replayed.param.branch_length.nsites == 952
+    # Positions were found once for each distinct topology
+    assert (shared._positions.hits, shared._positions.misses) == (3, 2)
+
+
+def test_positions_follow_topology():
+    shared = program()
+    applied(shared, source())
+    # Same shape, but Lycopodium now sits next to the root
+    analysis = applied(shared, swapped('Marchantia', 'Lycopodium'))
+    assert shared._positions.misses == 2
+    tree = analysis.tree
+    assert tree.find_taxon_node('VP') is tree.seed_node
+    assert tree.find_taxon_node('LP') is tree.seed_node.child_nodes()[1]
+    assert constraints(analysis) == constraints(
+        applied(program(), swapped('Marchantia', 'Lycopodium')))
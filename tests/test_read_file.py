@@ -0,0 +1,68 @@
+import contextlib
+import io
+from pathlib import Path
+
+import dendropy
+import pytest
+
+from pyr8s import core, parse
+
+here = Path(__file__).parent
+
+
+def reference(file):
+    """Analysis read by dendropy, then RATES blocks tokenized, as originally"""
+    treelist = dendropy.TreeList.get(path=file, schema='nexus',
+        suppress_internal_node_taxa=True, suppress_leaf_node_taxa=False)
+    analysis = core.RateAnalysis(treelist[0])
+    with open(file) as input:
+        tokenizer = dendropy.dataio.nexusprocessing.NexusTokenizer(input)
+        tokenizer.next_token_ucase()
+        while not tokenizer.is_eof():
+            token = tokenizer.next_token_ucase()
+            while token is not None and token != 'BEGIN' \
+                    and not tokenizer.is_eof():
+                token = tokenizer.next_token_ucase()
+            token = tokenizer.next_token_ucase()
+            if token == 'RATES' or token == 'R8S':
+                parse.parse_rates(tokenizer, analysis)
+            else:
+                while not (token == 'END' or token == 'ENDBLOCK') \
+                        and not tokenizer.is_eof() and token is not None:
+                    tokenizer.skip_to_semicolon()
+                    token = tokenizer.next_token_ucase()
+    return analysis
+
+
+def describe(analysis):
+    return [(node.label,
+        None if node.taxon is None else node.taxon.label,
+        node.edge_length, node.fix, node.min, node.max,
+        len(node._child_nodes))
+        for node in analysis.tree.preorder_node_iter()]
+
+
+@pytest.mark.parametrize('name', ['legacy_sp', 'legacy_1', 'legacy_6',
+    'blommersia.nex', 'lacertidae.nex'])
+def test_single_pass_matches_reference(name):
+    file = str(here / name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = reference(file)
+        analysis = parse.from_file(file)
+    assert analysis.tree.label == expected.tree.label
+    assert describe(analysis) == describe(expected)
+    assert analysis.param.as_dictionary() == expected.param.as_dictionary()
+
+
+def test_rates_blocks_match_reference():
+    file = str(here / 'legacy_sp')
+    blocks = parse.read_rates_blocks(file)
+    assert len(blocks) == 1
+    with open(file) as input:
+        tokenizer = dendropy.dataio.nexusprocessing.NexusTokenizer(input)
+        token = None
+        while token not in ('RATES', 'R8S'):
+            assert not tokenizer.is_eof()
+            token = tokenizer.next_token_ucase()
+        expected = parse.compile_rates(tokenizer)
+    assert parse.compile_rates_text(blocks[0]) == expected
@@ -0,0 +1,121 @@
+import contextlib
+import io
+from pathlib import Path
+
+import numpy as np
+
+from pyr8s import core, parse
+
+here = Path(__file__).parent
+
+
+def quiet(function, *args, **kwargs):
+    """Call function with its output captured, return both"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        value = function(*args, **kwargs)
+    return value, output.getvalue()
+
+
+def analyzed():
+    analysis, _ = quiet(parse.from_file, str(here / 'legacy_1'))
+    quiet(analysis.run)
+    return analysis
+
+
+def boundaries(array):
+    return (list(array.fix), list(array.low), list(array.high),
+        array.variable_index.tolist())
+
+
+def fresh(analysis):
+    """Arrays prepared from scratch for the current tree"""
+    array = core.Array(analysis._frozen)
+    quiet(array.make, analysis.tree)
+    return array
+
+
+def test_bound_changed_matches_full():
+    analysis = analyzed()
+    array = analysis._array
+    time = array.time.copy()
+    generator = np.random.default_rng(0)
+    internal = [i for i in range(array.n) if array.children_index[i].size > 0]
+    for trial in range(20):
+        fix = list(array.user_fix)
+        low = list(array.user_min)
+        high = list(array.user_max)
+        for i in generator.choice(internal[1:], 3, replace=False):
+            roll = generator.random()
+            if roll < 0.3:
+                low[i] = float(time[i] * 0.9)
+            elif roll < 0.6:
+                high[i] = float(time[i] * 1.1)
+            else:
+                low[i] = high[i] = fix[i] = None
+        partial = array.detach()
+        partial.update(fix=fix, min=low, max=high)
+        full = array.detach()
+        full.user_fix, full.user_min, full.user_max = fix, low, high
+        full.bound()
+        assert boundaries(partial) == boundaries(full)
+
+
+def test_recalibrate_matches_make():
+    analysis = analyzed()
+    analysis.tree.find_taxon_node('ANGIO').min = 260
+    analysis.tree.find_taxon_node('SP').max = 350
+    array = analysis._array
+    assert array.recalibrate(analysis.tree)
+    other = fresh(analysis)
+    assert array.label == other.label
+    assert boundaries(array) == boundaries(other)
+    assert (array.user_fix, array.user_min, array.user_max) == \
+        (other.user_fix, other.user_min, other.user_max)
+
+
+def test_recalibrate_collapsed_requires_make():
+    analysis = analyzed()
+    # Collapsed, as its branch length is practically zero
+    analysis.tree.find_taxon_node('ChS').min = 100
+    assert not analysis._array.recalibrate(analysis.tree)
+
+
+def test_warm():
+    analysis = analyzed()
+    array = analysis._array
+    time = array.time.copy()
+    assert array.warm(time)
+    assert np.array_equal(array.time, time)
+    # Scaled to the fixed root age
+    assert array.warm(time * 2)
+    assert np.allclose(array.time, time)
+    # Infeasible times fall back to a guess
+    reversed_time = time.copy()
+    reversed_time[array.variable_index] = time[0] * 2
+    assert not array.warm(reversed_time)
+    assert np.all(array.time[array.parent_index[1:]] > array.time[1:])
+
+
+def test_unchanged_run_returns_results():
+    analysis = analyzed()
+    results = analysis.results
+    ages = np.array(results.table['Age'])
+    again, output = quiet(analysis.run)
+    assert again is results
+    assert 'Calibrations changed' not in output
+    assert np.array_equal(again.table['Age'], ages)
+
+
+def test_changed_calibration_reuses_arrays():
+    analysis = analyzed()
+    analysis.tree.find_taxon_node('ANGIO').min = 260
+    results, output = quiet(analysis.run)
+    assert 'Calibrations changed' in output
+    other, _ = quiet(parse.from_file, str(here / 'legacy_1'))
+    other.tree.find_taxon_node('ANGIO').min = 260
+    expected, _ = quiet(other.run)
+    assert results.table['Node'] == expected.table['Node']
+    assert np.allclose(results.table['Age'], expected.table['Age'], atol=1)
+    index = results.table['Node'].index('ANGIO')
+    assert results.table['Age'][index] >= 260
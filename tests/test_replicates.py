@@ -0,0 +1,110 @@
+import dendropy
+import numpy as np
+import pytest
+
+from pyr8s import parse
+
+
+def small_analysis():
+    tree = dendropy.Tree.get(
+        data='((a:1,b:2):1,((c:1,d:1):2,e:3):1);', schema='newick')
+    analysis = parse.from_tree(tree)
+    analysis.param.branch_length.format = 'total'
+    analysis.param.general.seed = 1
+    return analysis
+
+
+def test_bootstrap_logarithmic_zero_subs(capsys):
+    analysis = small_analysis()
+    analysis.param.method.logarithmic = True
+    results = analysis.bootstrap(replicates=20, workers=1)
+    assert 'without substitutions' in capsys.readouterr().out
+    assert results.bootstrap['failed'] == 0
+    assert np.all(np.isfinite(results.bootstrap['ages']))
+
+
+def calibrated_analysis():
+    analysis = small_analysis()
+    analysis.param.general.scalar = False
+    analysis.tree.seed_node.min = 10
+    analysis.tree.seed_node.max = 20
+    analysis.tree.find_taxon_node('c').parent_node.min = 4
+    return analysis
+
+
+def test_fixed_nodes_keep_barrier_membership():
+    analysis = calibrated_analysis()
+    analysis.run()
+    array = analysis._array
+    expected = [i for i in range(array.n)
+        if array.user_min[i] is not None or array.user_max[i] is not None]
+    assert list(array.constrained_index) == expected
+
+
+def test_profile_root_within_boundaries():
+    analysis = calibrated_analysis()
+    results = analysis.profile_root(points=3, workers=1)
+    assert results.profile['Root'] == [12.5, 15.0, 17.5]
+    assert None not in results.profile['Objective']
+    assert np.allclose(results.profile['ages'][:, 0], [12.5, 15.0, 17.5])
+    # Each point matches an analysis with the root fixed at that age
+    analysis = calibrated_analysis()
+    analysis.tree.seed_node.min = None
+    analysis.tree.seed_node.max = None
+    analysis.tree.seed_node.fix = 15.0
+    ages = analysis.run().table['Age']
+    assert np.allclose(results.profile['ages'][1], ages, atol=0.5)
+
+
+def test_stacked_rejects_other_methods():
+    analysis = small_analysis()
+    lengths = [[node.edge_length or 0 for node in analysis.tree.preorder_node_iter()]]
+    analysis.param.method.method = 'other'
+    with pytest.raises(ValueError, match='method'):
+        analysis.run_stacked(lengths, workers=1)
+
+
+def test_inside_keeps_off_boundaries():
+    analysis = calibrated_analysis()
+    analysis.run()
+    array = analysis._array
+    time = array.time.copy()
+    # Put the root on its high boundary
+    time[0] = array.high[0]
+    start = array.inside(time)
+    assert np.array_equal(array.time[1:], time[1:])
+    assert np.all(start[array.parent_index[1:]] > start[1:])
+    for i in range(array.n):
+        if array.fix[i] is not None:
+            assert start[i] == array.fix[i]
+        if array.low[i] is not None and array.fix[i] is None:
+            assert start[i] > array.low[i]
+        if array.high[i] is not None and array.fix[i] is None:
+            assert start[i] < array.high[i]
+    assert np.allclose(start, time, rtol=0.1)
+
+
+def test_bootstrap_warm_by_default():
+    results = calibrated_analysis().bootstrap(replicates=10, workers=1)
+    assert results.bootstrap['failed'] == 0
+    assert np.all(np.isfinite(results.bootstrap['ages']))
+    cold = calibrated_analysis().bootstrap(replicates=10, workers=1, warm=False)
+    assert np.allclose(results.bootstrap['ages'], cold.bootstrap['ages'],
+        rtol=0.05, atol=0.05)
+
+
+def test_monte_carlo_reports_failures():
+    analysis = calibrated_analysis()
+    analysis.tree.label_node(
+        analysis.tree.find_taxon_node('c').parent_node, 'CD')
+    # Sampled minimum ages above the root maximum are infeasible
+    results = analysis.monte_carlo(
+        {'CD': {'min': ('uniform', 4, 30)}}, replicates=20, workers=1)
+    table = results.monte_carlo
+    assert table['replicates'] == 20
+    assert 0 < table['failed'] < 20
+    assert len(table['errors']) == 20
+    assert sum(error is not None for error in table['errors']) == table['failed']
+    assert all('Impossible boundaries' in error
+        for error in table['errors'] if error is not None)
+    assert table['ages'].shape == (20 - table['failed'], table['n'])
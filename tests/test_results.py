@@ -0,0 +1,39 @@
+import io
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+here = Path(__file__).parent
+
+
+def load_legacy():
+    with open(here / 'legacy_pickled.r8s', 'rb') as file:
+        return pickle.load(file)
+
+
+def test_legacy_table_columns():
+    results = load_legacy().results
+    assert isinstance(results.table['Age'], np.ndarray)
+    assert isinstance(results.table['Rate'], np.ndarray)
+    assert len(results.table['Age']) == results.table['n']
+
+
+def test_legacy_write_newick():
+    results = load_legacy().results
+    for name in ['chronogram', 'ratogram']:
+        output = io.StringIO()
+        getattr(results, 'write_' + name)(output)
+        expected = getattr(results, name).as_string(schema='newick')
+        # Dendropy writes integer zeros without a decimal point
+        expected = expected.replace(':0,', ':0.0,').replace(':0)', ':0.0)')
+        assert output.getvalue() == expected
+
+
+def test_write_newick_precision():
+    results = load_legacy().results
+    output = io.StringIO()
+    results.write_chronogram(output, precision=3, rooted=False)
+    text = output.getvalue()
+    assert text.startswith('(Marchantia:450,')
+    assert text.endswith(';\n')
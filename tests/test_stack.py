@@ -0,0 +1,74 @@
+import contextlib
+import io
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pyr8s import core, parse
+
+here = Path(__file__).parent
+
+
+def prepared(logarithmic, exponent):
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis = parse.from_file(str(here / 'legacy_1'))
+    analysis.param.method.logarithmic = logarithmic
+    analysis.param.method.exponent = exponent
+    frozen = analysis._freeze()
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis._array.make(analysis.tree)
+    return analysis, core.Stack(analysis._array, frozen)
+
+
+def rows(analysis, count, generator):
+    """Substitution rows around those of the tree"""
+    subs = np.tile(analysis._array.subs, (count, 1))
+    subs[:, 1:] *= generator.uniform(0.5, 1.5, size=subs[:, 1:].shape)
+    return subs
+
+
+@pytest.mark.parametrize('logarithmic,exponent',
+    [(False, 2), (True, 2), (False, 3)])
+def test_gradient_matches_finite_differences(logarithmic, exponent):
+    analysis, stack = prepared(logarithmic, exponent)
+    generator = np.random.default_rng(0)
+    subs = rows(analysis, 3, generator)
+    z = generator.normal(size=(3, stack.variable_index.size))
+
+    def value(z):
+        time, x = stack.times(z)
+        return stack.objective(time, subs)[0]
+
+    time, x = stack.times(z)
+    w, rate, gradient = stack.objective(time, subs)
+    gradient = stack.gradient(time, x, gradient)
+    step = 1e-6
+    numeric = np.zeros(z.shape)
+    for j in range(z.shape[1]):
+        delta = np.zeros(z.shape)
+        delta[:, j] = step
+        numeric[:, j] = (value(z + delta) - value(z - delta)) / (2 * step)
+    assert np.allclose(gradient, numeric, rtol=1e-4,
+        atol=1e-6 * np.abs(numeric).max())
+
+
+@pytest.mark.parametrize('logarithmic', [False, True])
+def test_objective_matches_powell(logarithmic):
+    analysis, stack = prepared(logarithmic, 2)
+    generator = np.random.default_rng(1)
+    z = generator.normal(size=(1, stack.variable_index.size))
+    time, x = stack.times(z)
+    array = analysis._array
+    objective = analysis._build_objective_nprs()
+    expected = objective(time[0, array.variable_index])
+    w, rate, gradient = stack.objective(time, array.subs[None, :])
+    assert np.isclose(w[0], expected, rtol=1e-10)
+
+
+def test_parameters_invert_times():
+    analysis, stack = prepared(False, 2)
+    generator = np.random.default_rng(2)
+    z = generator.normal(size=(4, stack.variable_index.size))
+    time, x = stack.times(z)
+    assert np.allclose(stack.parameters(time), z)
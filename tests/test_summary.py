@@ -0,0 +1,65 @@
+import contextlib
+import io
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from pyr8s import parse
+from pyr8s.summary import AgeSummary, CladeAges
+
+here = Path(__file__).parent
+
+
+def test_chronogram_leaves_target_untouched():
+    with open(here / 'legacy_pickled.r8s', 'rb') as file:
+        results = pickle.load(file).results
+    summary = AgeSummary(seed=1)
+    summary.add(results)
+    summary.add(results)
+    before = results.chronogram.as_string(schema='newick')
+    chronogram = summary.chronogram()
+    assert results.chronogram.as_string(schema='newick') == before
+    assert chronogram is not results.chronogram
+    ages = [node.annotations.get_value('age_mean')
+        for node in chronogram.preorder_node_iter()]
+    assert ages[0] == results.table['Age'][0]
+    lengths = [node.edge_length for node in chronogram.preorder_node_iter()]
+    original = [node.edge_length
+        for node in results.chronogram.preorder_node_iter()]
+    assert lengths[1:] == original[1:]
+
+
+def reference_table(results, level=0.95):
+    """Summary built by walking the result trees, as done originally"""
+    summary = AgeSummary(seed=1, level=level)
+    for result in results:
+        for node, mask in summary._masks(result.tree):
+            clade = summary._clades.get(mask)
+            if clade is None:
+                clade = CladeAges(node.label, summary.capacity,
+                    summary._generator)
+                summary._clades[mask] = clade
+            clade.add(node.age)
+        summary.trees += 1
+    return summary.table()
+
+
+def test_add_folds_table_columns():
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in ['legacy_1', 'legacy_2', 'legacy_3']:
+            results.append(parse.from_file(str(here / name)).run())
+    summary = AgeSummary(seed=1)
+    for result in results:
+        summary.add(result)
+        assert 'tree' not in result and 'chronogram' not in result
+    table = summary.table()
+    expected = reference_table(results)
+    assert table['Node'] == expected['Node']
+    for key in ['Frequency', 'Mean', 'Deviation', 'Low', 'High']:
+        assert np.allclose(table[key], expected[key])
+    chronogram = summary.chronogram()
+    assert 'chronogram' in results[0]
+    assert 'chronogram' not in results[1]
+    assert len(chronogram.nodes()) == table['n']
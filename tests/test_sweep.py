@@ -0,0 +1,46 @@
+import dendropy
+import numpy as np
+
+from pyr8s import parse
+
+
+def calibrated_analysis():
+    tree = dendropy.Tree.get(
+        data='((a:1,b:2):1,((c:1,d:1):2,e:3):1);', schema='newick')
+    analysis = parse.from_tree(tree)
+    analysis.param.branch_length.format = 'total'
+    analysis.param.general.seed = 1
+    analysis.param.general.scalar = False
+    analysis.tree.seed_node.min = 10
+    analysis.tree.seed_node.max = 20
+    return analysis
+
+
+def test_sweep_table_order():
+    analysis = calibrated_analysis()
+    grid = {
+        'branch_length.round': [True, False],
+        'method.exponent': [2, 3, 4],
+        }
+    table = analysis.sweep(grid, workers=1)
+    nodes = len(analysis.run().table['Node'])
+    assert table['configurations'] == 6
+    assert table['n'] == 6 * nodes
+    for key in ['branch_length.round', 'method.exponent',
+            'Node', 'Age', 'Objective', 'Failure']:
+        assert len(table[key]) == table['n']
+    # Last parameter varies fastest, nodes within each configuration
+    rows = list(zip(table['branch_length.round'], table['method.exponent']))
+    expected = [(r, e) for r in [True, False] for e in [2, 3, 4]]
+    assert rows[::nodes] == expected
+    assert all(rows[k] == rows[k - k % nodes] for k in range(len(rows)))
+    assert table['Node'] == table['Node'][:nodes] * 6
+    assert table['Failure'] == [None] * table['n']
+    # Each configuration matches a separate analysis
+    for configuration, (round, exponent) in enumerate(expected):
+        other = calibrated_analysis()
+        other.param.branch_length.round = round
+        other.param.method.exponent = exponent
+        ages = other.run().table['Age']
+        rows = slice(configuration * nodes, (configuration + 1) * nodes)
+        assert np.allclose(table['Age'][rows], ages, rtol=0.05)
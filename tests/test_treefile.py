@@ -0,0 +1,111 @@
+import gzip
+import shutil
+from pathlib import Path
+
+import dendropy
+import pytest
+
+from pyr8s import treefile
+
+here = Path(__file__).parent
+
+samples = [
+    ('legacy_1', 'nexus'),
+    ('legacy_sp', 'nexus'),
+    ('blommersia.nex', 'nexus'),
+    ('lacertidae.nex', 'nexus'),
+    ('large', 'nexus'),
+    ('lygomada.tre', 'newick'),
+    ]
+
+translated = """#NEXUS
+[comment (with; punctuation)]
+BEGIN TAXA;
+    DIMENSIONS NTAX=4;
+    TAXLABELS 'a b' c_d 'it''s' 'x,y';
+END;
+BEGIN TREES;
+    TRANSLATE
+        1 'a b',
+        2 c_d,
+        3 'it''s',
+        4 'x,y' [last];
+    TREE first = [&R] ((1:1.5,2:2e-1)'in ner':3,(3:1,4:0.25):1);
+    TREE second = (1,(2,(3,4)x_y:1e1):2)root;
+END;
+"""
+
+
+def expected(tree):
+    """Parent positions, lengths and labels of a dendropy tree in preorder"""
+    nodes = list(tree.preorder_node_iter())
+    position = {node: k for k, node in enumerate(nodes)}
+    parent = [position.get(node.parent_node, -1) for node in nodes]
+    length = [node.edge_length for node in nodes]
+    label = [node.taxon.label if node.taxon is not None else node.label
+        for node in nodes]
+    return parent, length, label
+
+
+def actual(tree):
+    length = [None if value != value else value for value in tree.length]
+    return list(tree.parent), length, list(tree.label)
+
+
+def assert_same(trees, path, schema):
+    reference = dendropy.TreeList.get(path=str(path), schema=schema,
+        preserve_underscores=False)
+    assert len(trees) == len(reference)
+    for tree, other in zip(trees, reference):
+        assert actual(tree) == expected(other)
+
+
+@pytest.mark.parametrize('name,schema', samples)
+def test_samples_match_dendropy(name, schema):
+    trees = list(treefile.read(str(here / name)))
+    assert_same(trees, here / name, schema)
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+def test_translate_and_quoting(tmp_path, mmap):
+    path = tmp_path / 'translated.nex'
+    path.write_text(translated)
+    trees = list(treefile.read(str(path), mmap=mmap))
+    assert [tree.name for tree in trees] == ['first', 'second']
+    assert_same(trees, path, 'nexus')
+    for label in ['a b', 'c d', "it's", 'x,y', 'in ner']:
+        assert label in trees[0].label
+
+
+def test_gzip_input(tmp_path):
+    path = tmp_path / 'legacy_1.gz'
+    with open(here / 'legacy_1', 'rb') as input, gzip.open(path, 'wb') as output:
+        shutil.copyfileobj(input, output)
+    trees = list(treefile.read(str(path)))
+    assert_same(trees, here / 'legacy_1', 'nexus')
+
+
+def test_read_file_blocks_and_number(tmp_path):
+    path = tmp_path / 'translated.nex'
+    path.write_text(translated)
+    contents = treefile.read_file(str(path), number=1)
+    assert contents.nexus
+    assert [tree.name for tree in contents.trees] == ['second']
+    assert contents.blocks == []
+    contents = treefile.read_file(str(here / 'legacy_1'))
+    assert [block.name for block in contents.blocks] == ['RATES']
+
+
+def test_seek_with_index(tmp_path):
+    path = tmp_path / 'translated.nex'
+    path.write_text(translated)
+    whole = list(treefile.read(str(path)))
+    assert treefile.count(str(path)) == 2
+    assert actual(treefile.read_tree(str(path), 1)) == actual(whole[1])
+
+
+def test_newick_round_trip():
+    tree = next(treefile.read(str(here / 'legacy_1')))
+    text = treefile.newick(tree.parent, tree.length, tree.label)
+    other = dendropy.Tree.get(data=text, schema='newick')
+    assert actual(tree) == expected(other)
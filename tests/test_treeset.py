@@ -0,0 +1,62 @@
+import os
+import shutil
+from pathlib import Path
+
+from pyr8s import parse, treefile
+
+here = Path(__file__).parent
+
+
+def test_from_file_leaves_no_set(tmp_path):
+    file = tmp_path / 'legacy_1'
+    shutil.copy(here / 'legacy_1', file)
+    parse.from_file(str(file))
+    assert os.listdir(tmp_path) == ['legacy_1']
+
+
+def test_load_restamps_touched_file(tmp_path, monkeypatch):
+    file = str(tmp_path / 'legacy_1')
+    shutil.copy(here / 'legacy_1', file)
+    trees = treefile.load(file)
+    stat = os.stat(file)
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert len(treefile.load(file)) == len(trees)
+    # Once stamped again, the file is not hashed any more
+    def digest(file):
+        raise AssertionError('Hashed again')
+    monkeypatch.setattr(treefile, '_digest', digest)
+    reloaded = treefile.load(file)
+    assert reloaded[0].name == trees[0].name
+    assert list(reloaded[0].parent) == list(trees[0].parent)
+
+
+def test_read_rates_blocks():
+    texts = parse.read_rates_blocks(str(here / 'legacy_1'))
+    assert len(texts) == 1
+    program = parse.compile_rates_text(texts[0])
+    names = [name for name, options in program.commands]
+    assert 'DIVTIME' in names
+
+
+def test_command_line_cache_is_opt_in(tmp_path, monkeypatch, capsys):
+    from pyr8s import run
+    file = tmp_path / 'legacy_1'
+    shutil.copy(here / 'legacy_1', file)
+    monkeypatch.setattr('sys.argv', ['pyr8s', str(file)])
+    run.main()
+    assert os.listdir(tmp_path) == ['legacy_1']
+    monkeypatch.setattr('sys.argv', ['pyr8s', '--cache', str(file)])
+    run.main()
+    assert sorted(os.listdir(tmp_path)) == ['legacy_1', 'legacy_1.trees.npz']
+    assert 'Usage' not in capsys.readouterr().out
+
+
+def test_unwritable_set_is_skipped(tmp_path, monkeypatch):
+    file = tmp_path / 'legacy_1'
+    shutil.copy(here / 'legacy_1', file)
+    def mkstemp(*args, **kwargs):
+        raise PermissionError('Read-only directory')
+    monkeypatch.setattr(treefile.tempfile, 'mkstemp', mkstemp)
+    analysis = parse.from_file(str(file), cache=True)
+    assert analysis.tree is not None
+    assert os.listdir(tmp_path) == ['legacy_1']